@@ -0,0 +1,212 @@
+import os
+import sys
+import gzip
+import json
+import hashlib
+import uuid
+import argparse
+from datetime import datetime
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+## 对话记录（追加写入的 JSONL）
+## 每条消息只写入一次（按内容哈希去重），每轮对话只记录上一轮的编号和本轮新增的消息，
+## 日志大小和写入时间与文本长度成线性关系；每轮完成后立即写入，中途出错也能保留已完成的对话。
+## 记录格式（每行一个 JSON）:
+## {"type": "header", "timestamp": ..., "file": ..., "model": ...}
+## {"type": "message", "id": 消息哈希, "role": ..., "content": ...}
+## {"type": "turn", "id": 轮次编号, "task": ..., "part": 段号(合并为 null), "parent": 上一轮编号,
+##  "messages": [本轮新增的消息哈希], "response": 回答哈希, "input_tokens": ..., "output_tokens": ..., "cached": ...}
+## 还原为原来的文本格式:
+## python conversationLog.py conversations/conversation_20250101_120000_<run_id>.jsonl.gz -o conversation.txt
+
+COMPRESSION_SUFFIX = {None: "", "gzip": ".gz", "zstd": ".zst"}
+
+# 进程崩溃时压缩流没有写入结尾（gzip 读到末尾抛出 EOFError，zstd 抛出 ZstdError）
+TRUNCATED_ERRORS = (EOFError, UnicodeDecodeError) + ((zstandard.ZstdError,) if zstandard is not None else ())
+
+# 文本视图中各任务的标题
+TASK_TITLES = {
+    "mindmap": ("思维导图生成", "第 {part} 段文本处理", "合并处理"),
+    "analysis": ("文本分析生成", "第 {part} 段文本分析", "合并分析"),
+}
+
+def _open_file(path, mode):
+    """按扩展名打开（可能压缩的）文本文件"""
+    if path.endswith(".zst"):
+        if zstandard is None:
+            raise ImportError("读写 .zst 日志需要安装 zstandard")
+        return zstandard.open(path, mode, encoding="utf-8")
+    if path.endswith(".gz"):
+        return gzip.open(path, mode, encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+def _write(log, record):
+    log["file"].write(json.dumps(record, ensure_ascii=False) + "\n")
+
+def _write_message(log, message):
+    """写入一条消息（已写入过的只返回哈希）"""
+    message_id = hashlib.sha1(f"{message['role']}\0{message['content']}".encode("utf-8")).hexdigest()[:16]
+    if message_id not in log["seen"]:
+        log["seen"].add(message_id)
+        _write(log, {"type": "message", "id": message_id, "role": message["role"], "content": message["content"]})
+    return message_id
+
+def open_conversation_log(source_file, model_name, output_dir="conversations", compression=None, run_id=None):
+    """
+    创建对话日志，返回日志对象
+
+    参数:
+        compression (str): None、"gzip" 或 "zstd"（未安装 zstandard 时改用 gzip）
+        run_id (str): 本次运行的标识，写入文件名，同一秒开始的并发任务不会互相覆盖；不提供时随机生成
+    """
+    if compression == "zstd" and zstandard is None:
+        print("未安装 zstandard，对话记录改用 gzip 压缩")
+        compression = "gzip"
+    os.makedirs(output_dir, exist_ok=True)
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    run_id = run_id or uuid.uuid4().hex[:12]
+    path = os.path.join(output_dir, f"conversation_{timestamp}_{run_id}.jsonl{COMPRESSION_SUFFIX[compression]}")
+    log = {"path": path, "file": _open_file(path, "wt"), "seen": set(), "tails": {}, "turns": 0}
+    _write(log, {
+        "type": "header",
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "file": os.path.basename(source_file),
+        "model": model_name
+    })
+    log["file"].flush()
+    return log
+
+def log_turn(log, task, part, messages, response, input_tokens, output_tokens, cached=False):
+    """
+    追加一轮对话
+
+    messages 为本轮发送的完整对话历史，只写入上一轮之后新增的消息；part 为 None 表示合并请求
+    """
+    if log is None:
+        return
+    parent, known = log["tails"].get(task, (None, 0))
+    message_ids = [_write_message(log, message) for message in messages[known:]]
+    response_id = _write_message(log, {"role": "assistant", "content": response})
+
+    log["turns"] += 1
+    _write(log, {
+        "type": "turn",
+        "id": log["turns"],
+        "task": task,
+        "part": part,
+        "parent": parent,
+        "messages": message_ids,
+        "response": response_id,
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "cached": cached
+    })
+    log["tails"][task] = (log["turns"], len(messages))
+    log["file"].flush()
+
+def close_conversation_log(log):
+    """关闭对话日志，返回日志路径"""
+    if log is None:
+        return None
+    log["file"].close()
+    print(f"对话记录已保存到: {log['path']}")
+    return log["path"]
+
+def _read_records(path):
+    """逐条读取日志记录；进程崩溃留下的日志缺少压缩流结尾或最后一行只写了一半时，读取到截断处为止"""
+    with _open_file(path, "rt") as f:
+        try:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    print(f"对话日志最后一行不完整，已忽略: {path}")
+                    return
+                yield record
+        except TRUNCATED_ERRORS:
+            print(f"对话日志没有正常结束（进程可能中途退出），只读取到截断处: {path}")
+
+def read_conversation_log(path):
+    """
+    读取对话日志并还原每轮的完整对话历史，未正常关闭的日志返回截断前已写入的轮次
+
+    返回与原对话记录相同的结构: {"timestamp", "file", "model", "<task>_conversations": [...]}
+    """
+    conversations = {}
+    messages = {}
+    histories = {}
+    for record in _read_records(path):
+        if record["type"] == "header":
+            conversations.update(timestamp=record["timestamp"], file=record["file"], model=record["model"])
+        elif record["type"] == "message":
+            messages[record["id"]] = {"role": record["role"], "content": record["content"]}
+        elif record["type"] == "turn":
+            task = record["task"]
+            history = histories.get(record["parent"], []) + [messages[m] for m in record["messages"]]
+            histories[record["id"]] = history
+            conversation = {
+                "type": task if record["part"] is not None else f"{task}_merge",
+                "messages": history,
+                "response": messages[record["response"]]["content"],
+                "input_tokens": record["input_tokens"],
+                "output_tokens": record["output_tokens"]
+            }
+            if record["part"] is not None:
+                conversation["part"] = record["part"]
+            conversations.setdefault(f"{task}_conversations", []).append(conversation)
+    return conversations
+
+def write_conversation_text(conversations, f):
+    """按原对话记录的文本格式输出"""
+    f.write("=== 对话记录 ===\n\n")
+    f.write(f"时间: {conversations.get('timestamp', '')}\n")
+    f.write(f"文件: {conversations.get('file', '')}\n")
+    f.write(f"模型: {conversations.get('model', '')}\n\n")
+
+    for task, (title, part_title, merge_title) in TASK_TITLES.items():
+        f.write(f"=== {title} ===\n\n")
+        for conv in conversations.get(f"{task}_conversations", []):
+            if conv["type"] == task:
+                f.write(f"--- {part_title.format(part=conv['part'])} ---\n")
+            else:
+                f.write(f"--- {merge_title} ---\n")
+
+            f.write("\n系统提示:\n")
+            f.write(conv["messages"][0]["content"] + "\n")
+
+            f.write("\n用户输入:\n")
+            f.write(conv["messages"][-1]["content"] + "\n")
+
+            f.write("\n模型回答:\n")
+            f.write(conv["response"] + "\n")
+
+            f.write(f"\nToken统计:\n")
+            f.write(f"- 输入: {conv['input_tokens']} tokens\n")
+            f.write(f"- 输出: {conv['output_tokens']} tokens\n")
+            f.write("\n" + "="*50 + "\n\n")
+
+def main(argv=None):
+    """命令行入口：将对话日志还原为文本格式"""
+    parser = argparse.ArgumentParser(description="查看对话记录")
+    parser.add_argument("path", help="对话日志路径 (.jsonl/.jsonl.gz/.jsonl.zst)")
+    parser.add_argument("-o", "--output", help="输出文本文件路径，默认打印到终端")
+    args = parser.parse_args(argv)
+
+    conversations = read_conversation_log(args.path)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            write_conversation_text(conversations, f)
+        print(f"已还原到: {args.output}")
+    else:
+        write_conversation_text(conversations, sys.stdout)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,85 +1,437 @@
-import subprocess
-import os
-
-
-## 提取音频
-## 输入: 视频文件路径
-## 输出: 音频文件路径   
-## 用法:
-## result = extract_audio(r"F:\Whisper\video\testVideo_59s.mp4", r"F:\Whisper\audio\output_audio.mp3")
-## 如果成功, result 为音频文件路径, 否则为 None
-def extract_audio(input_path: str, output_path: str = None) -> str:
-    """
-    使用 FFmpeg 从视频文件中提取 MP3 格式的音频
-    
-    参数:
-        input_path (str): 输入视频文件的路径
-        output_path (str, 可选): 输出音频文件的路径，默认与输入文件同目录
-    
-    返回:
-        str: 成功时返回输出文件路径，失败时返回 None
-    
-    异常:
-        会触发常规异常并打印错误信息
-    """
-    try:
-        # 检查 FFmpeg 是否可用
-        subprocess.run(
-            ["ffmpeg", "-version"],
-            check=True,
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL
-        )
-    except (FileNotFoundError, subprocess.CalledProcessError):
-        raise RuntimeError("未找到 FFmpeg 或版本不兼容，请先安装 FFmpeg 并添加到系统路径")
-
-    # 验证输入文件是否存在
-    if not os.path.isfile(input_path):
-        raise FileNotFoundError(f"输入文件不存在: {input_path}")
-
-    # 设置默认输出路径
-    if output_path is None:
-        base_name = os.path.splitext(input_path)[0]
-        output_path = f"{base_name}.mp3"
-    else:
-        # 确保输出目录存在
-        output_dir = os.path.dirname(output_path)
-        if output_dir:
-            os.makedirs(output_dir, exist_ok=True)
-
-    # 构建 FFmpeg 命令
-    command = [
-        "ffmpeg",
-        "-y",  # 覆盖输出文件不提示
-        "-i", input_path,
-        "-vn",  # 不处理视频流
-        "-codec:a", "libmp3lame",  # 使用 LAME MP3 编码器
-        "-q:a", "0",  # 最高音频质量 (VBR 0-9, 0=best)
-        "-map_metadata", "0",  # 保留元数据
-        output_path
-    ]
-
-    try:
-        # 执行转换命令
-        subprocess.run(
-            command,
-            check=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
-        )
-        print(f"音频提取成功: {output_path}")
-        return output_path
-    except subprocess.CalledProcessError as e:
-        error_msg = f"FFmpeg 错误 ({e.returncode}):\n{e.stderr}"
-    except Exception as e:
-        error_msg = f"意外错误: {str(e)}"
-
-    print(f"提取失败: {error_msg}")
-    return None
-
-# # 使用示例
-# if __name__ == "__main__":
-#     result = extract_audio(r"F:\Whisper\video\testVideo_59s.mp4", r"F:\Whisper\audio\output_audio.mp3")
-#     if result:
+import subprocess
+import os
+import time
+import asyncio
+import tempfile
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+from multiprocessing import shared_memory
+import numpy as np
+
+# 可直接复制（不重新编码）的音频编码及对应的输出扩展名
+# 下游 Whisper / librosa 通过 FFmpeg 解码，这些格式都可直接读取
+COPY_CODECS = {
+    "mp3": ".mp3",
+    "aac": ".m4a",
+    "flac": ".flac",
+}
+
+@lru_cache(maxsize=None)
+def check_ffmpeg(tool="ffmpeg"):
+    """检查 FFmpeg 工具是否可用，结果在进程内缓存"""
+    try:
+        subprocess.run(
+            [tool, "-version"],
+            check=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL
+        )
+        return True
+    except (FileNotFoundError, subprocess.CalledProcessError):
+        return False
+
+def _probe_command(input_path):
+    """构建获取第一条音频流编码名称的 ffprobe 命令"""
+    return [
+        "ffprobe",
+        "-v", "error",
+        "-select_streams", "a:0",
+        "-show_entries", "stream=codec_name",
+        "-of", "default=noprint_wrappers=1:nokey=1",
+        input_path
+    ]
+
+def probe_audio_codec(input_path):
+    """使用 ffprobe 获取第一条音频流的编码名称，失败时返回 None"""
+    if not check_ffmpeg("ffprobe"):
+        return None
+    try:
+        result = subprocess.run(
+            _probe_command(input_path),
+            check=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True
+        )
+        return result.stdout.strip() or None
+    except subprocess.CalledProcessError:
+        return None
+
+
+## 提取音频
+## 输入: 视频文件路径
+## 输出: 音频文件路径（流复制时扩展名随源编码变化，如 .m4a/.flac）
+## 用法:
+## result = extract_audio(r"F:\Whisper\video\testVideo_59s.mp4", r"F:\Whisper\audio\output_audio.mp3")
+## 如果成功, result 为音频文件路径, 否则为 None
+def extract_audio(input_path: str, output_path: str = None, allow_copy: bool = True, threads: int = 0) -> str:
+    """
+    使用 FFmpeg 从视频文件中提取第一条音频流
+
+    源编码为 mp3/aac/flac 时直接复制音频流（输出 .mp3/.m4a/.flac），否则重新编码为 MP3
+    
+    参数:
+        input_path (str): 输入视频文件的路径
+        output_path (str, 可选): 输出音频文件的路径，默认与输入文件同目录
+        allow_copy (bool, 可选): 源音频编码可直接使用时复制音频流而不重新编码，
+            此时输出扩展名会随编码调整（如 aac -> .m4a）
+        threads (int, 可选): FFmpeg 线程数，0 表示自动
+    
+    返回:
+        str: 成功时返回实际的输出文件路径（扩展名可能与 output_path 不同），失败时返回 None
+    
+    异常:
+        会触发常规异常并打印错误信息
+    """
+    output_path = _prepare_extract(input_path, output_path)
+
+    # 源音频编码可直接使用时走流复制快速路径
+    codec = probe_audio_codec(input_path) if allow_copy else None
+    command, output_path = build_extract_command(input_path, output_path, codec, threads)
+
+    try:
+        start_time = time.time()
+        # 执行转换命令
+        subprocess.run(
+            command,
+            check=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True
+        )
+        mode = "流复制" if codec in COPY_CODECS else "重新编码"
+        print(f"音频提取成功 ({mode}, 耗时 {time.time() - start_time:.2f} 秒): {output_path}")
+        return output_path
+    except subprocess.CalledProcessError as e:
+        error_msg = f"FFmpeg 错误 ({e.returncode}):\n{e.stderr}"
+    except Exception as e:
+        error_msg = f"意外错误: {str(e)}"
+
+    print(f"提取失败: {error_msg}")
+    return None
+
+def _prepare_extract(input_path, output_path):
+    """检查 FFmpeg 和输入文件，返回（默认或已确保目录存在的）输出路径"""
+    # 检查 FFmpeg 是否可用
+    if not check_ffmpeg():
+        raise RuntimeError("未找到 FFmpeg 或版本不兼容，请先安装 FFmpeg 并添加到系统路径")
+
+    # 验证输入文件是否存在
+    if not os.path.isfile(input_path):
+        raise FileNotFoundError(f"输入文件不存在: {input_path}")
+
+    # 设置默认输出路径
+    if output_path is None:
+        base_name = os.path.splitext(input_path)[0]
+        output_path = f"{base_name}.mp3"
+    else:
+        # 确保输出目录存在
+        output_dir = os.path.dirname(output_path)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+    return output_path
+
+def build_extract_command(input_path, output_path, codec=None, threads=0):
+    """构建音频提取命令，codec 可直接复制时走流复制；返回 (命令, 实际输出路径)"""
+    if codec in COPY_CODECS:
+        output_path = os.path.splitext(output_path)[0] + COPY_CODECS[codec]
+        codec_args = ["-codec:a", "copy"]
+    else:
+        codec_args = [
+            "-codec:a", "libmp3lame",  # 使用 LAME MP3 编码器
+            "-q:a", "0",  # 最高音频质量 (VBR 0-9, 0=best)
+        ]
+
+    # 构建 FFmpeg 命令
+    command = [
+        "ffmpeg",
+        "-y",  # 覆盖输出文件不提示
+        "-threads", str(threads),
+        "-i", input_path,
+        "-map", "0:a:0",  # 只输出第一条音频流（其他流不会被解码）
+        *codec_args,
+        "-map_metadata", "0",  # 保留元数据
+        output_path
+    ]
+    return command, output_path
+
+async def probe_audio_codec_async(input_path):
+    """probe_audio_codec 的异步版本"""
+    if not check_ffmpeg("ffprobe"):
+        return None
+    process = await asyncio.create_subprocess_exec(
+        *_probe_command(input_path),
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.DEVNULL
+    )
+    stdout, _ = await process.communicate()
+    if process.returncode != 0:
+        return None
+    return stdout.decode().strip() or None
+
+async def extract_audio_async(input_path: str, output_path: str = None, allow_copy: bool = True, threads: int = 0) -> str:
+    """
+    extract_audio 的异步版本：通过 asyncio 子进程运行 FFmpeg，不阻塞事件循环
+
+    任务被取消时会终止 FFmpeg 进程并继续抛出 CancelledError
+    """
+    output_path = _prepare_extract(input_path, output_path)
+    codec = await probe_audio_codec_async(input_path) if allow_copy else None
+    command, output_path = build_extract_command(input_path, output_path, codec, threads)
+
+    start_time = time.time()
+    process = await asyncio.create_subprocess_exec(
+        *command,
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE
+    )
+    try:
+        _, stderr = await process.communicate()
+    except asyncio.CancelledError:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+        raise
+
+    if process.returncode != 0:
+        print(f"提取失败: FFmpeg 错误 ({process.returncode}):\n{stderr.decode(errors='ignore')}")
+        return None
+    mode = "流复制" if codec in COPY_CODECS else "重新编码"
+    print(f"音频提取成功 ({mode}, 耗时 {time.time() - start_time:.2f} 秒): {output_path}")
+    return output_path
+
+# 共享内存解码时每次从 FFmpeg 管道读取的字节数
+PCM_READ_BLOCK = 1 << 20
+
+# 本进程已打开的共享内存句柄（按名称缓存，每个进程只打开一次）
+# 句柄在 release_pcm 时才关闭，mapped_pcm 交给调用方的数组视图在此之前始终有效
+_shm_handles = {}
+_shm_lock = threading.Lock()
+
+def probe_duration(input_path):
+    """使用 ffprobe 获取媒体时长（秒），失败时返回 None"""
+    if not check_ffmpeg("ffprobe"):
+        return None
+    try:
+        result = subprocess.run(
+            ["ffprobe", "-v", "error", "-show_entries", "format=duration",
+             "-of", "default=noprint_wrappers=1:nokey=1", input_path],
+            check=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True
+        )
+        return float(result.stdout.strip())
+    except (subprocess.CalledProcessError, ValueError):
+        return None
+
+def _attach_shm(name):
+    """获取本进程内该共享内存的句柄（首次使用时打开）"""
+    with _shm_lock:
+        shm = _shm_handles.get(name)
+        if shm is None:
+            shm = _shm_handles[name] = shared_memory.SharedMemory(name=name)
+        return shm
+
+def _grow_shm(shm, used):
+    """预估的大小不够时换用更大的共享内存块（仅在时长未知或不准确时发生）"""
+    bigger = shared_memory.SharedMemory(create=True, size=shm.size * 3 // 2 + PCM_READ_BLOCK)
+    bigger.buf[:used] = shm.buf[:used]
+    shm.close()
+    shm.unlink()
+    return bigger
+
+def _decode_to_shm(command, expected_bytes):
+    """
+    将 FFmpeg 的 PCM 输出逐块直接读入共享内存，返回 (共享内存, 有效字节数)
+
+    共享内存按预估时长一次分配，峰值内存只有共享内存块本身，不再先缓冲整段输出再复制
+    """
+    shm = shared_memory.SharedMemory(create=True, size=max(expected_bytes, PCM_READ_BLOCK))
+    used = 0
+    with tempfile.TemporaryFile() as stderr:
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=stderr)
+        try:
+            while True:
+                if used == shm.size:
+                    shm = _grow_shm(shm, used)
+                with shm.buf[used:min(used + PCM_READ_BLOCK, shm.size)] as view:
+                    count = process.stdout.readinto(view)
+                if not count:
+                    break
+                used += count
+            if process.wait() != 0:
+                stderr.seek(0)
+                raise RuntimeError(f"FFmpeg 错误 ({process.returncode}):\n{stderr.read().decode(errors='ignore')}")
+        except BaseException:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            shm.close()
+            shm.unlink()
+            raise
+        finally:
+            process.stdout.close()
+    return shm, used
+
+## 解码为 PCM 并通过内存映射 / 共享内存交给转录进程
+## 输入: 视频或音频文件路径
+## 输出: PCM 描述符 (dict)，可在进程间传递
+## 用法:
+## desc = extract_pcm(r"F:\Whisper\video\testVideo_59s.mp4", shared=True)
+## with mapped_pcm(desc) as audio: ...
+## release_pcm(desc)
+def extract_pcm(input_path: str, output_path: str = None, sample_rate: int = 16000, shared: bool = False, threads: int = 0) -> dict:
+    """
+    使用 FFmpeg 将第一条音频流解码为 float32 单声道 PCM
+
+    参数:
+        input_path (str): 输入文件路径
+        output_path (str, 可选): 内存映射文件路径，默认与输入文件同目录 (.f32)
+        sample_rate (int, 可选): 目标采样率，默认 16000（Whisper 所需）
+        shared (bool, 可选): 为 True 时写入 multiprocessing 共享内存而非磁盘文件
+            （按 ffprobe 探测的时长分配，FFmpeg 输出逐块直接写入，不做整段缓冲）
+        threads (int, 可选): FFmpeg 线程数，0 表示自动
+
+    返回:
+        dict: PCM 描述符，包含 kind/name 或 path/samples/sample_rate/dtype，
+            使用完毕后需调用 release_pcm 释放
+    """
+    if not check_ffmpeg():
+        raise RuntimeError("未找到 FFmpeg 或版本不兼容，请先安装 FFmpeg 并添加到系统路径")
+    if not os.path.isfile(input_path):
+        raise FileNotFoundError(f"输入文件不存在: {input_path}")
+
+    if not shared:
+        if output_path is None:
+            output_path = f"{os.path.splitext(input_path)[0]}.f32"
+        output_dir = os.path.dirname(output_path)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+
+    command = [
+        "ffmpeg",
+        "-y",
+        "-threads", str(threads),
+        "-i", input_path,
+        "-map", "0:a:0",
+        "-ac", "1",  # 单声道
+        "-ar", str(sample_rate),
+        "-f", "f32le",  # 原始 float32 小端 PCM
+        "-" if shared else output_path
+    ]
+
+    descriptor = {"sample_rate": sample_rate, "dtype": "float32"}
+    if shared:
+        duration = probe_duration(input_path)
+        # 多留 1 秒余量，探测的时长与实际解码长度可能略有差异
+        expected_bytes = int(((duration or 60) + 1) * sample_rate) * 4
+        shm, used = _decode_to_shm(command, expected_bytes)
+        with _shm_lock:
+            _shm_handles[shm.name] = shm  # 生产进程保留句柄，后续 mapped_pcm 直接复用
+        descriptor.update(kind="shm", name=shm.name, samples=used // 4)
+    else:
+        result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        if result.returncode != 0:
+            raise RuntimeError(f"FFmpeg 错误 ({result.returncode}):\n{result.stderr.decode(errors='ignore')}")
+        descriptor.update(kind="memmap", path=output_path, samples=os.path.getsize(output_path) // 4)
+
+    print(f"PCM 解码完成: {descriptor['samples'] / sample_rate:.2f} 秒 ({descriptor['kind']})")
+    return descriptor
+
+@contextmanager
+def mapped_pcm(descriptor: dict):
+    """
+    按描述符零拷贝映射 PCM 数据，返回只读 numpy 数组
+
+    共享内存句柄按进程缓存、在 release_pcm 时关闭，因此退出 with 块后仍残留的视图引用不会导致 BufferError
+    """
+    if descriptor["kind"] == "shm":
+        shm = _attach_shm(descriptor["name"])
+        audio = np.ndarray((descriptor["samples"],), dtype=descriptor["dtype"], buffer=shm.buf)
+        audio.flags.writeable = False
+    else:
+        audio = np.memmap(descriptor["path"], dtype=descriptor["dtype"], mode="r", shape=(descriptor["samples"],))
+    yield audio
+
+def release_pcm(descriptor: dict):
+    """释放 PCM 描述符对应的共享内存或映射文件"""
+    try:
+        if descriptor["kind"] == "shm":
+            with _shm_lock:
+                shm = _shm_handles.pop(descriptor["name"], None)
+            if shm is None:
+                shm = shared_memory.SharedMemory(name=descriptor["name"])
+            shm.unlink()
+            try:
+                shm.close()
+            except BufferError:
+                # 仍有数组视图未释放：保留句柄，避免被回收时再次关闭报错，映射随进程退出释放
+                with _shm_lock:
+                    _shm_handles[descriptor["name"]] = shm
+        elif os.path.exists(descriptor["path"]):
+            os.remove(descriptor["path"])
+    except FileNotFoundError:
+        pass
+
+def iter_audio_blocks(input_path: str, sample_rate: int = 16000, block_s: float = 10, threads: int = 0):
+    """
+    通过 FFmpeg 管道流式解码第一条音频流，逐块产出 float32 单声道数组
+
+    内存占用只与 block_s 有关，与音频总时长无关；生成器关闭时会终止 FFmpeg 进程
+    """
+    if not check_ffmpeg():
+        raise RuntimeError("未找到 FFmpeg 或版本不兼容，请先安装 FFmpeg 并添加到系统路径")
+    if not os.path.isfile(input_path):
+        raise FileNotFoundError(f"输入文件不存在: {input_path}")
+
+    command = [
+        "ffmpeg",
+        "-threads", str(threads),
+        "-i", input_path,
+        "-map", "0:a:0",
+        "-ac", "1",
+        "-ar", str(sample_rate),
+        "-f", "f32le",
+        "-"
+    ]
+    block_bytes = int(block_s * sample_rate) * 4
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            data = process.stdout.read(block_bytes)
+            if not data:
+                break
+            data = data[:len(data) - len(data) % 4]  # 丢弃末尾不完整的采样
+            yield np.frombuffer(data, dtype=np.float32)
+        if process.wait() != 0:
+            raise RuntimeError(f"FFmpeg 错误 ({process.returncode})")
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        process.stdout.close()
+
+def benchmark_extract(input_paths, output_dir="audio"):
+    """对比流复制与重新编码两种方式的提取耗时"""
+    results = []
+    print("\n=== 音频提取耗时测试 ===")
+    for input_path in input_paths:
+        base_name = os.path.splitext(os.path.basename(input_path))[0]
+        row = {"file": input_path, "codec": probe_audio_codec(input_path)}
+        for allow_copy in (False, True):
+            output_path = os.path.join(output_dir, f"bench_{base_name}.mp3")
+            start_time = time.time()
+            result = extract_audio(input_path, output_path, allow_copy=allow_copy)
+            row["copy" if allow_copy else "encode"] = time.time() - start_time if result else None
+        results.append(row)
+        print(f"{os.path.basename(input_path)} [{row['codec']}]: "
+              f"重新编码 {row['encode'] or 0:.2f} 秒, 流复制 {row['copy'] or 0:.2f} 秒")
+    return results
+
+# # 使用示例
+# if __name__ == "__main__":
+#     result = extract_audio(r"F:\Whisper\video\testVideo_59s.mp4", r"F:\Whisper\audio\output_audio.mp3")
+#     if result:
 #         print(f"生成文件: {result}")
\ No newline at end of file
@@ -1,591 +1,988 @@
-from openai import OpenAI
-import os
-import json
-import time
-from datetime import datetime
-import tiktoken
-
-def initialize_client(api_key, base_url):
-    """初始化API客户端"""
-    global client
-    try:
-        client = OpenAI(
-            base_url=base_url,
-            api_key=api_key
-        )
-        # 测试API连接
-        response = client.chat.completions.create(
-            model="deepseek-r1-250120",
-            messages=[{"role": "user", "content": "测试连接"}],
-            max_tokens=10
-        )
-        print("API连接测试成功")
-        return client
-    except Exception as e:
-        print(f"API初始化失败: {str(e)}")
-        return None
-
-# 全局客户端变量
-client = None
-
-def count_tokens(text, model="deepseek-r1-250120"):
-    """计算文本的 token 数量"""
-    # 注意：这里可能需要根据实际模型调整
-    encoding = tiktoken.encoding_for_model("gpt-4")  # 使用兼容的编码器
-    return len(encoding.encode(text))
-
-def split_text(text, max_tokens=4000):
-    """将文本分段，确保每段不超过最大 token 限制"""
-    # 按句号分割文本
-    sentences = text.split("。")
-    chunks = []
-    current_chunk = []
-    current_length = 0
-    
-    for sentence in sentences:
-        sentence = sentence.strip() + "。"
-        sentence_tokens = count_tokens(sentence)
-        
-        if current_length + sentence_tokens > max_tokens:
-            # 当前块已满，保存并开始新块
-            chunks.append("".join(current_chunk))
-            current_chunk = [sentence]
-            current_length = sentence_tokens
-        else:
-            # 添加句子到当前块
-            current_chunk.append(sentence)
-            current_length += sentence_tokens
-    
-    # 添加最后一个块
-    if current_chunk:
-        chunks.append("".join(current_chunk))
-    
-    return chunks
-
-def save_statistics(stats, output_dir="stats"):
-    """保存统计信息到TXT文件"""
-    try:
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-        
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"stats_{timestamp}.txt"
-        filepath = os.path.join(output_dir, filename)
-        
-        with open(filepath, "w", encoding="utf-8") as f:
-            f.write("=== 处理统计信息 ===\n\n")
-            f.write(f"处理时间: {stats['timestamp']}\n")
-            f.write("\n=== 文件信息 ===\n")
-            f.write(f"文件名: {stats['file_info']['name']}\n")
-            f.write(f"文件大小: {stats['file_info']['size']} 字符\n")
-            f.write(f"分段数量: {stats['file_info']['chunks']} 段\n")
-            
-            f.write("\n=== 处理时间统计 ===\n")
-            f.write(f"总耗时: {stats['timing']['total']:.2f} 秒\n")
-            f.write(f"读取文件: {stats['timing']['read']:.2f} 秒\n")
-            f.write(f"文本分段: {stats['timing']['split']:.2f} 秒\n")
-            f.write(f"生成思维导图: {stats['timing']['mindmap']:.2f} 秒\n")
-            f.write(f"生成文本分析: {stats['timing']['analysis']:.2f} 秒\n")
-            
-            f.write("\n=== Token统计 ===\n")
-            f.write("思维导图:\n")
-            f.write(f"  - 输入: {stats['tokens']['mindmap']['input']} tokens\n")
-            f.write(f"  - 输出: {stats['tokens']['mindmap']['output']} tokens\n")
-            f.write("文本分析:\n")
-            f.write(f"  - 输入: {stats['tokens']['analysis']['input']} tokens\n")
-            f.write(f"  - 输出: {stats['tokens']['analysis']['output']} tokens\n")
-            f.write("总计:\n")
-            f.write(f"  - 输入: {stats['tokens']['total']['input']} tokens\n")
-            f.write(f"  - 输出: {stats['tokens']['total']['output']} tokens\n")
-        
-        print(f"统计信息已保存到: {filepath}")
-        return filepath
-    except Exception as e:
-        print(f"保存统计信息时出错: {e}")
-        return None
-
-def save_conversation_history(conversations, output_dir="conversations"):
-    """保存对话记录到TXT文件"""
-    try:
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-        
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"conversation_{timestamp}.txt"
-        filepath = os.path.join(output_dir, filename)
-        
-        with open(filepath, "w", encoding="utf-8") as f:
-            f.write("=== 对话记录 ===\n\n")
-            f.write(f"时间: {conversations['timestamp']}\n")
-            f.write(f"文件: {conversations['file']}\n")
-            f.write(f"模型: {conversations['model']}\n\n")
-            
-            # 写入思维导图对话
-            f.write("=== 思维导图生成 ===\n\n")
-            for conv in conversations['mindmap_conversations']:
-                if conv['type'] == 'mindmap':
-                    f.write(f"--- 第 {conv['part']} 段文本处理 ---\n")
-                else:
-                    f.write("--- 合并处理 ---\n")
-                
-                f.write("\n系统提示:\n")
-                f.write(conv['messages'][0]['content'] + "\n")
-                
-                f.write("\n用户输入:\n")
-                f.write(conv['messages'][1]['content'] + "\n")
-                
-                f.write("\n模型回答:\n")
-                f.write(conv['response'] + "\n")
-                
-                f.write(f"\nToken统计:\n")
-                f.write(f"- 输入: {conv['input_tokens']} tokens\n")
-                f.write(f"- 输出: {conv['output_tokens']} tokens\n")
-                f.write("\n" + "="*50 + "\n\n")
-            
-            # 写入文本分析对话
-            f.write("=== 文本分析生成 ===\n\n")
-            for conv in conversations['analysis_conversations']:
-                if conv['type'] == 'analysis':
-                    f.write(f"--- 第 {conv['part']} 段文本分析 ---\n")
-                else:
-                    f.write("--- 合并分析 ---\n")
-                
-                f.write("\n系统提示:\n")
-                f.write(conv['messages'][0]['content'] + "\n")
-                
-                f.write("\n用户输入:\n")
-                f.write(conv['messages'][1]['content'] + "\n")
-                
-                f.write("\n模型回答:\n")
-                f.write(conv['response'] + "\n")
-                
-                f.write(f"\nToken统计:\n")
-                f.write(f"- 输入: {conv['input_tokens']} tokens\n")
-                f.write(f"- 输出: {conv['output_tokens']} tokens\n")
-                f.write("\n" + "="*50 + "\n\n")
-        
-        print(f"对话记录已保存到: {filepath}")
-        return filepath
-    except Exception as e:
-        print(f"保存对话记录时出错: {e}")
-        return None
-
-def create_markdown_mindmap(text_chunks, model_name="deepseek-r1-250120"):
-    """使用火山大模型分段生成思维导图（多轮对话形式）"""
-    try:
-        all_mindmaps = []
-        conversations = []
-        total_input_tokens = 0
-        total_output_tokens = 0
-        
-        # 初始化对话历史
-        messages = [
-            {
-                "role": "system",
-                "content": "你是一个专业的内容分析师，请将给定的文本整理成markdown格式的可预览的思维导图。可以使用mermaid"
-            }
-        ]
-        
-        # 首先处理每个文本块
-        for i, chunk in enumerate(text_chunks, 1):
-            print(f"正在处理第 {i}/{len(text_chunks)} 段文本...")
-            
-            # 添加用户输入到对话历史
-            messages.append({
-                "role": "user",
-                "content": f"请将以下文本整理成思维导图格式（这是文本的第{i}部分，共{len(text_chunks)}部分）：\n\n{chunk}"
-            })
-            
-            # 记录对话
-            current_conversation = {
-                "type": "mindmap",
-                "part": i,
-                "messages": messages.copy()  # 复制当前的对话历史
-            }
-            
-            # 计算输入tokens
-            input_tokens = sum(count_tokens(msg["content"]) for msg in messages)
-            total_input_tokens += input_tokens
-            
-            response = client.chat.completions.create(
-                model=model_name,
-                messages=messages,
-                temperature=0.7,
-                max_tokens=2000,
-                stream=True
-            )
-            
-            content = ""
-            for chunk in response:
-                if chunk.choices[0].delta.content:
-                    content += chunk.choices[0].delta.content
-            
-            # 将助手的回答添加到对话历史
-            messages.append({
-                "role": "assistant",
-                "content": content
-            })
-            
-            # 计算输出tokens
-            output_tokens = count_tokens(content)
-            total_output_tokens += output_tokens
-            
-            all_mindmaps.append(content)
-            
-            # 记录响应
-            current_conversation["response"] = content
-            current_conversation["input_tokens"] = input_tokens
-            current_conversation["output_tokens"] = output_tokens
-            conversations.append(current_conversation)
-            
-            time.sleep(1)  # 避免触发 API 限制
-        
-        # 然后生成一个总结性的思维导图
-        if len(all_mindmaps) > 1:
-            combined_mindmap = "\n\n".join(all_mindmaps)
-            
-            # 添加用户请求合并的消息
-            messages.append({
-                "role": "user",
-                "content": f"请将以上所有思维导图整合成一个完整的、层次清晰的思维导图。保持相同的格式，但要去除重复的内容，使其更加连贯。\n\n{combined_mindmap}"
-            })
-            
-            # 记录合并对话
-            current_conversation = {
-                "type": "mindmap_merge",
-                "messages": messages.copy()
-            }
-            
-            # 计算输入tokens
-            input_tokens = sum(count_tokens(msg["content"]) for msg in messages)
-            total_input_tokens += input_tokens
-            
-            response = client.chat.completions.create(
-                model=model_name,
-                messages=messages,
-                temperature=0.7,
-                max_tokens=2000,
-                stream=True
-            )
-            
-            content = ""
-            for chunk in response:
-                if chunk.choices[0].delta.content:
-                    content += chunk.choices[0].delta.content
-            
-            # 计算输出tokens
-            output_tokens = count_tokens(content)
-            total_output_tokens += output_tokens
-            
-            # 记录响应
-            current_conversation["response"] = content
-            current_conversation["input_tokens"] = input_tokens
-            current_conversation["output_tokens"] = output_tokens
-            conversations.append(current_conversation)
-            
-            final_content = content
-        else:
-            final_content = all_mindmaps[0]
-        
-        return final_content, conversations, total_input_tokens, total_output_tokens
-    except Exception as e:
-        print(f"生成思维导图时出错: {e}")
-        return None, [], 0, 0
-
-def create_text_analysis(text_chunks, model_name="deepseek-r1-250120"):
-    """使用火山大模型分段生成文本分析（多轮对话形式）"""
-    try:
-        all_analyses = []
-        conversations = []
-        total_input_tokens = 0
-        total_output_tokens = 0
-        
-        # 初始化对话历史
-        messages = [
-            {
-                "role": "system",
-                "content": "你是一个专业的内容分析师，请对给定的文本进行深入分析，包括：主要内容、关键观点、逻辑分析和重要信息。"
-            }
-        ]
-        
-        # 分析每个文本块
-        for i, chunk in enumerate(text_chunks, 1):
-            print(f"正在分析第 {i}/{len(text_chunks)} 段文本...")
-            
-            # 添加用户输入到对话历史
-            messages.append({
-                "role": "user",
-                "content": f"请分析以下文本（这是文本的第{i}部分，共{len(text_chunks)}部分）：\n\n{chunk}"
-            })
-            
-            # 记录对话
-            current_conversation = {
-                "type": "analysis",
-                "part": i,
-                "messages": messages.copy()
-            }
-            
-            # 计算输入tokens
-            input_tokens = sum(count_tokens(msg["content"]) for msg in messages)
-            total_input_tokens += input_tokens
-            
-            response = client.chat.completions.create(
-                model=model_name,
-                messages=messages,
-                temperature=0.7,
-                max_tokens=2000,
-                stream=True
-            )
-            
-            content = ""
-            for chunk in response:
-                if chunk.choices[0].delta.content:
-                    content += chunk.choices[0].delta.content
-            
-            # 将助手的回答添加到对话历史
-            messages.append({
-                "role": "assistant",
-                "content": content
-            })
-            
-            # 计算输出tokens
-            output_tokens = count_tokens(content)
-            total_output_tokens += output_tokens
-            
-            all_analyses.append(content)
-            
-            # 记录响应
-            current_conversation["response"] = content
-            current_conversation["input_tokens"] = input_tokens
-            current_conversation["output_tokens"] = output_tokens
-            conversations.append(current_conversation)
-            
-            time.sleep(1)
-        
-        # 生成总体分析
-        if len(all_analyses) > 1:
-            combined_analysis = "\n\n".join(all_analyses)
-            
-            # 添加用户请求合并的消息
-            messages.append({
-                "role": "user",
-                "content": f"请根据以上所有分析结果，生成一个完整的总体分析。需要整合所有重要观点，去除重复内容，使分析更加连贯和全面。\n\n{combined_analysis}"
-            })
-            
-            # 记录合并对话
-            current_conversation = {
-                "type": "analysis_merge",
-                "messages": messages.copy()
-            }
-            
-            # 计算输入tokens
-            input_tokens = sum(count_tokens(msg["content"]) for msg in messages)
-            total_input_tokens += input_tokens
-            
-            response = client.chat.completions.create(
-                model=model_name,
-                messages=messages,
-                temperature=0.7,
-                max_tokens=2000,
-                stream=True
-            )
-            
-            content = ""
-            for chunk in response:
-                if chunk.choices[0].delta.content:
-                    content += chunk.choices[0].delta.content
-            
-            # 计算输出tokens
-            output_tokens = count_tokens(content)
-            total_output_tokens += output_tokens
-            
-            # 记录响应
-            current_conversation["response"] = content
-            current_conversation["input_tokens"] = input_tokens
-            current_conversation["output_tokens"] = output_tokens
-            conversations.append(current_conversation)
-            
-            final_content = content
-        else:
-            final_content = all_analyses[0]
-        
-        return final_content, conversations, total_input_tokens, total_output_tokens
-    except Exception as e:
-        print(f"生成文本分析时出错: {e}")
-        return None, [], 0, 0
-
-def save_to_markdown(mindmap, analysis, text, output_dir="notes"):
-    """保存结果到 Markdown 文件"""
-    try:
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-        
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"note_{timestamp}.md"
-        filepath = os.path.join(output_dir, filename)
-        
-        with open(filepath, "w", encoding="utf-8") as f:
-            f.write("# 内容分析报告\n\n")
-            f.write("## 原文内容\n\n")
-            f.write(f"```\n{text}\n```\n\n")
-            f.write("## 思维导图\n\n")
-            f.write(f"{mindmap}\n\n")
-            f.write("## 内容分析\n\n")
-            f.write(f"{analysis}\n")
-            
-            # 添加元信息
-            f.write("\n---\n")
-            f.write(f"生成时间：{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-            f.write(f"文本长度：{len(text)} 字符\n")
-            f.write(f"Token 数量：{count_tokens(text)} tokens\n")
-            
-            # 添加处理时间信息到文件
-            if 'total_time' in locals():
-                f.write(f"\n## 处理时间统计\n")
-                f.write(f"- 总耗时：{total_time:.2f}秒\n")
-                f.write(f"- 读取文件：{read_time:.2f}秒\n")
-                f.write(f"- 文本分段：{split_time:.2f}秒\n")
-                f.write(f"- 生成思维导图：{mindmap_time:.2f}秒\n")
-                f.write(f"- 生成文本分析：{analysis_time:.2f}秒\n")
-                f.write(f"- 保存文件：{save_time:.2f}秒\n")
-        
-        print(f"笔记已保存到: {filepath}")
-        return filepath
-    except Exception as e:
-        print(f"保存文件时出错: {e}")
-        return None
-
-def process_transcription(text_file, model_name="deepseek-r1-250120"):
-    """处理转录文本文件"""
-    try:
-        total_start_time = time.time()
-        
-        # 读取文本文件
-        read_start_time = time.time()
-        with open(text_file, "r", encoding="utf-8") as f:
-            text = f.read()
-        read_time = time.time() - read_start_time
-        print(f"读取文件耗时: {read_time:.2f}秒")
-        
-        # 分割文本
-        split_start_time = time.time()
-        print("正在分析文本长度并进行分段...")
-        text_chunks = split_text(text)
-        split_time = time.time() - split_start_time
-        print(f"文本已分为 {len(text_chunks)} 段，分段耗时: {split_time:.2f}秒")
-        
-        # 生成思维导图
-        mindmap_start_time = time.time()
-        print("正在生成思维导图...")
-        mindmap, mindmap_conversations, mindmap_input_tokens, mindmap_output_tokens = create_markdown_mindmap(text_chunks, model_name)
-        mindmap_time = time.time() - mindmap_start_time
-        print(f"生成思维导图耗时: {mindmap_time:.2f}秒")
-        
-        # 生成文本分析
-        analysis_start_time = time.time()
-        print("正在生成文本分析...")
-        analysis, analysis_conversations, analysis_input_tokens, analysis_output_tokens = create_text_analysis(text_chunks, model_name)
-        analysis_time = time.time() - analysis_start_time
-        print(f"生成文本分析耗时: {analysis_time:.2f}秒")
-        
-        if mindmap and analysis:
-            # 保存结果
-            save_start_time = time.time()
-            
-            # 准备统计信息
-            total_time = time.time() - total_start_time
-            stats = {
-                "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                "file_info": {
-                    "name": os.path.basename(text_file),
-                    "size": len(text),
-                    "chunks": len(text_chunks)
-                },
-                "timing": {
-                    "total": total_time,
-                    "read": read_time,
-                    "split": split_time,
-                    "mindmap": mindmap_time,
-                    "analysis": analysis_time
-                },
-                "tokens": {
-                    "mindmap": {
-                        "input": mindmap_input_tokens,
-                        "output": mindmap_output_tokens
-                    },
-                    "analysis": {
-                        "input": analysis_input_tokens,
-                        "output": analysis_output_tokens
-                    },
-                    "total": {
-                        "input": mindmap_input_tokens + analysis_input_tokens,
-                        "output": mindmap_output_tokens + analysis_output_tokens
-                    }
-                }
-            }
-            
-            # 保存统计信息
-            stats_file = save_statistics(stats)
-            
-            # 保存对话记录
-            conversations = {
-                "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                "file": os.path.basename(text_file),
-                "model": model_name,
-                "mindmap_conversations": mindmap_conversations,
-                "analysis_conversations": analysis_conversations
-            }
-            conversation_file = save_conversation_history(conversations)
-            
-            # 保存Markdown文件
-            filepath = save_to_markdown(mindmap, analysis, text)
-            save_time = time.time() - save_start_time
-            
-            if filepath:
-                print("\n处理完成！")
-                print(f"总耗时: {total_time:.2f}秒")
-                print(f"详细耗时统计:")
-                print(f"- 读取文件: {read_time:.2f}秒")
-                print(f"- 文本分段: {split_time:.2f}秒")
-                print(f"- 生成思维导图: {mindmap_time:.2f}秒")
-                print(f"- 生成文本分析: {analysis_time:.2f}秒")
-                print(f"- 保存文件: {save_time:.2f}秒")
-                print(f"\nToken统计:")
-                print(f"- 思维导图: 输入 {mindmap_input_tokens} / 输出 {mindmap_output_tokens}")
-                print(f"- 文本分析: 输入 {analysis_input_tokens} / 输出 {analysis_output_tokens}")
-                print(f"- 总计: 输入 {mindmap_input_tokens + analysis_input_tokens} / 输出 {mindmap_output_tokens + analysis_output_tokens}")
-                return filepath
-    except Exception as e:
-        print(f"处理文本时出错: {e}")
-        return None
-
-def main(api_key=None, base_url=None, model_name="deepseek-r1-250120"):
-    """主函数"""
-    global client
-    
-    # 如果没有提供API密钥，则请求输入
-    if not api_key:
-        api_key = input("请输入你的火山大模型 API 密钥: ").strip()
-    if not base_url:
-        base_url = input("请输入火山大模型的 Base URL: ").strip()
-    
-    # 初始化客户端
-    client = initialize_client(api_key, base_url)
-    
-    # 获取转录文本文件路径
-    text_file = input("请输入转录文本文件路径: ").strip()
-    
-    if not os.path.exists(text_file):
-        print("文件不存在！")
-        return
-    
-    # 处理文本
-    result_file = process_transcription(text_file, model_name)
-    
-    if result_file:
-        print(f"\n处理结果已保存到: {result_file}")
-        # 自动打开生成的文件
-        os.system(f"start {result_file}")
-
-# if __name__ == "__main__":
+from openai import APITimeoutError, APIConnectionError, APIStatusError
+import os
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, as_completed
+from contextlib import nullcontext
+import json
+import time
+import hashlib
+import uuid
+import httpx
+from datetime import datetime
+import tiktoken
+from conversationLog import open_conversation_log, log_turn, close_conversation_log
+from runHistory import record_run, percentile
+from llmPool import create_pool, get_client, acquire, release, mark_unhealthy, print_pool_status
+from searchIndex import index_file
+
+TEST_MODEL = "deepseek-r1-250120"
+
+def _test_endpoint(endpoint):
+    """发送一次测试请求，成功返回 True"""
+    try:
+        get_client(endpoint).chat.completions.create(
+            model=TEST_MODEL,
+            messages=[{"role": "user", "content": "测试连接"}],
+            max_tokens=10
+        )
+        return True
+    except Exception as e:
+        print(f"端点 {endpoint['name']} 连接测试失败: {str(e)}")
+        return False
+
+def initialize_pool(endpoints):
+    """
+    初始化端点池（多个 Base URL / API 密钥分担请求），endpoints 为配置文件路径或端点字典列表
+
+    测试失败的端点暂停使用，至少一个端点可用时返回端点池，否则返回 None；相同配置的端点池会被复用
+    """
+    global pool, client, async_client
+    if pool is not None and pool.get("source") == endpoints:
+        return pool
+    try:
+        new_pool = create_pool(endpoints)
+        new_pool["source"] = endpoints
+    except Exception as e:
+        print(f"读取端点配置失败: {str(e)}")
+        return None
+    healthy = [endpoint for endpoint in new_pool["endpoints"] if _test_endpoint(endpoint)]
+    for endpoint in new_pool["endpoints"]:
+        if endpoint not in healthy:
+            mark_unhealthy(new_pool, endpoint)
+    if not healthy:
+        print("API初始化失败: 没有可用的端点")
+        return None
+    print(f"API连接测试成功（{len(healthy)}/{len(new_pool['endpoints'])} 个端点可用）")
+    pool = new_pool
+    client = get_client(healthy[0])
+    async_client = get_client(healthy[0], use_async=True)
+    return pool
+
+def _single_endpoint_pool(api_key, base_url):
+    """当前端点池是否就是该 Base URL / API 密钥的单端点池"""
+    return (pool is not None and len(pool["endpoints"]) == 1
+            and pool["endpoints"][0]["api_key"] == api_key
+            and pool["endpoints"][0]["base_url"].rstrip("/") == base_url.rstrip("/"))
+
+def initialize_client(api_key, base_url):
+    """初始化API客户端（单端点的端点池）"""
+    global pool, client
+    try:
+        new_pool = create_pool([{"name": "default", "base_url": base_url, "api_key": api_key}])
+        client = get_client(new_pool["endpoints"][0])
+        # 测试API连接
+        response = client.chat.completions.create(
+            model=TEST_MODEL,
+            messages=[{"role": "user", "content": "测试连接"}],
+            max_tokens=10
+        )
+        print("API连接测试成功")
+        pool = new_pool
+        return client
+    except Exception as e:
+        print(f"API初始化失败: {str(e)}")
+        return None
+
+# 全局客户端变量（请求通过端点池发送，client/async_client 保留为第一个可用端点的客户端）
+pool = None
+client = None
+async_client = None
+
+# 请求参数
+MAX_OUTPUT_TOKENS = 2000
+
+# 请求时限与对冲
+REQUEST_DEADLINE_S = 600   # 单次请求（含卡住后的重新请求）的总时限（秒）
+STREAM_STALL_S = 60        # 流式响应超过该时间没有收到任何新数据（正文、推理内容等）视为卡住，在时限内重新请求（秒）
+HEDGE_REQUESTS = False     # 请求耗时超过该类请求的 p95 时发出第二个相同请求，取先完成的
+HEDGE_MIN_SAMPLES = 20     # 同类请求至少有这么多次耗时记录后才开始对冲
+TIMEOUT_ERRORS = (TimeoutError, asyncio.TimeoutError, APITimeoutError, httpx.TimeoutException)
+
+# 各类请求（mindmap/analysis）最近的耗时（秒），跨运行累积，仅用于计算对冲等待时间
+call_latencies = {}
+
+async def initialize_async_client(api_key, base_url):
+    """初始化异步API客户端（供 process_transcription_async 使用），相同配置的端点池会被复用"""
+    global pool, async_client
+    if _single_endpoint_pool(api_key, base_url):
+        async_client = get_client(pool["endpoints"][0], use_async=True)
+        return async_client
+    try:
+        new_pool = create_pool([{"name": "default", "base_url": base_url, "api_key": api_key}])
+        async_client = get_client(new_pool["endpoints"][0], use_async=True)
+        # 测试API连接
+        await async_client.chat.completions.create(
+            model=TEST_MODEL,
+            messages=[{"role": "user", "content": "测试连接"}],
+            max_tokens=10
+        )
+        print("API连接测试成功")
+        pool = new_pool
+        return async_client
+    except Exception as e:
+        print(f"API初始化失败: {str(e)}")
+        return None
+
+def configure_requests(deadline_s=REQUEST_DEADLINE_S, stall_s=STREAM_STALL_S, hedge=HEDGE_REQUESTS, hedge_min_samples=HEDGE_MIN_SAMPLES):
+    """设置大模型请求的时限、卡住判定时间和是否对冲"""
+    global REQUEST_DEADLINE_S, STREAM_STALL_S, HEDGE_REQUESTS, HEDGE_MIN_SAMPLES
+    REQUEST_DEADLINE_S = deadline_s
+    STREAM_STALL_S = stall_s
+    HEDGE_REQUESTS = hedge
+    HEDGE_MIN_SAMPLES = hedge_min_samples
+
+def record_latency(call_type, seconds, latencies=None):
+    """
+    记录一次成功请求的耗时
+
+    全局窗口每类保留最近 1000 次，用于对冲；latencies 为本次运行的耗时记录 {call_type: [秒, ...]}
+    """
+    call_latencies.setdefault(call_type, deque(maxlen=1000)).append(seconds)
+    if latencies is not None:
+        latencies.setdefault(call_type, []).append(seconds)
+
+def latency_percentiles(latencies):
+    """本次运行各类请求耗时的 p50/p95/p99，返回 {call_type: {"count", "p50", "p95", "p99"}}"""
+    report = {}
+    for call_type, samples in latencies.items():
+        values = sorted(samples)
+        report[call_type] = {"count": len(values)}
+        for q in (50, 95, 99):
+            report[call_type][f"p{q}"] = percentile(values, q)
+    return report
+
+def _hedge_delay(call_type):
+    """对冲等待时间（该类请求的 p95），未启用或样本不足时返回 None"""
+    samples = call_latencies.get(call_type, ())
+    if not HEDGE_REQUESTS or len(samples) < HEDGE_MIN_SAMPLES:
+        return None
+    return percentile(sorted(samples), 95)
+
+def count_tokens(text, model="deepseek-r1-250120"):
+    """计算文本的 token 数量"""
+    # 注意：这里可能需要根据实际模型调整
+    encoding = tiktoken.encoding_for_model("gpt-4")  # 使用兼容的编码器
+    return len(encoding.encode(text))
+
+def split_text(text, max_tokens=4000):
+    """将文本分段，确保每段不超过最大 token 限制"""
+    # 按句号分割文本
+    sentences = text.split("。")
+    chunks = []
+    current_chunk = []
+    current_length = 0
+    
+    for sentence in sentences:
+        sentence = sentence.strip() + "。"
+        sentence_tokens = count_tokens(sentence)
+        
+        if current_length + sentence_tokens > max_tokens:
+            # 当前块已满，保存并开始新块
+            chunks.append("".join(current_chunk))
+            current_chunk = [sentence]
+            current_length = sentence_tokens
+        else:
+            # 添加句子到当前块
+            current_chunk.append(sentence)
+            current_length += sentence_tokens
+    
+    # 添加最后一个块
+    if current_chunk:
+        chunks.append("".join(current_chunk))
+    
+    return chunks
+
+def save_statistics(stats, output_dir="stats"):
+    """将统计信息记录到运行历史数据库（python runHistory.py 查看汇总）"""
+    try:
+        db_path = os.path.join(output_dir, "history.db")
+        run_id = record_run(stats, db_path)
+        print(f"统计信息已记录到: {db_path}（第 {run_id} 次运行）")
+        return run_id
+    except Exception as e:
+        print(f"保存统计信息时出错: {e}")
+        return None
+
+def open_checkpoint(text, model_name, resume=False, output_dir="checkpoints"):
+    """
+    打开当前任务的检查点，resume 为 True 时加载已完成的请求记录
+
+    resume 为 False 但已存在同一文本和模型的检查点时抛出 FileExistsError，不覆盖已保存的进度
+    """
+    job_id = hashlib.sha1(f"{model_name}\n{text}".encode("utf-8")).hexdigest()[:16]
+    path = os.path.join(output_dir, f"checkpoint_{job_id}.json")
+    checkpoint = {"path": path, "stages": {}}
+    
+    if not resume and os.path.exists(path):
+        raise FileExistsError(f"已存在未完成的检查点: {path}，请使用 resume 继续，或删除该文件后重新开始")
+    if resume and os.path.exists(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                checkpoint["stages"] = json.load(f)["stages"]
+            done = sum(len(records) for records in checkpoint["stages"].values())
+            print(f"已加载检查点: {path}（已完成 {done} 次请求）")
+        except Exception as e:
+            print(f"读取检查点失败，将重新开始: {e}")
+    return checkpoint
+
+def save_checkpoint(checkpoint):
+    """写入检查点（先写临时文件再替换，避免中断时损坏）"""
+    os.makedirs(os.path.dirname(checkpoint["path"]), exist_ok=True)
+    tmp_path = checkpoint["path"] + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"stages": checkpoint["stages"]}, f, ensure_ascii=False)
+    os.replace(tmp_path, checkpoint["path"])
+
+def remove_checkpoint(checkpoint):
+    """任务完成后删除检查点"""
+    if checkpoint and os.path.exists(checkpoint["path"]):
+        os.remove(checkpoint["path"])
+
+def _checkpoint_lookup(checkpoint, stage, index, request):
+    """查找第 index 次请求的检查点记录；请求内容已变化时丢弃该记录及之后的记录"""
+    if checkpoint is None:
+        return None
+    records = checkpoint["stages"].setdefault(stage, [])
+    if index < len(records) and records[index]["request"] == request:
+        return records[index]
+    del records[index:]
+    return None
+
+def _checkpoint_record(checkpoint, stage, request, content, input_tokens, output_tokens):
+    """追加一次完成的请求并立即写入检查点"""
+    if checkpoint is None:
+        return
+    checkpoint["stages"].setdefault(stage, []).append({
+        "request": request,
+        "response": content,
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens
+    })
+    save_checkpoint(checkpoint)
+
+def _is_rate_limited(error):
+    """被限流（429）：release 已按 Retry-After 暂停该端点，等待即可，不必排除该端点"""
+    return isinstance(error, APIStatusError) and getattr(error, "status_code", None) == 429
+
+def _should_failover(error):
+    """连接错误、限流、鉴权失败和服务端错误时换一个端点重试"""
+    if isinstance(error, APIConnectionError):
+        return True
+    status = getattr(error, "status_code", None) if isinstance(error, APIStatusError) else None
+    return status is not None and (status in (401, 403, 429) or status >= 500)
+
+def _has_delta(chunk):
+    """chunk 是否带来了新数据：正文、推理过程（deepseek-r1 的 reasoning_content）、角色、工具调用或结束标记都算，
+    只有空的保活 chunk 不算"""
+    if not chunk.choices:
+        return False
+    choice = chunk.choices[0]
+    if choice.finish_reason:
+        return True
+    delta = choice.delta
+    return any(getattr(delta, field, None) for field in ("content", "reasoning_content", "role", "tool_calls", "function_call"))
+
+def _stream_once(llm_client, messages, model_name, deadline, cancelled):
+    """发送一次流式请求；超过时限或卡住时抛出超时异常，cancelled 被设置时提前返回 None"""
+    remaining = deadline - time.time()
+    if remaining <= 0:
+        raise TimeoutError("请求超过时限")
+    # 读超时即两次收到数据之间的最长间隔
+    response = llm_client.chat.completions.create(
+        model=model_name,
+        messages=messages,
+        temperature=0.7,
+        max_tokens=MAX_OUTPUT_TOKENS,
+        stream=True,
+        timeout=min(STREAM_STALL_S, remaining)
+    )
+    
+    content = ""
+    last_delta = time.time()
+    try:
+        for chunk in response:
+            if cancelled.is_set():
+                return None
+            now = time.time()
+            if _has_delta(chunk):
+                # 推理阶段只有 reasoning_content，同样说明流仍在推进
+                content += chunk.choices[0].delta.content or ""
+                last_delta = now
+            elif now - last_delta > STREAM_STALL_S:
+                raise TimeoutError(f"流式响应 {STREAM_STALL_S} 秒没有新数据")
+            if now > deadline:
+                raise TimeoutError("请求超过时限")
+    finally:
+        response.close()
+    return content
+
+def _request_until_deadline(messages, model_name, deadline, cancelled, input_tokens):
+    """
+    从端点池选择端点发送请求，返回 (回答, 输出tokens)；cancelled 被设置（对冲的另一请求已完成）时返回 None
+
+    流式响应卡住时在时限内重新请求，优先换一个端点；端点出错时换一个端点重试（每个端点最多一次）；
+    被限流时不排除该端点，由端点池在其暂停结束后（或先选其他端点）重新分配
+    """
+    if pool is None:
+        raise Exception("API客户端未初始化")
+    failed = set()
+    stalled = set()
+    last_error = None
+    while True:
+        if cancelled.is_set():
+            return None
+        endpoint, wait_s = acquire(pool, input_tokens + MAX_OUTPUT_TOKENS, failed | stalled)
+        if endpoint is None:
+            if wait_s is None and stalled:
+                stalled.clear()  # 只剩卡住过的端点时仍然重试
+                continue
+            if wait_s is None:
+                raise last_error or Exception("端点池中没有可用的端点")
+            if time.time() + wait_s >= deadline:
+                raise TimeoutError(f"请求在 {REQUEST_DEADLINE_S} 秒内没有可用的端点")
+            if cancelled.wait(min(wait_s, 1)):
+                return None
+            continue
+        try:
+            content = _stream_once(get_client(endpoint), messages, model_name, deadline, cancelled)
+            if content is None:
+                release(pool, endpoint)  # 对冲落后被取消，不计为端点故障
+                return None
+            output_tokens = count_tokens(content)
+            release(pool, endpoint, input_tokens + output_tokens)
+            return content, output_tokens
+        except TIMEOUT_ERRORS as e:
+            release(pool, endpoint)  # 卡住不计为端点故障，重新请求时优先换端点
+            stalled.add(endpoint["name"])
+            if cancelled.is_set():
+                return None
+            if time.time() >= deadline:
+                raise TimeoutError(f"请求在 {REQUEST_DEADLINE_S} 秒内未完成: {e}")
+            print(f"请求超时，重新请求: {e}")
+        except Exception as e:
+            release(pool, endpoint, error=e)
+            if not _should_failover(e):
+                raise
+            last_error = e
+            if _is_rate_limited(e):
+                continue  # 等待限流暂停结束，期间有其他端点可用时先用其他端点
+            failed.add(endpoint["name"])
+            print(f"端点 {endpoint['name']} 请求失败，切换端点: {e}")
+
+def _complete_with_deadline(messages, model_name, call_type, input_tokens, latencies=None):
+    """
+    带时限的流式请求，返回 (回答, 输出tokens)
+
+    启用对冲且已有足够耗时记录时，请求超过该类请求的 p95 仍未完成则再发出一个相同请求，
+    取先成功的结果，另一个请求在收到下一块数据时关闭，且不再重试或等待端点；
+    耗时同时记入 latencies（本次运行的耗时记录）
+    """
+    start_time = time.time()
+    deadline = start_time + REQUEST_DEADLINE_S
+    hedge_after = _hedge_delay(call_type)
+    cancelled = threading.Event()
+    
+    if hedge_after is None:
+        content = _request_until_deadline(messages, model_name, deadline, cancelled, input_tokens)
+    else:
+        executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="hedge")
+        try:
+            attempts = [executor.submit(_request_until_deadline, messages, model_name, deadline, cancelled, input_tokens)]
+            done, _ = wait(attempts, timeout=hedge_after)
+            if not done:
+                print(f"请求已超过 p95 耗时 {hedge_after:.2f} 秒，发出对冲请求")
+                attempts.append(executor.submit(_request_until_deadline, messages, model_name, deadline, cancelled, input_tokens))
+            error = None
+            for attempt in as_completed(attempts):
+                error = attempt.exception()
+                if error is None:
+                    content = attempt.result()
+                    break
+            else:
+                raise error
+        finally:
+            cancelled.set()
+            executor.shutdown(wait=False)
+    
+    record_latency(call_type, time.time() - start_time, latencies)
+    return content
+
+def request_completion(messages, model_name, checkpoint=None, stage=None, index=0, latencies=None):
+    """
+    发送一轮流式对话请求，返回 (回答, 输入tokens, 输出tokens, 是否命中检查点)
+    
+    提供检查点时，第 index 次请求若已记录且请求内容一致则直接复用回答；
+    新完成的请求会立即写入检查点。请求受 REQUEST_DEADLINE_S / STREAM_STALL_S 限制，
+    耗时按 stage 分类记录（latencies 为本次运行的耗时记录）
+    """
+    request = messages[-1]["content"]
+    record = _checkpoint_lookup(checkpoint, stage, index, request)
+    if record:
+        return record["response"], record["input_tokens"], record["output_tokens"], True
+    
+    # 计算输入tokens
+    input_tokens = sum(count_tokens(msg["content"]) for msg in messages)
+    
+    content, output_tokens = _complete_with_deadline(messages, model_name, stage or "default", input_tokens, latencies)
+    
+    _checkpoint_record(checkpoint, stage, request, content, input_tokens, output_tokens)
+    return content, input_tokens, output_tokens, False
+
+async def _stream_once_async(llm_client, messages, model_name, deadline):
+    """_stream_once 的异步版本，超过时限或卡住时抛出超时异常"""
+    remaining = deadline - time.time()
+    if remaining <= 0:
+        raise TimeoutError("请求超过时限")
+    response = await llm_client.chat.completions.create(
+        model=model_name,
+        messages=messages,
+        temperature=0.7,
+        max_tokens=MAX_OUTPUT_TOKENS,
+        stream=True,
+        timeout=min(STREAM_STALL_S, remaining)
+    )
+    
+    content = ""
+    last_delta = time.time()
+    chunks = response.__aiter__()
+    try:
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise TimeoutError("请求超过时限")
+            try:
+                chunk = await asyncio.wait_for(chunks.__anext__(), min(STREAM_STALL_S, remaining))
+            except StopAsyncIteration:
+                break
+            except asyncio.TimeoutError:
+                raise TimeoutError(f"{min(STREAM_STALL_S, remaining):.1f} 秒内没有收到数据")
+            if _has_delta(chunk):
+                content += chunk.choices[0].delta.content or ""
+                last_delta = time.time()
+            elif time.time() - last_delta > STREAM_STALL_S:
+                raise TimeoutError(f"流式响应 {STREAM_STALL_S} 秒没有新数据")
+    finally:
+        await response.close()  # 被取消时也要关闭连接
+    return content
+
+async def _request_until_deadline_async(messages, model_name, deadline, semaphore, input_tokens, cancelled):
+    """_request_until_deadline 的异步版本，semaphore 限制同时进行的请求数；cancelled 被设置时返回 None"""
+    if pool is None:
+        raise Exception("API客户端未初始化")
+    failed = set()
+    stalled = set()
+    last_error = None
+    while True:
+        if cancelled.is_set():
+            return None
+        async with semaphore or nullcontext():
+            if cancelled.is_set():
+                return None  # 等待名额期间对冲的另一请求已完成
+            endpoint, wait_s = acquire(pool, input_tokens + MAX_OUTPUT_TOKENS, failed | stalled)
+            if endpoint is not None:
+                try:
+                    content = await _stream_once_async(get_client(endpoint, use_async=True), messages, model_name, deadline)
+                except asyncio.CancelledError:
+                    release(pool, endpoint)  # 对冲落后或任务被取消，不计为端点故障
+                    raise
+                except TIMEOUT_ERRORS as e:
+                    release(pool, endpoint)  # 卡住不计为端点故障，重新请求时优先换端点
+                    stalled.add(endpoint["name"])
+                    if cancelled.is_set():
+                        return None
+                    if time.time() >= deadline:
+                        raise TimeoutError(f"请求在 {REQUEST_DEADLINE_S} 秒内未完成: {e}")
+                    print(f"请求超时，重新请求: {e}")
+                    continue
+                except Exception as e:
+                    release(pool, endpoint, error=e)
+                    if not _should_failover(e):
+                        raise
+                    last_error = e
+                    if _is_rate_limited(e):
+                        continue  # 等待限流暂停结束，期间有其他端点可用时先用其他端点
+                    failed.add(endpoint["name"])
+                    print(f"端点 {endpoint['name']} 请求失败，切换端点: {e}")
+                    continue
+                output_tokens = count_tokens(content)
+                release(pool, endpoint, input_tokens + output_tokens)
+                return content, output_tokens
+        if wait_s is None and stalled:
+            stalled.clear()  # 只剩卡住过的端点时仍然重试
+            continue
+        if wait_s is None:
+            raise last_error or Exception("端点池中没有可用的端点")
+        if time.time() + wait_s >= deadline:
+            raise TimeoutError(f"请求在 {REQUEST_DEADLINE_S} 秒内没有可用的端点")
+        if cancelled.is_set():
+            return None
+        await asyncio.sleep(min(wait_s, 1))
+
+async def _complete_with_deadline_async(messages, model_name, call_type, input_tokens, semaphore=None, latencies=None):
+    """_complete_with_deadline 的异步版本，对冲时落后的请求会被取消"""
+    start_time = time.time()
+    deadline = start_time + REQUEST_DEADLINE_S
+    hedge_after = _hedge_delay(call_type)
+    cancelled = asyncio.Event()
+    
+    attempts = [asyncio.ensure_future(_request_until_deadline_async(messages, model_name, deadline, semaphore, input_tokens, cancelled))]
+    try:
+        if hedge_after is not None:
+            done, _ = await asyncio.wait(attempts, timeout=hedge_after)
+            if not done:
+                print(f"请求已超过 p95 耗时 {hedge_after:.2f} 秒，发出对冲请求")
+                attempts.append(asyncio.ensure_future(_request_until_deadline_async(messages, model_name, deadline, semaphore, input_tokens, cancelled)))
+        error = None
+        for attempt in asyncio.as_completed(attempts):
+            try:
+                content = await attempt
+                break
+            except Exception as e:
+                error = e
+        else:
+            raise error
+    finally:
+        cancelled.set()
+        for attempt in attempts:
+            attempt.cancel()
+    
+    record_latency(call_type, time.time() - start_time, latencies)
+    return content
+
+async def request_completion_async(messages, model_name, checkpoint=None, stage=None, index=0, semaphore=None, latencies=None):
+    """request_completion 的异步版本，semaphore 用于限制同时进行的请求数（对冲请求也计入）"""
+    request = messages[-1]["content"]
+    record = _checkpoint_lookup(checkpoint, stage, index, request)
+    if record:
+        return record["response"], record["input_tokens"], record["output_tokens"], True
+    
+    # 计算输入tokens
+    input_tokens = sum(count_tokens(msg["content"]) for msg in messages)
+    
+    content, output_tokens = await _complete_with_deadline_async(messages, model_name, stage or "default", input_tokens, semaphore, latencies)
+    
+    _checkpoint_record(checkpoint, stage, request, content, input_tokens, output_tokens)
+    return content, input_tokens, output_tokens, False
+
+# 分段对话任务：每段文本一轮对话，多段时最后再请求一次合并
+CONVERSATION_TASKS = {
+    "mindmap": {
+        "name": "思维导图",
+        "system": "你是一个专业的内容分析师，请将给定的文本整理成markdown格式的可预览的思维导图。可以使用mermaid",
+        "progress": "正在处理第 {part}/{total} 段文本...",
+        "chunk": "请将以下文本整理成思维导图格式（这是文本的第{part}部分，共{total}部分）：\n\n{chunk}",
+        "merge": "请将以上所有思维导图整合成一个完整的、层次清晰的思维导图。保持相同的格式，但要去除重复的内容，使其更加连贯。\n\n{combined}",
+    },
+    "analysis": {
+        "name": "文本分析",
+        "system": "你是一个专业的内容分析师，请对给定的文本进行深入分析，包括：主要内容、关键观点、逻辑分析和重要信息。",
+        "progress": "正在分析第 {part}/{total} 段文本...",
+        "chunk": "请分析以下文本（这是文本的第{part}部分，共{total}部分）：\n\n{chunk}",
+        "merge": "请根据以上所有分析结果，生成一个完整的总体分析。需要整合所有重要观点，去除重复内容，使分析更加连贯和全面。\n\n{combined}",
+    },
+}
+
+def conversation_steps(task, text_chunks, log=None):
+    """
+    分段多轮对话流程（生成器），同步和异步调用共用
+    
+    依次产出 (messages, index) 表示需要发送的请求，通过 send() 接收
+    (回答, 输入tokens, 输出tokens, 是否命中检查点)，
+    结束时返回 (最终结果, 对话记录, 输入tokens合计, 输出tokens合计)；
+    提供 log 时每轮完成后追加到对话日志
+    """
+    config = CONVERSATION_TASKS[task]
+    results = []
+    conversations = []
+    total_input_tokens = 0
+    total_output_tokens = 0
+    
+    # 初始化对话历史
+    messages = [
+        {
+            "role": "system",
+            "content": config["system"]
+        }
+    ]
+    
+    # 首先处理每个文本块
+    for i, chunk in enumerate(text_chunks, 1):
+        print(config["progress"].format(part=i, total=len(text_chunks)))
+        
+        # 添加用户输入到对话历史
+        messages.append({
+            "role": "user",
+            "content": config["chunk"].format(part=i, total=len(text_chunks), chunk=chunk)
+        })
+        
+        # 记录对话
+        current_conversation = {
+            "type": task,
+            "part": i,
+            "messages": messages.copy()  # 复制当前的对话历史
+        }
+        
+        content, input_tokens, output_tokens, cached = yield messages, i - 1
+        total_input_tokens += input_tokens
+        total_output_tokens += output_tokens
+        if cached:
+            print(f"第 {i} 段已在检查点中，跳过请求")
+        log_turn(log, task, i, messages, content, input_tokens, output_tokens, cached)
+        
+        # 将助手的回答添加到对话历史
+        messages.append({
+            "role": "assistant",
+            "content": content
+        })
+        
+        results.append(content)
+        
+        # 记录响应
+        current_conversation["response"] = content
+        current_conversation["input_tokens"] = input_tokens
+        current_conversation["output_tokens"] = output_tokens
+        current_conversation["cached"] = cached
+        conversations.append(current_conversation)
+    
+    # 然后生成一个总结性的结果
+    if len(results) > 1:
+        # 添加用户请求合并的消息
+        messages.append({
+            "role": "user",
+            "content": config["merge"].format(combined="\n\n".join(results))
+        })
+        
+        # 记录合并对话
+        current_conversation = {
+            "type": f"{task}_merge",
+            "messages": messages.copy()
+        }
+        
+        content, input_tokens, output_tokens, cached = yield messages, len(text_chunks)
+        total_input_tokens += input_tokens
+        total_output_tokens += output_tokens
+        if cached:
+            print("合并结果已在检查点中，跳过请求")
+        log_turn(log, task, None, messages, content, input_tokens, output_tokens, cached)
+        
+        # 记录响应
+        current_conversation["response"] = content
+        current_conversation["input_tokens"] = input_tokens
+        current_conversation["output_tokens"] = output_tokens
+        current_conversation["cached"] = cached
+        conversations.append(current_conversation)
+        
+        final_content = content
+    else:
+        final_content = results[0]
+    
+    return final_content, conversations, total_input_tokens, total_output_tokens
+
+def run_conversation(task, text_chunks, model_name="deepseek-r1-250120", checkpoint=None, log=None, latencies=None):
+    """同步执行分段对话任务，出错时返回 (None, [], 0, 0)；latencies 收集本次运行的请求耗时"""
+    steps = conversation_steps(task, text_chunks, log)
+    try:
+        messages, index = next(steps)
+        while True:
+            reply = request_completion(messages, model_name, checkpoint, task, index, latencies)
+            if not reply[3] and index < len(text_chunks):
+                time.sleep(1)  # 避免触发 API 限制
+            messages, index = steps.send(reply)
+    except StopIteration as stop:
+        return stop.value
+    except Exception as e:
+        print(f"生成{CONVERSATION_TASKS[task]['name']}时出错: {e}")
+        if checkpoint is not None:
+            print(f"已完成的请求保存在检查点中，可使用 resume=True 继续: {checkpoint['path']}")
+        return None, [], 0, 0
+
+async def run_conversation_async(task, text_chunks, model_name="deepseek-r1-250120", checkpoint=None, semaphore=None, progress=None, log=None, latencies=None):
+    """
+    异步执行分段对话任务，出错时返回 (None, [], 0, 0)；取消时 CancelledError 会继续抛出
+
+    progress(stage, info) 在每次请求完成后调用，info 包含 part/total
+    """
+    steps = conversation_steps(task, text_chunks, log)
+    total = len(text_chunks) + (1 if len(text_chunks) > 1 else 0)
+    try:
+        messages, index = next(steps)
+        while True:
+            reply = await request_completion_async(messages, model_name, checkpoint, task, index, semaphore, latencies)
+            if progress:
+                progress(task, {"part": index + 1, "total": total, "cached": reply[3]})
+            if not reply[3] and index < len(text_chunks):
+                await asyncio.sleep(1)  # 避免触发 API 限制
+            messages, index = steps.send(reply)
+    except StopIteration as stop:
+        return stop.value
+    except Exception as e:
+        print(f"生成{CONVERSATION_TASKS[task]['name']}时出错: {e}")
+        if checkpoint is not None:
+            print(f"已完成的请求保存在检查点中，可使用 resume=True 继续: {checkpoint['path']}")
+        return None, [], 0, 0
+
+def create_markdown_mindmap(text_chunks, model_name="deepseek-r1-250120", checkpoint=None, log=None, latencies=None):
+    """使用火山大模型分段生成思维导图（多轮对话形式），提供检查点时逐段保存并可续传"""
+    return run_conversation("mindmap", text_chunks, model_name, checkpoint, log, latencies)
+
+def create_text_analysis(text_chunks, model_name="deepseek-r1-250120", checkpoint=None, log=None, latencies=None):
+    """使用火山大模型分段生成文本分析（多轮对话形式），提供检查点时逐段保存并可续传"""
+    return run_conversation("analysis", text_chunks, model_name, checkpoint, log, latencies)
+
+def save_to_markdown(mindmap, analysis, text, output_dir="notes", run_id=None):
+    """保存结果到 Markdown 文件，文件名包含 run_id（不提供时随机生成），并发任务不会互相覆盖"""
+    try:
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+        
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        filename = f"note_{timestamp}_{run_id or uuid.uuid4().hex[:12]}.md"
+        filepath = os.path.join(output_dir, filename)
+        
+        with open(filepath, "w", encoding="utf-8") as f:
+            f.write("# 内容分析报告\n\n")
+            f.write("## 原文内容\n\n")
+            f.write(f"```\n{text}\n```\n\n")
+            f.write("## 思维导图\n\n")
+            f.write(f"{mindmap}\n\n")
+            f.write("## 内容分析\n\n")
+            f.write(f"{analysis}\n")
+            
+            # 添加元信息
+            f.write("\n---\n")
+            f.write(f"生成时间：{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+            f.write(f"文本长度：{len(text)} 字符\n")
+            f.write(f"Token 数量：{count_tokens(text)} tokens\n")
+            
+            # 添加处理时间信息到文件
+            if 'total_time' in locals():
+                f.write(f"\n## 处理时间统计\n")
+                f.write(f"- 总耗时：{total_time:.2f}秒\n")
+                f.write(f"- 读取文件：{read_time:.2f}秒\n")
+                f.write(f"- 文本分段：{split_time:.2f}秒\n")
+                f.write(f"- 生成思维导图：{mindmap_time:.2f}秒\n")
+                f.write(f"- 生成文本分析：{analysis_time:.2f}秒\n")
+                f.write(f"- 保存文件：{save_time:.2f}秒\n")
+        
+        index_file(filepath, kind="notes")
+        print(f"笔记已保存到: {filepath}")
+        return filepath
+    except Exception as e:
+        print(f"保存文件时出错: {e}")
+        return None
+
+def prepare_transcription(text_file, model_name="deepseek-r1-250120", resume=False):
+    """读取并分段转录文本、打开检查点，返回 (文本, 分段, 检查点, 耗时统计)"""
+    # 读取文本文件
+    read_start_time = time.time()
+    with open(text_file, "r", encoding="utf-8") as f:
+        text = f.read()
+    read_time = time.time() - read_start_time
+    print(f"读取文件耗时: {read_time:.2f}秒")
+    
+    # 分割文本
+    split_start_time = time.time()
+    print("正在分析文本长度并进行分段...")
+    text_chunks = split_text(text)
+    split_time = time.time() - split_start_time
+    print(f"文本已分为 {len(text_chunks)} 段，分段耗时: {split_time:.2f}秒")
+    
+    # 打开检查点
+    checkpoint = open_checkpoint(text, model_name, resume)
+    
+    return text, text_chunks, checkpoint, {"read": read_time, "split": split_time}
+
+def finish_transcription(text_file, text, text_chunks, model_name, timing, mindmap_result, analysis_result, checkpoint, total_start_time, run_info=None, latencies=None, run_id=None):
+    """
+    保存统计信息和 Markdown 报告，成功时返回报告路径（对话记录在生成过程中已写入对话日志）
+
+    run_info 为语音识别阶段的信息，与本阶段统计合并记录到运行历史；
+    latencies 为本次运行的请求耗时记录，用于计算记录到运行历史的 p50/p95/p99；
+    run_id 为本次运行的标识，写入报告文件名（与对话日志一致）
+    """
+    mindmap,mindmap_conversations, mindmap_input_tokens, mindmap_output_tokens = mindmap_result
+    analysis, analysis_conversations, analysis_input_tokens, analysis_output_tokens = analysis_result
+    
+    if not (mindmap and analysis):
+        return None
+    
+    # 保存结果
+    save_start_time = time.time()
+    
+    # 准备统计信息
+    total_time = time.time() - total_start_time
+    requests = mindmap_conversations + analysis_conversations
+    stats = {
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "model": model_name,
+        "run": run_info,
+        "requests": len(requests),
+        "cache_hits": sum(1 for conv in requests if conv["cached"]),
+        "latency": latency_percentiles(latencies or {}),
+        "file_info": {
+            "name": os.path.basename(text_file),
+            "size": len(text),
+            "chunks": len(text_chunks)
+        },
+        "timing": {
+            "total": total_time,
+            "read": timing["read"],
+            "split": timing["split"],
+            "mindmap": timing["mindmap"],
+            "analysis": timing["analysis"]
+        },
+        "tokens": {
+            "mindmap": {
+                "input": mindmap_input_tokens,
+                "output": mindmap_output_tokens
+            },
+            "analysis": {
+                "input": analysis_input_tokens,
+                "output": analysis_output_tokens
+            },
+            "total": {
+                "input": mindmap_input_tokens + analysis_input_tokens,
+                "output": mindmap_output_tokens + analysis_output_tokens
+            }
+        }
+    }
+    
+    # 保存统计信息
+    stats_file = save_statistics(stats)
+    
+    # 保存Markdown文件
+    filepath = save_to_markdown(mindmap, analysis, text, run_id=run_id)
+    save_time = time.time() - save_start_time
+    
+    if filepath:
+        remove_checkpoint(checkpoint)
+        print("\n处理完成！")
+        print(f"总耗时: {total_time:.2f}秒")
+        print(f"详细耗时统计:")
+        print(f"- 读取文件: {timing['read']:.2f}秒")
+        print(f"- 文本分段: {timing['split']:.2f}秒")
+        print(f"- 生成思维导图: {timing['mindmap']:.2f}秒")
+        print(f"- 生成文本分析: {timing['analysis']:.2f}秒")
+        print(f"- 保存文件: {save_time:.2f}秒")
+        print(f"\nToken统计:")
+        print(f"- 思维导图: 输入 {mindmap_input_tokens} / 输出 {mindmap_output_tokens}")
+        print(f"- 文本分析: 输入 {analysis_input_tokens} / 输出 {analysis_output_tokens}")
+        print(f"- 总计: 输入 {mindmap_input_tokens + analysis_input_tokens} / 输出 {mindmap_output_tokens + analysis_output_tokens}")
+        if stats["latency"]:
+            print(f"\n请求耗时（本次运行）:")
+            for call_type, values in stats["latency"].items():
+                print(f"- {call_type}: p50 {values['p50']:.2f}秒 / p95 {values['p95']:.2f}秒 / p99 {values['p99']:.2f}秒")
+        if pool is not None and len(pool["endpoints"]) > 1:
+            print_pool_status(pool)
+    return filepath
+
+def process_transcription(text_file, model_name="deepseek-r1-250120", resume=False, log_compression=None, run_info=None):
+    """处理转录文本文件
+
+    每次大模型请求完成后都会写入检查点和对话日志；resume 为 True 时从上次成功的请求继续。
+    log_compression 为对话日志的压缩方式 (None/"gzip"/"zstd")；
+    run_info 为语音识别阶段的信息（hugWhisper.process_audio 结果中的 run_info），一并记录到运行历史
+    """
+    log = None
+    try:
+        total_start_time = time.time()
+        
+        text, text_chunks, checkpoint, timing = prepare_transcription(text_file, model_name, resume)
+        run_id = uuid.uuid4().hex[:12]  # 报告和对话日志使用同一标识，便于对应
+        log = open_conversation_log(text_file, model_name, compression=log_compression, run_id=run_id)
+        latencies = {}  # 本次运行的请求耗时
+        
+        # 生成思维导图
+        mindmap_start_time = time.time()
+        print("正在生成思维导图...")
+        mindmap_result = create_markdown_mindmap(text_chunks, model_name, checkpoint, log, latencies)
+        timing["mindmap"] = time.time() - mindmap_start_time
+        print(f"生成思维导图耗时: {timing['mindmap']:.2f}秒")
+        
+        # 生成文本分析
+        analysis_start_time = time.time()
+        print("正在生成文本分析...")
+        analysis_result = create_text_analysis(text_chunks, model_name, checkpoint, log, latencies)
+        timing["analysis"] = time.time() - analysis_start_time
+        print(f"生成文本分析耗时: {timing['analysis']:.2f}秒")
+        
+        return finish_transcription(
+            text_file, text, text_chunks, model_name, timing,
+            mindmap_result, analysis_result, checkpoint, total_start_time, run_info, latencies, run_id
+        )
+    except Exception as e:
+        print(f"处理文本时出错: {e}")
+        return None
+    finally:
+        close_conversation_log(log)
+
+async def process_transcription_async(text_file, model_name="deepseek-r1-250120", resume=False, semaphore=None, progress=None, log_compression=None, run_info=None):
+    """
+    process_transcription 的异步版本：使用 AsyncOpenAI 流式请求，思维导图和文本分析并发生成
+
+    参数:
+        semaphore (asyncio.Semaphore): 限制所有任务同时进行的大模型请求数
+        progress (callable): 进度回调 progress(stage, info)
+        log_compression (str): 对话日志的压缩方式 (None/"gzip"/"zstd")
+        run_info (dict): 语音识别阶段的信息，一并记录到运行历史
+    """
+    log = None
+    try:
+        total_start_time = time.time()
+        
+        text, text_chunks, checkpoint, timing = await asyncio.to_thread(prepare_transcription, text_file, model_name, resume)
+        run_id = uuid.uuid4().hex[:12]  # 报告和对话日志使用同一标识，便于对应
+        log = open_conversation_log(text_file, model_name, compression=log_compression, run_id=run_id)
+        latencies = {}  # 本次运行的请求耗时
+        
+        async def timed(task):
+            start_time = time.time()
+            result = await run_conversation_async(task, text_chunks, model_name, checkpoint, semaphore, progress, log, latencies)
+            timing[task] = time.time() - start_time
+            return result
+        
+        mindmap_result, analysis_result = await asyncio.gather(timed("mindmap"), timed("analysis"))
+        
+        return await asyncio.to_thread(
+            finish_transcription,
+            text_file, text, text_chunks, model_name, timing,
+            mindmap_result, analysis_result, checkpoint, total_start_time, run_info, latencies, run_id
+        )
+    except Exception as e:
+        print(f"处理文本时出错: {e}")
+        return None
+    finally:
+        close_conversation_log(log)
+
+def main(api_key=None, base_url=None, model_name="deepseek-r1-250120"):
+    """主函数"""
+    global client
+    
+    # 如果没有提供API密钥，则请求输入
+    if not api_key:
+        api_key = input("请输入你的火山大模型 API 密钥: ").strip()
+    if not base_url:
+        base_url = input("请输入火山大模型的 Base URL: ").strip()
+    
+    # 初始化客户端
+    client = initialize_client(api_key, base_url)
+    
+    # 获取转录文本文件路径
+    text_file = input("请输入转录文本文件路径: ").strip()
+    
+    if not os.path.exists(text_file):
+        print("文件不存在！")
+        return
+    
+    # 处理文本
+    result_file = process_transcription(text_file, model_name)
+    
+    if result_file:
+        print(f"\n处理结果已保存到: {result_file}")
+        # 自动打开生成的文件
+        os.system(f"start {result_file}")
+
+# if __name__ == "__main__":
 #     main(os.getenv("ARK_API_KEY"), "https://ark.cn-beijing.volces.com/api/v3/")
\ No newline at end of file
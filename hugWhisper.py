@@ -1,182 +1,1273 @@
-import torch
-from transformers import AutoModelForSpeechSeq2Seq, AutoProcessor, pipeline
-import time
-import os
-import librosa
-import numpy as np
-from huggingface_hub import HfFolder, try_to_load_from_cache
-from transformers.utils import WEIGHTS_NAME, CONFIG_NAME
-
-# 全局变量
-model = None
-processor = None
-pipe = None
-
-def get_local_model_path(model_id, filename):
-    """获取本地模型文件路径"""
-    # 检查默认缓存目录
-    cache_file = try_to_load_from_cache(model_id, filename)
-    if cache_file and os.path.exists(cache_file):
-        return os.path.dirname(cache_file)
-    
-    # 检查用户主目录下的缓存
-    user_cache = os.path.expanduser("~/.cache/huggingface/hub")
-    if os.path.exists(user_cache):
-        model_cache = os.path.join(user_cache, model_id)
-        if os.path.exists(model_cache):
-            return model_cache
-            
-    return None
-
-def initialize_whisper():
-    """初始化Whisper模型"""
-    global model, processor, pipe
-    
-    if model is not None:
-        return True  # 已经初始化过了
-        
-    device = "cuda:0" if torch.cuda.is_available() else "cpu"
-    torch_dtype = torch.float16 if torch.cuda.is_available() else torch.float32
-    
-    # 打印系统信息
-    print("\n=== Whisper模型初始化 ===")
-    print(f"使用设备: {device}")
-    if torch.cuda.is_available():
-        print(f"CUDA版本: {torch.version.cuda}")
-        print(f"可用显存: {torch.cuda.get_device_properties(0).total_memory / 1024**3:.2f} GB")
-    
-    model_id = "openai/whisper-large-v3"
-    
-    try:
-        # 获取本地模型路径
-        local_model_path = get_local_model_path(model_id, CONFIG_NAME)
-        if not local_model_path:
-            raise ValueError(f"未找到本地模型文件，请确保已下载模型: {model_id}")
-            
-        print(f"使用本地模型: {local_model_path}")
-        
-        # 记录模型加载时间
-        start_time = time.time()
-        
-        # 从本地加载模型
-        model = AutoModelForSpeechSeq2Seq.from_pretrained(
-            local_model_path,
-            torch_dtype=torch_dtype,
-            low_cpu_mem_usage=False,
-            local_files_only=True  # 强制使用本地文件
-        ).to(device)
-        
-        processor = AutoProcessor.from_pretrained(
-            local_model_path,
-            local_files_only=True  # 强制使用本地文件
-        )
-        
-        pipe = pipeline(
-            "automatic-speech-recognition",
-            model=model,
-            tokenizer=processor.tokenizer,
-            feature_extractor=processor.feature_extractor,
-            chunk_length_s=30,
-            batch_size=16,
-            torch_dtype=torch_dtype,
-            device=device,
-        )
-        
-        load_time = time.time() - start_time
-        print(f"模型加载完成，耗时: {load_time:.2f} 秒")
-        
-        return True
-        
-    except Exception as e:
-        print(f"模型加载失败: {str(e)}")
-        return False
-
-def get_audio_info(file_path):
-    """获取音频文件信息"""
-    try:
-        # 获取文件大小
-        file_size = os.path.getsize(file_path) / (1024 * 1024)  # 转换为MB
-        
-        # 获取音频时长和采样率
-        audio_data, sample_rate = librosa.load(file_path, sr=None)
-        duration = librosa.get_duration(y=audio_data, sr=sample_rate)
-        
-        # 计算音频统计信息
-        mean_amplitude = np.mean(np.abs(audio_data))
-        max_amplitude = np.max(np.abs(audio_data))
-        
-        print("\n音频文件信息:")
-        print(f"文件大小: {file_size:.2f} MB")
-        print(f"音频时长: {duration:.2f} 秒")
-        print(f"采样率: {sample_rate} Hz")
-        print(f"平均振幅: {mean_amplitude:.4f}")
-        print(f"最大振幅: {max_amplitude:.4f}")
-        
-        return duration
-        
-    except Exception as e:
-        print(f"获取音频信息时出错: {e}")
-        return None
-
-def save_transcription(text, output_dir="txt"):
-    """保存转录文本到文件"""
-    try:
-        # 确保输出目录存在
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-        
-        # 保存文本
-        output_path = os.path.join(output_dir, "output.txt")
-        with open(output_path, "w", encoding="utf-8") as f:
-            f.write(text)
-        
-        print(f"\n转录文本已保存到: {output_path}")
-        return output_path
-    except Exception as e:
-        print(f"保存转录文本时出错: {e}")
-        return None
-
-def process_audio(file_path):
-    """处理音频文件并计时"""
-    try:
-        # 确保模型已初始化
-        initialize_whisper()
-        
-        # 获取音频信息
-        print(f"\n开始处理音频文件: {file_path}")
-        duration = get_audio_info(file_path)
-        
-        # 记录转录开始时间
-        transcribe_start = time.time()
-        
-        # 执行转录
-        result = pipe(file_path)
-        
-        # 计算处理时间
-        process_time = time.time() - transcribe_start
-        
-        print("\n处理结果:")
-        print(f"转录用时: {process_time:.2f} 秒")
-        if duration:
-            print(f"实时率: {duration/process_time:.2f}x")
-            print(f"每秒处理音频时长: {duration/process_time:.2f} 秒")
-        
-        # 保存转录文本
-        if result and "text" in result:
-            save_transcription(result["text"])
-        
-        return result
-        
-    except Exception as e:
-        print(f"处理音频时出错: {e}")
-        return None
-
-if __name__ == "__main__":
-    sample = r"F:\Whisper\audio\audio_59s.mp3"
-    
-    # 处理音频并获取结果
-    result = process_audio(sample)
-    
-    if result:
-        print("\n转录文本:")
-        print(result["text"])
+import torch
+from transformers import AutoModelForCausalLM, AutoModelForSpeechSeq2Seq, AutoProcessor, pipeline
+import time
+import os
+import librosa
+import numpy as np
+import hashlib
+import json
+import math
+import struct
+import gc
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from getAudio import extract_pcm, mapped_pcm, release_pcm
+from memoryMonitor import get_rss_mb, get_available_mb, track_memory
+from searchIndex import index_file
+from stageProfiler import profiler_step
+from huggingface_hub import HfFolder, try_to_load_from_cache
+from transformers.utils import WEIGHTS_NAME, CONFIG_NAME
+
+# 全局变量
+model = None
+processor = None
+pipe = None
+assistant_model = None  # 投机解码的草稿模型，未启用时为 None
+
+# 流水线参数
+CHUNK_LENGTH_S = 30   # 每个窗口的时长（秒）
+BATCH_SIZE = 16       # 每次前向计算的窗口数
+
+MODEL_ID = "openai/whisper-large-v3"
+
+# 投机解码没有默认草稿模型，需显式指定与 large-v3 共用编码器和分词器的草稿模型；
+# distil-whisper 系列只在英语数据上蒸馏，中文等其他语言的草稿接受率接近 0，投机解码反而比常规解码慢
+ENGLISH_ONLY_DRAFT_MODELS = (
+    "distil-whisper/distil-large-v3",
+    "distil-whisper/distil-large-v3.5",
+    "distil-whisper/distil-large-v2",
+)
+
+# ONNX 导出模型的缓存目录
+ONNX_CACHE_DIR = os.path.join("models", "onnx")
+
+# 模型内存管理
+MEMORY_BUDGET_MB = None   # 进程内存预算（MB），None 表示不限制
+IDLE_UNLOAD_S = None      # 模型空闲多久后自动卸载（秒），None 表示不自动卸载
+_last_used = 0.0
+_idle_timer = None
+_in_use = 0                      # 正在进行的转录数，大于 0 时不会卸载模型
+_model_lock = threading.RLock()  # 保护模型加载/卸载与上面的状态
+
+# 解码配置：按任务选择速度/质量的取舍
+# language 固定后每个窗口不再做语言检测；temperature 为元组时启用温度回退；
+# 语速较快的 30 秒中文窗口约 120-220 个 token（开启时间戳更多），max_new_tokens 不能再低，
+# 否则会静默截断转录文本，fast 只靠贪心解码提速，不限制长度
+DECODING_PROFILES = {
+    "fast": {
+        "language": "zh",
+        "task": "transcribe",
+        "num_beams": 1,
+    },
+    "balanced": {
+        "language": "zh",
+        "task": "transcribe",
+        "num_beams": 1,
+        "temperature": (0.0, 0.2, 0.4, 0.6),
+        "compression_ratio_threshold": 2.4,
+        "logprob_threshold": -1.0,
+        "max_new_tokens": 440,
+    },
+    "accurate": {
+        "language": "zh",
+        "task": "transcribe",
+        "num_beams": 5,
+        "temperature": (0.0, 0.2, 0.4, 0.6, 0.8, 1.0),
+        "compression_ratio_threshold": 2.4,
+        "logprob_threshold": -1.0,
+        "max_new_tokens": 440,
+    },
+}
+
+def get_generate_kwargs(profile=None, language=None):
+    """根据解码配置名生成 generate 参数，language 可覆盖配置中的语言"""
+    if profile is None:
+        generate_kwargs = {}
+    elif profile in DECODING_PROFILES:
+        generate_kwargs = dict(DECODING_PROFILES[profile])
+    else:
+        raise ValueError(f"未知的解码配置: {profile}，可选: {', '.join(DECODING_PROFILES)}")
+    if language:
+        generate_kwargs["language"] = language
+    return generate_kwargs
+
+def get_local_model_path(model_id, filename):
+    """获取本地模型文件路径"""
+    # 检查默认缓存目录
+    cache_file = try_to_load_from_cache(model_id, filename)
+    if cache_file and os.path.exists(cache_file):
+        return os.path.dirname(cache_file)
+    
+    # 检查用户主目录下的缓存
+    user_cache = os.path.expanduser("~/.cache/huggingface/hub")
+    if os.path.exists(user_cache):
+        model_cache = os.path.join(user_cache, model_id)
+        if os.path.exists(model_cache):
+            return model_cache
+            
+    return None
+
+def _build_pipeline(batch_size):
+    """使用已加载的模型构建语音识别流水线"""
+    device = "cuda:0" if torch.cuda.is_available() else "cpu"
+    torch_dtype = torch.float16 if torch.cuda.is_available() else torch.float32
+    return pipeline(
+        "automatic-speech-recognition",
+        model=model,
+        tokenizer=processor.tokenizer,
+        feature_extractor=processor.feature_extractor,
+        chunk_length_s=CHUNK_LENGTH_S,
+        batch_size=batch_size,
+        torch_dtype=torch_dtype,
+        device=device,
+    )
+
+def configure_model_manager(memory_budget_mb=None, idle_unload_s=None):
+    """设置模型内存预算和空闲卸载时间"""
+    global MEMORY_BUDGET_MB, IDLE_UNLOAD_S
+    MEMORY_BUDGET_MB = memory_budget_mb
+    IDLE_UNLOAD_S = idle_unload_s
+    touch_model()
+
+def _count_parameters(local_model_path):
+    """
+    统计模型目录中权重的参数数量
+
+    safetensors 只读取文件头中各张量的形状，不加载权重；同时存在 .bin 和 .safetensors 时只统计 safetensors，
+    避免同一份权重重复计算；只有 .bin 时以 mmap 方式读取（不分配权重内存）
+    """
+    safetensors_files = []
+    bin_files = []
+    for root, _, files in os.walk(local_model_path):
+        for name in files:
+            if name.endswith(".safetensors"):
+                safetensors_files.append(os.path.join(root, name))
+            elif name.endswith(".bin"):
+                bin_files.append(os.path.join(root, name))
+    
+    total = 0
+    if safetensors_files:
+        for path in safetensors_files:
+            with open(path, "rb") as f:
+                header_size = struct.unpack("<Q", f.read(8))[0]
+                header = json.loads(f.read(header_size))
+            for name, info in header.items():
+                if name != "__metadata__":
+                    total += math.prod(info["shape"])
+    else:
+        for path in bin_files:
+            state_dict = torch.load(path, map_location="cpu", mmap=True, weights_only=True)
+            total += sum(tensor.numel() for tensor in state_dict.values())
+    return total
+
+def estimate_model_size_mb(local_model_path, bytes_per_param=None):
+    """
+    估算模型加载后占用的内存 (MB)：参数数量 × 加载时的数据类型大小
+
+    权重文件的大小不能直接使用：large-v3 以 fp16 发布（约 3 GB），CPU 上按 float32 加载后约 6 GB；
+    bytes_per_param 默认与加载时一致（GPU 上 float16 为 2，CPU 上 float32 为 4）。
+    没有 PyTorch 权重的目录（已导出的 ONNX 模型）按 .onnx 文件大小估算
+    """
+    if bytes_per_param is None:
+        bytes_per_param = 2 if torch.cuda.is_available() else 4
+    parameters = _count_parameters(local_model_path)
+    if parameters:
+        return parameters * bytes_per_param / (1024 * 1024)
+    
+    total = 0
+    for root, _, files in os.walk(local_model_path):
+        for name in files:
+            if name.endswith((".onnx", ".onnx_data")):
+                total += os.path.getsize(os.path.join(root, name))
+    return total / (1024 * 1024)
+
+def check_memory_budget(required_mb):
+    """加载前检查内存预算，超出时抛出 MemoryError 而不是等待被系统 OOM 终止"""
+    if MEMORY_BUDGET_MB is None:
+        return
+    current_mb = get_rss_mb()
+    if current_mb is not None and current_mb + required_mb > MEMORY_BUDGET_MB:
+        raise MemoryError(
+            f"加载需要约 {required_mb:.0f} MB，当前已用 {current_mb:.0f} MB，超出内存预算 {MEMORY_BUDGET_MB} MB"
+        )
+
+def unload_whisper():
+    """释放 Whisper 模型、草稿模型和流水线"""
+    global model, processor, pipe, assistant_model
+    
+    if model is None and assistant_model is None:
+        return
+    model = processor = pipe = assistant_model = None
+    gc.collect()
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
+    print("Whisper 模型已卸载")
+
+def touch_model():
+    """记录模型使用时间，并重新开始空闲卸载计时（模型正在使用时不计时）"""
+    global _last_used, _idle_timer
+    with _model_lock:
+        _last_used = time.time()
+        if _idle_timer is not None:
+            _idle_timer.cancel()
+            _idle_timer = None
+        if IDLE_UNLOAD_S is not None and _in_use == 0:
+            _idle_timer = threading.Timer(IDLE_UNLOAD_S, _unload_if_idle)
+            _idle_timer.daemon = True
+            _idle_timer.start()
+
+@contextmanager
+def using_model():
+    """标记模型正在使用：期间不会被空闲卸载或超预算卸载，结束后重新开始空闲计时
+
+    流水线对可迭代输入返回惰性生成器，调用方需在结果迭代完之前保持在该上下文内
+    """
+    global _in_use
+    with _model_lock:
+        _in_use += 1
+    try:
+        yield
+    finally:
+        with _model_lock:
+            _in_use -= 1
+        touch_model()
+
+def _unload_if_idle():
+    """空闲计时到期后卸载当前引擎的模型（正在转录或刚被再次使用时跳过）"""
+    with _model_lock:
+        if IDLE_UNLOAD_S is None or engine is None or _in_use > 0:
+            return
+        if time.time() - _last_used < IDLE_UNLOAD_S:
+            return
+        print(f"\n模型已空闲 {IDLE_UNLOAD_S} 秒，自动卸载")
+        engine.unload()
+
+def release_if_over_budget():
+    """转录结束后若进程内存超出预算则立即卸载模型（其他转录仍在使用时跳过）"""
+    if MEMORY_BUDGET_MB is None or engine is None:
+        return
+    current_mb = get_rss_mb()
+    if current_mb is not None and current_mb > MEMORY_BUDGET_MB:
+        with _model_lock:
+            if _in_use > 0:
+                return
+            print(f"当前内存 {current_mb:.0f} MB 超出预算 {MEMORY_BUDGET_MB} MB，卸载模型")
+            engine.unload()
+
+def initialize_assistant(assistant_model_id):
+    """加载投机解码的草稿模型，并将流水线切换为单窗口批次（投机解码不支持批处理）"""
+    global assistant_model, pipe
+    
+    if assistant_model is not None:
+        return True
+    if assistant_model_id in ENGLISH_ONLY_DRAFT_MODELS:
+        print(f"注意: 草稿模型 {assistant_model_id} 只支持英语，非英语音频的草稿接受率接近 0，投机解码会比常规解码更慢")
+    
+    device = "cuda:0" if torch.cuda.is_available() else "cpu"
+    torch_dtype = torch.float16 if torch.cuda.is_available() else torch.float32
+    
+    try:
+        local_model_path = get_local_model_path(assistant_model_id, CONFIG_NAME)
+        if not local_model_path:
+            raise ValueError(f"未找到本地草稿模型文件，请确保已下载模型: {assistant_model_id}")
+        
+        print(f"使用草稿模型: {local_model_path}")
+        start_time = time.time()
+        check_memory_budget(estimate_model_size_mb(local_model_path))
+        
+        assistant_model = AutoModelForCausalLM.from_pretrained(
+            local_model_path,
+            torch_dtype=torch_dtype,
+            low_cpu_mem_usage=True,
+            local_files_only=True
+        ).to(device)
+        
+        if pipe is not None:
+            pipe = _build_pipeline(batch_size=1)
+        
+        print(f"草稿模型加载完成，耗时: {time.time() - start_time:.2f} 秒")
+        return True
+        
+    except Exception as e:
+        print(f"草稿模型加载失败: {str(e)}")
+        return False
+
+def initialize_whisper(assistant_model_id=None):
+    """初始化Whisper模型
+
+    assistant_model_id 不为 None 时同时加载草稿模型，启用投机解码（assisted generation）：
+    草稿模型先生成候选 token，由 large-v3 一次前向验证，输出与单独使用 large-v3 一致
+    """
+    global model, processor, pipe
+    
+    if model is not None:
+        # 已经初始化过了，按需补充加载草稿模型
+        if assistant_model_id:
+            return initialize_assistant(assistant_model_id)
+        return True
+        
+    device = "cuda:0" if torch.cuda.is_available() else "cpu"
+    torch_dtype = torch.float16 if torch.cuda.is_available() else torch.float32
+    
+    # 打印系统信息
+    print("\n=== Whisper模型初始化 ===")
+    print(f"使用设备: {device}")
+    if torch.cuda.is_available():
+        print(f"CUDA版本: {torch.version.cuda}")
+        print(f"可用显存: {torch.cuda.get_device_properties(0).total_memory / 1024**3:.2f} GB")
+    
+    model_id = MODEL_ID
+    
+    try:
+        # 获取本地模型路径
+        local_model_path = get_local_model_path(model_id, CONFIG_NAME)
+        if not local_model_path:
+            raise ValueError(f"未找到本地模型文件，请确保已下载模型: {model_id}")
+            
+        print(f"使用本地模型: {local_model_path}")
+        check_memory_budget(estimate_model_size_mb(local_model_path))
+        
+        # 记录模型加载时间
+        start_time = time.time()
+        
+        # 从本地加载模型（low_cpu_mem_usage 跳过随机初始化的权重，避免加载时两份权重同时驻留；
+        # CPU 上 fp16 权重会转换为 float32，内存按转换后的大小计算，见 estimate_model_size_mb）
+        model = AutoModelForSpeechSeq2Seq.from_pretrained(
+            local_model_path,
+            torch_dtype=torch_dtype,
+            low_cpu_mem_usage=True,
+            local_files_only=True  # 强制使用本地文件
+        ).to(device)
+        
+        processor = AutoProcessor.from_pretrained(
+            local_model_path,
+            local_files_only=True  # 强制使用本地文件
+        )
+        # 每个批次的编码器前向即一步，性能分析时据此推进 PyTorch 分析器的记录窗口
+        model.get_encoder().register_forward_pre_hook(lambda module, args: profiler_step())
+        
+        pipe = _build_pipeline(batch_size=BATCH_SIZE)
+        
+        load_time = time.time() - start_time
+        print(f"模型加载完成，耗时: {load_time:.2f} 秒")
+        touch_model()
+        
+        if assistant_model_id:
+            return initialize_assistant(assistant_model_id)
+        return True
+        
+    except Exception as e:
+        print(f"模型加载失败: {str(e)}")
+        return False
+
+class ASREngine:
+    """语音识别引擎接口：process_audio 等函数只通过 load/transcribe 调用具体实现"""
+    name = None
+    
+    def __init__(self, **options):
+        self.options = options  # 保存构造参数，分片子进程据此重建同样的引擎
+    
+    def load(self):
+        """加载模型，成功返回 True"""
+        raise NotImplementedError
+    
+    def transcribe(self, inputs, generate_kwargs=None, batch_size=None, return_timestamps=False):
+        """转录，输入/输出格式与 transformers 语音识别流水线一致；return_timestamps 为 True 时结果带 chunks 时间戳"""
+        raise NotImplementedError
+    
+    def unload(self):
+        """释放模型占用的内存"""
+        raise NotImplementedError
+
+class TransformersEngine(ASREngine):
+    """默认引擎：transformers 流水线（PyTorch）"""
+    name = "transformers"
+    
+    def load(self):
+        with _model_lock:
+            return initialize_whisper(self.options.get("assistant_model_id"))
+    
+    def transcribe(self, inputs, generate_kwargs=None, batch_size=None, return_timestamps=False):
+        generate_kwargs = dict(generate_kwargs or {})
+        # 投机解码只支持贪心/采样，束搜索配置下不启用草稿模型
+        if assistant_model is not None and generate_kwargs.get("num_beams", 1) == 1:
+            generate_kwargs["assistant_model"] = assistant_model
+        kwargs = {"generate_kwargs": generate_kwargs}
+        if batch_size:
+            kwargs["batch_size"] = batch_size
+        if return_timestamps:
+            kwargs["return_timestamps"] = True
+        with using_model():
+            return pipe(inputs, **kwargs)
+    
+    def unload(self):
+        with _model_lock:
+            unload_whisper()
+
+class OnnxEngine(ASREngine):
+    """ONNX Runtime CPU 引擎：首次使用时导出编码器/解码器并缓存到磁盘"""
+    name = "onnx"
+    
+    def __init__(self, model_id=MODEL_ID, cache_dir=ONNX_CACHE_DIR, intra_op_threads=0, inter_op_threads=1):
+        super().__init__(model_id=model_id, cache_dir=cache_dir, intra_op_threads=intra_op_threads, inter_op_threads=inter_op_threads)
+        self.model_id = model_id
+        self.export_dir = os.path.join(cache_dir, model_id.replace("/", "--"))
+        self.intra_op_threads = intra_op_threads
+        self.inter_op_threads = inter_op_threads
+        self.pipe = None
+    
+    def load(self):
+        with _model_lock:
+            return self._load()
+    
+    def _load(self):
+        if self.pipe is not None:
+            return True
+        try:
+            import onnxruntime as ort
+            from optimum.onnxruntime import ORTModelForSpeechSeq2Seq
+        except ImportError:
+            print("ONNX 引擎需要安装 onnxruntime 和 optimum[onnxruntime]")
+            return False
+        
+        print("\n=== ONNX Runtime 引擎初始化 ===")
+        try:
+            session_options = ort.SessionOptions()
+            session_options.intra_op_num_threads = self.intra_op_threads  # 0 表示使用全部物理核
+            session_options.inter_op_num_threads = self.inter_op_threads
+            session_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            
+            start_time = time.time()
+            if os.path.exists(os.path.join(self.export_dir, CONFIG_NAME)):
+                # 直接加载已导出的计算图
+                print(f"使用已导出的 ONNX 模型: {self.export_dir}")
+                source_path = self.export_dir
+                export = False
+            else:
+                source_path = get_local_model_path(self.model_id, CONFIG_NAME)
+                if not source_path:
+                    raise ValueError(f"未找到本地模型文件，请确保已下载模型: {self.model_id}")
+                print(f"首次使用，正在导出 ONNX 模型: {source_path}")
+                export = True
+            check_memory_budget(estimate_model_size_mb(source_path))
+            
+            ort_model = ORTModelForSpeechSeq2Seq.from_pretrained(
+                source_path,
+                export=export,
+                provider="CPUExecutionProvider",
+                session_options=session_options,
+                local_files_only=True
+            )
+            onnx_processor = AutoProcessor.from_pretrained(source_path, local_files_only=True)
+            if export:
+                ort_model.save_pretrained(self.export_dir)
+                onnx_processor.save_pretrained(self.export_dir)
+                print(f"ONNX 模型已缓存到: {self.export_dir}")
+            
+            self.pipe = pipeline(
+                "automatic-speech-recognition",
+                model=ort_model,
+                tokenizer=onnx_processor.tokenizer,
+                feature_extractor=onnx_processor.feature_extractor,
+                chunk_length_s=CHUNK_LENGTH_S,
+                batch_size=BATCH_SIZE,
+            )
+            print(f"模型加载完成，耗时: {time.time() - start_time:.2f} 秒")
+            return True
+            
+        except Exception as e:
+            print(f"ONNX 模型加载失败: {str(e)}")
+            return False
+    
+    def transcribe(self, inputs, generate_kwargs=None, batch_size=None, return_timestamps=False):
+        kwargs = {"generate_kwargs": dict(generate_kwargs or {})}
+        if batch_size:
+            kwargs["batch_size"] = batch_size
+        if return_timestamps:
+            kwargs["return_timestamps"] = True
+        with using_model():
+            return self.pipe(inputs, **kwargs)
+    
+    def unload(self):
+        with _model_lock:
+            if self.pipe is not None:
+                self.pipe = None
+                gc.collect()
+                print("ONNX 模型已卸载")
+
+ENGINES = {
+    TransformersEngine.name: TransformersEngine,
+    OnnxEngine.name: OnnxEngine,
+}
+
+# 当前使用的引擎
+engine = None
+
+def set_engine(name="transformers", **options):
+    """切换语音识别引擎，options 传给引擎构造函数（如 ONNX 的线程数）"""
+    global engine
+    if name not in ENGINES:
+        raise ValueError(f"未知的语音识别引擎: {name}，可选: {', '.join(ENGINES)}")
+    engine = ENGINES[name](**options)
+    return engine
+
+def get_engine():
+    """获取当前引擎，未设置时使用 transformers 引擎"""
+    if engine is None:
+        set_engine()
+    return engine
+
+def get_audio_info(file_path):
+    """获取音频文件信息，file_path 也可以是 extract_pcm 返回的 PCM 描述符"""
+    try:
+        if isinstance(file_path, dict):
+            # PCM 描述符：直接映射，无需再次解码
+            file_size = file_path["samples"] * 4 / (1024 * 1024)
+            sample_rate = file_path["sample_rate"]
+            duration = file_path["samples"] / sample_rate
+            with mapped_pcm(file_path) as audio_data:
+                mean_amplitude = np.mean(np.abs(audio_data))
+                max_amplitude = np.max(np.abs(audio_data))
+        else:
+            # 获取文件大小
+            file_size = os.path.getsize(file_path) / (1024 * 1024)  # 转换为MB
+            
+            # 获取音频时长和采样率
+            audio_data, sample_rate = librosa.load(file_path, sr=None)
+            duration = librosa.get_duration(y=audio_data, sr=sample_rate)
+            
+            # 计算音频统计信息
+            mean_amplitude = np.mean(np.abs(audio_data))
+            max_amplitude = np.max(np.abs(audio_data))
+        
+        print("\n音频文件信息:")
+        print(f"文件大小: {file_size:.2f} MB")
+        print(f"音频时长: {duration:.2f} 秒")
+        print(f"采样率: {sample_rate} Hz")
+        print(f"平均振幅: {mean_amplitude:.4f}")
+        print(f"最大振幅: {max_amplitude:.4f}")
+        
+        return duration
+        
+    except Exception as e:
+        print(f"获取音频信息时出错: {e}")
+        return None
+
+def save_transcription(text, output_dir="txt", filename="output.txt", segments=None, source=None):
+    """保存转录文本到文件并更新检索索引
+
+    segments 为带时间区间的分段（分片/流式转录或开启时间戳时提供），source 为来源视频/音频路径，一并记入索引
+    """
+    try:
+        # 确保输出目录存在
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+        
+        # 保存文本
+        output_path = os.path.join(output_dir, filename)
+        with open(output_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        
+        print(f"\n转录文本已保存到: {output_path}")
+        index_file(output_path, segments=segments, source=source)
+        return output_path
+    except Exception as e:
+        print(f"保存转录文本时出错: {e}")
+        return None
+
+# 分片转录参数
+SHARD_SAMPLE_RATE = 16000   # Whisper 要求的采样率
+SHARD_LENGTH_S = 300        # 目标分片时长（秒）
+SHARD_OVERLAP_S = 2         # 相邻分片的重叠时长（秒）
+SHARD_OVERLAP_CHARS = 32    # 重叠部分转录文本的最大长度（2 秒语音约 10 个汉字或 30 个英文字符）
+SHARD_SEARCH_S = 20         # 在目标切点前后搜索静音的范围（秒）
+SHARD_WORKER_OVERHEAD_MB = 1024  # 每个分片进程除模型权重外的内存（运行时、特征、激活等）
+
+def find_shard_boundaries(audio_data, sample_rate, shard_length_s=SHARD_LENGTH_S, search_s=SHARD_SEARCH_S, top_db=30):
+    """在静音处寻找分片切点，返回 [(start, end), ...] 采样点区间（不含重叠）"""
+    total = len(audio_data)
+    shard_len = int(shard_length_s * sample_rate)
+    if total <= shard_len:
+        return [(0, total)]
+    
+    # 非静音区间之间的空隙即为静音，取其中点作为候选切点
+    intervals = librosa.effects.split(audio_data, top_db=top_db)
+    candidates = np.array([
+        (intervals[i][1] + intervals[i + 1][0]) // 2
+        for i in range(len(intervals) - 1)
+    ], dtype=np.int64)
+    
+    search = int(search_s * sample_rate)
+    boundaries = []
+    start = 0
+    while total - start > shard_len:
+        target = start + shard_len
+        cut = target
+        if len(candidates):
+            # 选择搜索范围内离目标切点最近的静音位置
+            near = candidates[(candidates > start) & (np.abs(candidates - target) <= search)]
+            if len(near):
+                cut = int(near[np.argmin(np.abs(near - target))])
+        boundaries.append((start, cut))
+        start = cut
+    boundaries.append((start, total))
+    return boundaries
+
+def merge_overlap_text(prev_text, next_text, max_chars=SHARD_OVERLAP_CHARS, min_match=3, slack=2):
+    """
+    拼接相邻分片文本，去除重叠部分重复转录的内容
+
+    重叠只有 SHARD_OVERLAP_S 秒，只在前一片末尾和后一片开头对齐：
+    前一片的后缀与后一片的前缀相同（两端各允许 slack 个字的边缘误差，长度不超过 max_chars）才视为重叠；
+    对不上时直接拼接，宁可重复几个字也不丢内容
+    """
+    if not prev_text:
+        return next_text
+    if not next_text:
+        return prev_text
+    
+    best = None  # (前一片保留到的位置, 后一片跳过的字数, 重叠长度)
+    for skip_prev in range(slack + 1):
+        end = len(prev_text) - skip_prev
+        for skip_next in range(slack + 1):
+            limit = min(max_chars, end, len(next_text) - skip_next)
+            for size in range(limit, min_match - 1, -1):
+                if prev_text[end - size:end] == next_text[skip_next:skip_next + size]:
+                    if best is None or size > best[2]:
+                        best = (end, skip_next, size)
+                    break
+    if best is None:
+        return prev_text + next_text
+    
+    end, skip_next, size = best
+    return prev_text[:end] + next_text[skip_next + size:]
+
+def chunk_segments(chunks, offset=0.0, keep_from=None, keep_until=None, default_end=None):
+    """
+    将流水线 return_timestamps 产出的 chunks 转为检索分段 [{"start", "end", "text"}]
+
+    chunk 的时间戳相对于送入引擎的音频，加上 offset（秒）得到整段音频中的时间；
+    只保留开始时间落在 [keep_from, keep_until) 内的片段，避免重叠区域重复索引；
+    最后一个 chunk 的结束时间可能为 None，此时使用 default_end
+    """
+    segments = []
+    for chunk in chunks or ():
+        start, end = chunk.get("timestamp") or (None, None)
+        if start is None:
+            continue
+        start += offset
+        end = end + offset if end is not None else default_end
+        if keep_from is not None and start < keep_from:
+            continue
+        if keep_until is not None and start >= keep_until:
+            continue
+        text = chunk["text"].strip()
+        if text:
+            segments.append({"start": start, "end": end if end is not None else start, "text": text})
+    return segments
+
+def estimate_shard_worker_mb():
+    """估算单个分片进程的内存占用 (MB)：每个进程各自以 float32 加载一份完整模型（large-v3 约 6 GB）加运行开销"""
+    model_id = get_engine().options.get("model_id", MODEL_ID)
+    local_model_path = get_local_model_path(model_id, CONFIG_NAME)
+    # 分片只在 CPU 上进行，权重按 float32 计算
+    model_mb = estimate_model_size_mb(local_model_path, bytes_per_param=4) if local_model_path else 0
+    return model_mb + SHARD_WORKER_OVERHEAD_MB
+
+def max_shard_workers():
+    """按内存预算（未设置时按系统可用内存）计算最多能同时运行的分片进程数，无法估算时返回 None"""
+    if MEMORY_BUDGET_MB is not None:
+        available_mb = MEMORY_BUDGET_MB - (get_rss_mb() or 0)
+    else:
+        available_mb = get_available_mb()
+    if available_mb is None:
+        return None
+    return max(1, int(available_mb // estimate_shard_worker_mb()))
+
+def _init_shard_worker(threads_per_worker, engine_name, engine_options):
+    """分片进程初始化：固定每个进程的线程数并加载与主进程相同的引擎"""
+    torch.set_num_threads(threads_per_worker)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass  # 线程池已启动时无法再设置
+    if engine_name == OnnxEngine.name:
+        engine_options = dict(engine_options, intra_op_threads=threads_per_worker)
+    set_engine(engine_name, **engine_options).load()
+
+def _transcribe_shard(shard):
+    """在子进程中转录单个分片（按描述符零拷贝映射 PCM），返回分片序号、文本和 chunks（开启时间戳时）"""
+    index, descriptor, start, end, generate_kwargs, timestamps = shard
+    with mapped_pcm(descriptor) as audio_data:
+        result = get_engine().transcribe(
+            {"raw": audio_data[start:end], "sampling_rate": descriptor["sample_rate"]},
+            generate_kwargs=generate_kwargs,
+            return_timestamps=timestamps
+        )
+    if not result:
+        return index, "", []
+    return index, result["text"], result.get("chunks", [])
+
+def transcribe_sharded(file_path, num_workers=None, shard_length_s=SHARD_LENGTH_S, overlap_s=SHARD_OVERLAP_S, generate_kwargs=None, timestamps=False):
+    """将长音频按静音切分为重叠分片，多进程并行转录后拼接
+
+    file_path 可以是音频文件路径或 PCM 描述符；传入路径时先解码到共享内存，
+    子进程只接收描述符和采样区间；
+    每个子进程各自加载完整模型（见 estimate_shard_worker_mb），进程数不超过 max_shard_workers()；
+    timestamps 为 True 时流水线返回时间戳，segments 精确到句，否则每个分片一段
+    """
+    if num_workers is None:
+        num_workers = os.cpu_count() or 1
+    worker_limit = max_shard_workers()
+    if worker_limit is not None and num_workers > worker_limit:
+        print(f"每个分片进程约需 {estimate_shard_worker_mb():.0f} MB 内存，进程数由 {num_workers} 降为 {worker_limit}")
+        num_workers = worker_limit
+    threads_per_worker = max(1, (os.cpu_count() or 1) // num_workers)
+    
+    owned = not isinstance(file_path, dict)
+    descriptor = extract_pcm(file_path, sample_rate=SHARD_SAMPLE_RATE, shared=True) if owned else file_path
+    try:
+        sample_rate = descriptor["sample_rate"]
+        with mapped_pcm(descriptor) as audio_data:
+            boundaries = find_shard_boundaries(audio_data, sample_rate, shard_length_s)
+        
+        overlap = int(overlap_s * sample_rate)
+        shards = []
+        for i, (start, end) in enumerate(boundaries):
+            shard_start = max(0, start - overlap)
+            shard_end = min(descriptor["samples"], end + overlap)
+            shards.append((i, descriptor, shard_start, shard_end, generate_kwargs or {}, timestamps))
+        
+        print(f"音频已切分为 {len(shards)} 个分片，使用 {num_workers} 个进程，每进程 {threads_per_worker} 线程")
+        
+        texts = [""] * len(shards)
+        chunks = [[] for _ in shards]
+        with ProcessPoolExecutor(
+            max_workers=min(num_workers, len(shards)),
+            initializer=_init_shard_worker,
+            initargs=(threads_per_worker, get_engine().name, get_engine().options)
+        ) as executor:
+            for index, text, shard_chunks in executor.map(_transcribe_shard, shards):
+                texts[index] = text
+                chunks[index] = shard_chunks
+    finally:
+        if owned:
+            release_pcm(descriptor)
+    
+    merged = ""
+    for text in texts:
+        merged = merge_overlap_text(merged, text.strip())
+    if not timestamps:
+        # 各分片（不含重叠）的时间区间
+        segments = [
+            {"start": start / sample_rate, "end": end / sample_rate, "text": text.strip()}
+            for (start, end), text in zip(boundaries, texts)
+        ]
+        return {"text": merged, "segments": segments}
+    
+    # chunk 时间戳加上分片起点得到全局时间；重叠区域只保留切点所在一侧的 chunk
+    segments = []
+    for (start, end), (_, _, shard_start, shard_end, _, _), shard_chunks in zip(boundaries, shards, chunks):
+        segments.extend(chunk_segments(
+            shard_chunks,
+            offset=shard_start / sample_rate,
+            keep_from=start / sample_rate,
+            keep_until=end / sample_rate,
+            default_end=shard_end / sample_rate
+        ))
+    return {"text": merged, "segments": segments}
+
+def benchmark_sharded(file_path, worker_counts=(1, 2, 4, 8, 16, 32)):
+    """
+    测试不同进程数下分片转录的实时率
+
+    每个进程各自加载完整模型，内存占用约为 进程数 × estimate_shard_worker_mb()；
+    超过 max_shard_workers() 的进程数会被跳过，避免测试过程中被系统 OOM 终止
+    """
+    duration = get_audio_info(file_path)
+    results = []
+    worker_mb = estimate_shard_worker_mb()
+    worker_limit = max_shard_workers()
+
+    print("\n=== 分片转录实时率测试 ===")
+    print(f"每进程约需 {worker_mb:.0f} MB 内存，最多 {worker_limit or '不限'} 个进程")
+    for num_workers in worker_counts:
+        if worker_limit is not None and num_workers > worker_limit:
+            print(f"进程数 {num_workers:>3}: 需要约 {num_workers * worker_mb:.0f} MB 内存，超出可用内存，跳过")
+            continue
+        start_time = time.time()
+        transcribe_sharded(file_path, num_workers=num_workers)
+        process_time = time.time() - start_time
+        rtf = process_time / duration if duration else None
+        results.append({"workers": num_workers, "time": process_time, "rtf": rtf})
+        if rtf:
+            print(f"进程数 {num_workers:>3}: 用时 {process_time:.2f} 秒, RTF {rtf:.3f}, 实时率 {1/rtf:.2f}x")
+        else:
+            print(f"进程数 {num_workers:>3}: 用时 {process_time:.2f} 秒")
+    
+    return results
+
+def count_windows(num_samples, sample_rate, chunk_length_s=CHUNK_LENGTH_S):
+    """计算流水线对一段音频切出的窗口数（与 transformers 的 chunk_iter 一致）"""
+    chunk_len = int(round(chunk_length_s * sample_rate))
+    stride = int(round(chunk_length_s / 6 * sample_rate))  # 流水线默认左右各 1/6 重叠
+    step = chunk_len - 2 * stride
+    if num_samples <= chunk_len:
+        return 1
+    return -(-(num_samples - chunk_len) // step) + 1
+
+def _iter_batch_inputs(sources, window_counts):
+    """按顺序解码输入并交给流水线，同时记录每个输入的窗口数"""
+    for source in sources:
+        if isinstance(source, dict):
+            with mapped_pcm(source) as audio_data:
+                window_counts.append(count_windows(len(audio_data), source["sample_rate"]))
+                yield {"raw": audio_data, "sampling_rate": source["sample_rate"]}
+        else:
+            audio_data, sample_rate = librosa.load(source, sr=SHARD_SAMPLE_RATE)
+            window_counts.append(count_windows(len(audio_data), sample_rate))
+            yield {"raw": audio_data, "sampling_rate": sample_rate}
+
+def transcript_filename(source):
+    """转录文本文件名：<文件名>_<完整路径哈希>.txt，不同来源的转录不会互相覆盖，同一来源重新转录时替换"""
+    name = source.get("path") or source.get("name") if isinstance(source, dict) else source
+    digest = hashlib.sha1(os.path.abspath(name).encode("utf-8")).hexdigest()[:8]
+    return f"{os.path.splitext(os.path.basename(name))[0]}_{digest}.txt"
+
+def transcribe_batch(sources, batch_size=BATCH_SIZE, output_dir="txt", profile=None, language=None, timestamps=False):
+    """
+    批量转录多个音频，将不同文件的 30 秒窗口拼成满批次进行前向计算
+
+    参数:
+        sources (list): 音频文件路径或 PCM 描述符列表
+        batch_size (int): 每批窗口数
+        output_dir (str): 转录文本输出目录（文件名见 transcript_filename），为 None 时不保存
+        profile (str): 解码配置名（见 DECODING_PROFILES），None 使用模型默认设置
+        language (str): 强制指定语言，覆盖配置中的语言
+        timestamps (bool): 为 True 时流水线返回时间戳，检索索引按句记录时间
+
+    返回:
+        (list, dict): 与 sources 一一对应的转录结果，以及批次占用率统计
+            （occupancy 为编码器实测值，theoretical_occupancy 为按窗口数计算的理论值）
+    """
+    asr_engine = get_engine()
+    with using_model():
+        asr_engine.load()
+        if assistant_model is not None and batch_size > 1:
+            print("已启用投机解码，批次大小固定为 1")
+            batch_size = 1
+        
+        window_counts = []
+        batch_sizes = []
+        results = []
+        start_time = time.time()
+        
+        # transformers 引擎在编码器上挂钩子，记录每次前向计算实际的批次大小
+        hook = None
+        if isinstance(asr_engine, TransformersEngine) and model is not None:
+            def count_batch(module, args, kwargs, output):
+                features = kwargs.get("input_features", args[0] if args else None)
+                if features is not None:
+                    batch_sizes.append(features.shape[0])
+            hook = model.get_encoder().register_forward_hook(count_batch, with_kwargs=True)
+        
+        try:
+            # 流水线对可迭代输入按窗口组批，跨文件连续填充，结果按输入顺序返回
+            for source, result in zip(sources, asr_engine.transcribe(
+                _iter_batch_inputs(sources, window_counts),
+                batch_size=batch_size,
+                generate_kwargs=get_generate_kwargs(profile, language),
+                return_timestamps=timestamps
+            )):
+                results.append(result)
+                if output_dir and result and "text" in result:
+                    name = source.get("path") if isinstance(source, dict) else source
+                    save_transcription(result["text"], output_dir, transcript_filename(source),
+                                       segments=chunk_segments(result.get("chunks")), source=name)
+        finally:
+            if hook is not None:
+                hook.remove()
+    
+    process_time = time.time() - start_time
+    total_windows = sum(window_counts)
+    packed_batches = -(-total_windows // batch_size)
+    per_file_batches = sum(-(-count // batch_size) for count in window_counts)
+    stats = {
+        "files": len(results),
+        "windows": total_windows,
+        "theoretical_batches": packed_batches,
+        "theoretical_occupancy": total_windows / (packed_batches * batch_size) if packed_batches else 0,
+        "per_file_occupancy": total_windows / (per_file_batches * batch_size) if per_file_batches else 0,
+        # 实测值：编码器实际执行的批次（无法挂钩子的引擎为 None）
+        "batches": len(batch_sizes) if hook is not None else None,
+        "occupancy": sum(batch_sizes) / (len(batch_sizes) * batch_size) if batch_sizes else None,
+        "time": process_time
+    }
+    
+    print("\n批量转录结果:")
+    print(f"文件数: {stats['files']}, 窗口数: {stats['windows']}")
+    if stats["occupancy"] is not None:
+        print(f"实测: {stats['batches']} 个批次, 批次占用率 {stats['occupancy']:.1%}")
+    print(f"理论: {stats['theoretical_batches']} 个批次, 批次占用率 {stats['theoretical_occupancy']:.1%}"
+          f"（逐文件处理时为 {stats['per_file_occupancy']:.1%}）")
+    print(f"转录用时: {process_time:.2f} 秒")
+    
+    return results, stats
+
+def word_error_rate(reference, hypothesis):
+    """计算词错误率；中日韩文字按单字切分（即 CER），其余按空格切词，忽略标点"""
+    def tokenize(text):
+        tokens = []
+        word = ""
+        for char in text:
+            if "\u4e00" <= char <= "\u9fff" or "\u3040" <= char <= "\u30ff" or "\uac00" <= char <= "\ud7af":
+                if word:
+                    tokens.append(word)
+                    word = ""
+                tokens.append(char)
+            elif char.isalnum():
+                word += char.lower()
+            elif word:
+                tokens.append(word)
+                word = ""
+        if word:
+            tokens.append(word)
+        return tokens
+    
+    ref = tokenize(reference)
+    hyp = tokenize(hypothesis)
+    if not ref:
+        return 0.0 if not hyp else 1.0
+    
+    # 编辑距离（逐行动态规划）
+    previous = list(range(len(hyp) + 1))
+    for i, ref_token in enumerate(ref, 1):
+        current = [i] + [0] * len(hyp)
+        for j, hyp_token in enumerate(hyp, 1):
+            current[j] = min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (ref_token != hyp_token)
+            )
+        previous = current
+    return previous[-1] / len(ref)
+
+def benchmark_profiles(references, profiles=tuple(DECODING_PROFILES), language=None):
+    """
+    在本地参考音频上比较各解码配置的实时率与词错误率
+
+    参数:
+        references (list): [(音频路径, 参考文本路径), ...]
+        profiles (tuple): 要测试的配置名
+        language (str): 强制指定语言
+    """
+    asr_engine = get_engine()
+    asr_engine.load()
+    
+    clips = []
+    for audio_path, reference_path in references:
+        with open(reference_path, "r", encoding="utf-8") as f:
+            clips.append((audio_path, f.read(), librosa.get_duration(path=audio_path)))
+    total_duration = sum(duration for _, _, duration in clips)
+    
+    results = []
+    print("\n=== 解码配置测试 ===")
+    for profile in profiles:
+        generate_kwargs = get_generate_kwargs(profile, language)
+        errors = []
+        start_time = time.time()
+        for audio_path, reference, _ in clips:
+            result = asr_engine.transcribe(audio_path, generate_kwargs=generate_kwargs)
+            errors.append(word_error_rate(reference, result["text"] if result else ""))
+        process_time = time.time() - start_time
+        
+        row = {
+            "profile": profile,
+            "rtf": process_time / total_duration if total_duration else None,
+            "wer": sum(errors) / len(errors) if errors else None,
+            "time": process_time
+        }
+        results.append(row)
+        print(f"{profile:<10} RTF {row['rtf'] or 0:.3f}  WER {row['wer'] or 0:.2%}  用时 {process_time:.2f} 秒")
+    
+    return results
+
+def benchmark_assisted(audio_paths, assistant_model_id, language="zh"):
+    """
+    在固定的本地短音频（不超过 30 秒）上测试投机解码的加速比和草稿接受率
+
+    assistant_model_id 需与 large-v3 共用分词器，且覆盖 language 对应的语言（见 ENGLISH_ONLY_DRAFT_MODELS）；
+
+    接受率 = (生成 token 数 - 主模型解码步数) / 草稿 token 数；
+    每轮验证主模型前向一次，接受 n 个草稿 token 并额外产出 1 个 token
+    """
+    if not initialize_whisper(assistant_model_id):
+        return None
+    
+    device = model.device
+    counters = {"target": 0, "draft": 0}
+    
+    def count_calls(name):
+        def hook(module, args, output):
+            counters[name] += 1
+        return hook
+    
+    hooks = [
+        model.model.decoder.register_forward_hook(count_calls("target")),
+        assistant_model.model.decoder.register_forward_hook(count_calls("draft")),
+    ]
+    
+    totals = {"baseline": 0.0, "assisted": 0.0, "generated": 0, "target": 0, "draft": 0, "identical": 0}
+    try:
+        for audio_path in audio_paths:
+            audio_data, sample_rate = librosa.load(audio_path, sr=SHARD_SAMPLE_RATE)
+            features = processor(audio_data, sampling_rate=sample_rate, return_tensors="pt").input_features
+            features = features.to(device, dtype=model.dtype)
+            
+            with torch.inference_mode():
+                start_time = time.time()
+                baseline_ids = model.generate(features, language=language, task="transcribe")
+                totals["baseline"] += time.time() - start_time
+                
+                counters["target"] = counters["draft"] = 0
+                start_time = time.time()
+                assisted_ids = model.generate(features, language=language, task="transcribe", assistant_model=assistant_model)
+                totals["assisted"] += time.time() - start_time
+            
+            totals["generated"] += assisted_ids.shape[-1]
+            totals["target"] += counters["target"]
+            totals["draft"] += counters["draft"]
+            totals["identical"] += int(torch.equal(baseline_ids, assisted_ids))
+    finally:
+        for hook in hooks:
+            hook.remove()
+    
+    speedup = totals["baseline"] / totals["assisted"] if totals["assisted"] else None
+    acceptance = (totals["generated"] - totals["target"]) / totals["draft"] if totals["draft"] else None
+    
+    print("\n=== 投机解码测试 ===")
+    print(f"测试音频: {len(audio_paths)} 段")
+    print(f"常规解码: {totals['baseline']:.2f} 秒, 投机解码: {totals['assisted']:.2f} 秒, 加速比: {speedup or 0:.2f}x")
+    print(f"草稿接受率: {acceptance or 0:.1%}")
+    print(f"输出一致: {totals['identical']}/{len(audio_paths)}")
+    
+    return {"speedup": speedup, "acceptance_rate": acceptance, **totals}
+
+def benchmark_engines(audio_paths, engines=(("transformers", {}), ("onnx", {})), profile=None, language=None):
+    """
+    比较不同语音识别引擎在同一组本地音频上的实时率
+
+    参数:
+        audio_paths (list): 测试音频路径
+        engines (tuple): [(引擎名, 构造参数), ...]
+    """
+    global engine
+    previous_engine = engine
+    generate_kwargs = get_generate_kwargs(profile, language)
+    total_duration = sum(librosa.get_duration(path=audio_path) for audio_path in audio_paths)
+    
+    results = []
+    print("\n=== 语音识别引擎对比 ===")
+    try:
+        for name, options in engines:
+            asr_engine = set_engine(name, **options)
+            if not asr_engine.load():
+                continue
+            # 预热一次，排除首次运行的初始化开销
+            asr_engine.transcribe(audio_paths[0], generate_kwargs=generate_kwargs)
+            
+            start_time = time.time()
+            for audio_path in audio_paths:
+                asr_engine.transcribe(audio_path, generate_kwargs=generate_kwargs)
+            process_time = time.time() - start_time
+            
+            rtf = process_time / total_duration if total_duration else None
+            results.append({"engine": name, "options": options, "time": process_time, "rtf": rtf})
+            print(f"{name:<14} 用时 {process_time:.2f} 秒, RTF {rtf or 0:.3f}, 实时率 {1 / rtf if rtf else 0:.2f}x")
+    finally:
+        engine = previous_engine
+    
+    return results
+
+def iter_windows(blocks, sample_rate, window_s=CHUNK_LENGTH_S, overlap_s=SHARD_OVERLAP_S):
+    """将任意长度的音频块流重组为固定时长、相邻重叠的窗口，缓冲区不超过一个窗口加一个块"""
+    window = int(window_s * sample_rate)
+    overlap = int(overlap_s * sample_rate)
+    step = window - overlap
+    buffer = np.zeros(0, dtype=np.float32)
+    emitted = False
+    
+    for block in blocks:
+        buffer = np.concatenate([buffer, np.asarray(block, dtype=np.float32)])
+        while len(buffer) >= window:
+            yield buffer[:window]
+            emitted = True
+            buffer = buffer[step:]
+    
+    # 剩余部分若只是已转录过的重叠区则不再输出
+    if len(buffer) > overlap or (not emitted and len(buffer)):
+        yield buffer
+
+def transcribe_stream(blocks, sample_rate=SHARD_SAMPLE_RATE, generate_kwargs=None, timestamps=False):
+    """
+    流式转录：逐窗口送入引擎并增量拼接文本，内存占用与音频总时长无关
+
+    参数:
+        blocks: 产出 float32 单声道数组的可迭代对象（如 getAudio.iter_audio_blocks）
+        sample_rate (int): 音频块的采样率
+        timestamps (bool): 为 True 时流水线返回时间戳，segments 精确到句，否则每个窗口一段
+
+    返回:
+        dict: {"text": 转录文本, "duration": 音频时长（秒）, "segments": 带时间区间的分段}
+    """
+    asr_engine = get_engine()
+    with using_model():
+        asr_engine.load()
+        counter = {"samples": 0}
+        
+        def counted_blocks():
+            for block in blocks:
+                counter["samples"] += len(block)
+                yield block
+        
+        windows = (
+            {"raw": window, "sampling_rate": sample_rate}
+            for window in iter_windows(counted_blocks(), sample_rate)
+        )
+        
+        merged = ""
+        segments = []
+        step_s = CHUNK_LENGTH_S - SHARD_OVERLAP_S
+        for i, result in enumerate(asr_engine.transcribe(windows, generate_kwargs=generate_kwargs, return_timestamps=timestamps)):
+            if not result:
+                continue
+            text = result["text"].strip()
+            merged = merge_overlap_text(merged, text)
+            offset = i * step_s
+            if not timestamps:
+                segments.append({"start": offset, "end": offset + CHUNK_LENGTH_S, "text": text})
+                continue
+            # 窗口开头的重叠部分已由上一个窗口索引
+            segments.extend(chunk_segments(
+                result.get("chunks"),
+                offset=offset,
+                keep_from=offset + SHARD_OVERLAP_S if i else None,
+                default_end=offset + CHUNK_LENGTH_S
+            ))
+    
+    duration = counter["samples"] / sample_rate
+    if segments:
+        segments[-1]["end"] = min(segments[-1]["end"], duration)
+    return {"text": merged, "duration": duration, "segments": segments}
+
+def _synthetic_blocks(duration_s, sample_rate=SHARD_SAMPLE_RATE, block_s=10):
+    """产出指定时长的合成噪声音频块"""
+    rng = np.random.default_rng(0)
+    block = int(block_s * sample_rate)
+    for _ in range(int(duration_s / block_s)):
+        yield (rng.standard_normal(block) * 0.01).astype(np.float32)
+
+def benchmark_stream_memory(durations_s=(600, 1800, 3600, 7200), sample_rate=SHARD_SAMPLE_RATE, block_s=10):
+    """用不同时长的合成音频流测试流式转录（当前引擎）的峰值内存，峰值应与时长无关"""
+    results = []
+    print("\n=== 流式转录内存测试 ===")
+    for duration_s in durations_s:
+        stats = {}
+        with track_memory("stream", stats):
+            transcribe_stream(_synthetic_blocks(duration_s, sample_rate, block_s), sample_rate)
+        results.append({"duration": duration_s, "peak_mb": stats["stream"]["peak_mb"]})
+        print(f"音频时长 {duration_s:>6} 秒: 峰值内存 {stats['stream']['peak_mb'] or 0:.0f} MB")
+    
+    return results
+
+def process_audio(file_path, num_workers=1, profile=None, language=None, output_filename="output.txt", source=None, timestamps=False):
+    """处理音频文件并计时
+
+    file_path 可以是音频文件路径、getAudio.extract_pcm 返回的 PCM 描述符，
+    或产出 16kHz float32 音频块的生成器（流式转录，内存占用恒定）；
+    num_workers > 1 时在 CPU 上使用分片模式多进程并行转录；
+    profile 选择解码配置（fast/balanced/accurate），language 强制指定语言；
+    转录文本保存为 txt/<output_filename>，source（来源视频路径）一并记入检索索引；
+    timestamps 为 True 时让流水线输出时间戳，检索结果可以定位到句（会改变解码过程，默认关闭）；
+    结果中的 run_info 记录音频时长、转录耗时和模型信息，供运行历史统计使用
+    """
+    try:
+        generate_kwargs = get_generate_kwargs(profile, language)
+        
+        # 音频块生成器走流式转录
+        streaming = not isinstance(file_path, (str, os.PathLike, dict))
+        
+        # 确保模型已初始化（分片模式下由子进程各自加载）
+        sharded = num_workers > 1 and not torch.cuda.is_available() and not streaming
+        asr_engine = get_engine()
+        with using_model():
+            if not sharded and not asr_engine.load():
+                return None
+            
+            # 获取音频信息（流式输入在转录完成后才知道时长）
+            if streaming:
+                print("\n开始流式处理音频")
+                duration = None
+            else:
+                print(f"\n开始处理音频文件: {file_path}")
+                duration = get_audio_info(file_path)
+            
+            # 记录转录开始时间
+            transcribe_start = time.time()
+            
+            # 执行转录（GPU 上不做分片，单进程即可充分利用）
+            if streaming:
+                result = transcribe_stream(file_path, generate_kwargs=generate_kwargs, timestamps=timestamps)
+                duration = result["duration"]
+            elif sharded:
+                result = transcribe_sharded(file_path, num_workers=num_workers, generate_kwargs=generate_kwargs, timestamps=timestamps)
+            elif isinstance(file_path, dict):
+                with mapped_pcm(file_path) as audio_data:
+                    result = asr_engine.transcribe(
+                        {"raw": audio_data, "sampling_rate": file_path["sample_rate"]},
+                        generate_kwargs=generate_kwargs,
+                        return_timestamps=timestamps
+                    )
+            else:
+                result = asr_engine.transcribe(file_path, generate_kwargs=generate_kwargs, return_timestamps=timestamps)
+            if timestamps and result and "chunks" in result:
+                result["segments"] = chunk_segments(result["chunks"], default_end=duration)
+        
+        # 计算处理时间
+        process_time = time.time() - transcribe_start
+        
+        print("\n处理结果:")
+        print(f"转录用时: {process_time:.2f} 秒")
+        if duration:
+            print(f"实时率: {duration/process_time:.2f}x")
+            print(f"每秒处理音频时长: {duration/process_time:.2f} 秒")
+        
+        # 保存转录文本
+        if result and "text" in result:
+            save_transcription(result["text"], filename=output_filename, segments=result.get("segments"), source=source)
+            result["run_info"] = {
+                "audio_duration": duration,
+                "stages": {"transcribe": process_time},
+                "asr_engine": asr_engine.name,
+                "asr_model": asr_engine.options.get("model_id", MODEL_ID),
+                "assistant_model": asr_engine.options.get("assistant_model_id"),
+                "decoding_profile": profile,
+            }
+        
+        release_if_over_budget()
+        return result
+        
+    except Exception as e:
+        print(f"处理音频时出错: {e}")
+        return None
+
+if __name__ == "__main__":
+    sample = r"F:\Whisper\audio\audio_59s.mp3"
+    
+    # 处理音频并获取结果
+    result = process_audio(sample)
+    
+    if result:
+        print("\n转录文本:")
+        print(result["text"])
@@ -0,0 +1,437 @@
+import os
+import sys
+import json
+import time
+import uuid
+import sqlite3
+import argparse
+import threading
+from multiprocessing import Process
+from datetime import datetime
+
+
+## 基于 SQLite 的本地任务队列
+## 工作进程崩溃时租约过期，任务按退避延迟重新排队并计入尝试次数，超过最大尝试次数后标记为失败。
+## 工作进程崩溃时租约过期，任务会被其他工作进程重新领取。
+## 每个阶段完成后立即记录产物，失败重试时从失败的阶段继续，按指数退避延迟。
+## 用法:
+## python jobQueue.py enqueue F:\Whisper\video\test.mp4 --priority 5
+## python jobQueue.py work --workers 4
+## python jobQueue.py list
+
+DB_PATH = os.path.join("jobs", "jobs.db")
+LEASE_S = 120           # 租约时长（秒）
+HEARTBEAT_S = 30        # 心跳续约间隔（秒）
+POLL_INTERVAL_S = 5     # 队列为空时的轮询间隔（秒）
+RETRY_BASE_S = 30       # 重试退避基数（秒）
+RETRY_MAX_S = 3600      # 重试退避上限（秒）
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    video_path TEXT NOT NULL,
+    options TEXT NOT NULL DEFAULT '{}',
+    priority INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'queued',
+    stage TEXT NOT NULL DEFAULT 'extract',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    next_run_at REAL NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_expires REAL,
+    artifacts TEXT NOT NULL DEFAULT '{}',
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_claim ON jobs (status, priority DESC, next_run_at);
+"""
+
+def connect(db_path=DB_PATH):
+    """打开队列数据库（WAL 模式，多进程并发读写）"""
+    db_dir = os.path.dirname(db_path)
+    if db_dir:
+        os.makedirs(db_dir, exist_ok=True)
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA busy_timeout=30000")
+    conn.executescript(SCHEMA)
+    return conn
+
+def enqueue(conn, video_path, priority=0, max_attempts=3, **options):
+    """添加任务，options 为 process_video 的可选参数（profile/language/model_name 等）"""
+    now = time.time()
+    cursor = conn.execute(
+        "INSERT INTO jobs (video_path, options, priority, max_attempts, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+        (os.path.abspath(video_path), json.dumps(options, ensure_ascii=False), priority, max_attempts, now, now)
+    )
+    return cursor.lastrowid
+
+def _retry_delay(attempts):
+    """第 attempts 次尝试失败后的重试延迟（秒），指数退避"""
+    return min(RETRY_BASE_S * 2 ** (attempts - 1), RETRY_MAX_S)
+
+def _reclaim_expired(conn, now):
+    """
+    处理租约已过期的运行中任务（工作进程崩溃或被 OOM 终止，fail() 没有机会执行）：
+    未超过最大尝试次数的按退避延迟重新排队，否则标记为失败，避免反复拖垮工作进程
+    """
+    rows = conn.execute(
+        "SELECT id, stage, attempts, max_attempts FROM jobs WHERE status = 'running' AND lease_expires < ?",
+        (now,)
+    ).fetchall()
+    for row in rows:
+        error = f"工作进程在阶段 {row['stage']} 中断（租约过期）"
+        if row["attempts"] < row["max_attempts"]:
+            delay = _retry_delay(row["attempts"])
+            conn.execute(
+                "UPDATE jobs SET status = 'queued', error = ?, next_run_at = ?, lease_owner = NULL, lease_expires = NULL, updated_at = ? WHERE id = ?",
+                (error, now + delay, now, row["id"])
+            )
+            print(f"任务 {row['id']} 的租约已过期，{delay:.0f} 秒后重试")
+        else:
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, lease_owner = NULL, lease_expires = NULL, updated_at = ? WHERE id = ?",
+                (error, now, row["id"])
+            )
+            print(f"任务 {row['id']} 的租约已过期且达到最大尝试次数，标记为失败")
+
+def claim(conn, worker_id, lease_s=LEASE_S):
+    """领取优先级最高的可运行任务，没有时返回 None；租约已过期的任务先按重试规则重新排队或标记失败"""
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        _reclaim_expired(conn, now)
+        row = conn.execute(
+            """
+            SELECT * FROM jobs
+            WHERE status = 'queued' AND next_run_at <= ?
+            ORDER BY priority DESC, id
+            LIMIT 1
+            """,
+            (now,)
+        ).fetchone()
+        if row is None:
+            conn.execute("COMMIT")
+            return None
+        conn.execute(
+            "UPDATE jobs SET status = 'running', lease_owner = ?, lease_expires = ?, attempts = attempts + 1, updated_at = ? WHERE id = ?",
+            (worker_id, now + lease_s, now, row["id"])
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return conn.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone()
+
+def heartbeat(conn, job_id, worker_id, lease_s=LEASE_S):
+    """续约，返回 False 表示租约已被其他工作进程接管"""
+    cursor = conn.execute(
+        "UPDATE jobs SET lease_expires = ?, updated_at = ? WHERE id = ? AND lease_owner = ? AND status = 'running'",
+        (time.time() + lease_s, time.time(), job_id, worker_id)
+    )
+    return cursor.rowcount == 1
+
+class LeaseLost(Exception):
+    """任务租约已过期并被其他工作进程接管，当前进程不得再修改该任务"""
+
+# 以下状态更新都只在本工作进程仍持有租约时生效
+LEASE_CONDITION = "id = ? AND lease_owner = ? AND status = 'running'"
+
+def record_stage(conn, job_id, worker_id, stage, artifacts):
+    """阶段完成后记录下一阶段和产物，租约已丢失时抛出 LeaseLost"""
+    cursor = conn.execute(
+        f"UPDATE jobs SET stage = ?, artifacts = ?, updated_at = ? WHERE {LEASE_CONDITION}",
+        (stage, json.dumps(artifacts, ensure_ascii=False), time.time(), job_id, worker_id)
+    )
+    if cursor.rowcount != 1:
+        raise LeaseLost(f"任务 {job_id} 的租约已被接管")
+
+def complete(conn, job_id, worker_id, artifacts):
+    """标记任务完成，租约已丢失时抛出 LeaseLost"""
+    cursor = conn.execute(
+        f"UPDATE jobs SET status = 'done', stage = 'done', artifacts = ?, error = NULL, lease_owner = NULL, lease_expires = NULL, updated_at = ? WHERE {LEASE_CONDITION}",
+        (json.dumps(artifacts, ensure_ascii=False), time.time(), job_id, worker_id)
+    )
+    if cursor.rowcount != 1:
+        raise LeaseLost(f"任务 {job_id} 的租约已被接管")
+
+def fail(conn, job, worker_id, error):
+    """记录失败；未超过最大尝试次数时按指数退避重新排队。租约已丢失时不做修改，返回 False"""
+    now = time.time()
+    if job["attempts"] < job["max_attempts"]:
+        delay = _retry_delay(job["attempts"])
+        cursor = conn.execute(
+            f"UPDATE jobs SET status = 'queued', error = ?, next_run_at = ?, lease_owner = NULL, lease_expires = NULL, updated_at = ? WHERE {LEASE_CONDITION}",
+            (error, now + delay, now, job["id"], worker_id)
+        )
+        message = f"任务 {job['id']} 在阶段 {job['stage']} 失败，{delay:.0f} 秒后重试: {error}"
+    else:
+        cursor = conn.execute(
+            f"UPDATE jobs SET status = 'failed', error = ?, lease_owner = NULL, lease_expires = NULL, updated_at = ? WHERE {LEASE_CONDITION}",
+            (error, now, job["id"], worker_id)
+        )
+        message = f"任务 {job['id']} 已达到最大尝试次数，标记为失败: {error}"
+    if cursor.rowcount != 1:
+        print(f"任务 {job['id']} 的租约已被接管，不再记录本次失败: {error}")
+        return False
+    print(message)
+    return True
+
+def _keep_alive(db_path, job_id, worker_id, stop, lost):
+    """后台心跳线程（使用独立连接），租约丢失时设置 lost 通知任务线程中止"""
+    conn = connect(db_path)
+    try:
+        while not stop.wait(HEARTBEAT_S):
+            if not heartbeat(conn, job_id, worker_id):
+                print(f"任务 {job_id} 的租约已丢失，中止执行")
+                lost.set()
+                return
+    finally:
+        conn.close()
+
+def _check_lease(lost, job_id):
+    """租约已丢失时抛出 LeaseLost，在每个阶段开始和结束时调用"""
+    if lost is not None and lost.is_set():
+        raise LeaseLost(f"任务 {job_id} 的租约已丢失")
+
+def run_job(conn, job, worker_id, lost=None, profiling=False):
+    """
+    按阶段执行任务，每个阶段完成后立即记录，重试时跳过已完成的阶段
+
+    lost 为心跳线程设置的租约丢失事件：每个阶段开始前和结束后检查，丢失时抛出 LeaseLost 中止任务；
+    profiling 为 True 时对每个阶段做性能分析，结果保存到 profiles/job<id>/
+    """
+    # 延迟导入：enqueue/list 等命令不需要加载 torch
+    from getAudio import extract_audio
+    from hugWhisper import process_audio
+    from getConclusion import process_transcription
+    from stageProfiler import profile_stage
+
+    options = json.loads(job["options"])
+    artifacts = json.loads(job["artifacts"])
+    stage = job["stage"]
+    profile_dir = os.path.join("profiles", f"job{job['id']}") if profiling else None
+    if profile_dir:
+        artifacts["profile_dir"] = profile_dir
+
+    # 中间产物丢失时回退到生成它的阶段
+    if stage == "analysis" and not os.path.exists(artifacts.get("transcription_path", "")):
+        stage = "transcribe"
+    if stage == "transcribe" and not os.path.exists(artifacts.get("audio_path", "")):
+        stage = "extract"
+
+    if stage == "extract":
+        _check_lease(lost, job["id"])
+        extract_start_time = time.time()
+        with profile_stage("extract", profile_dir):
+            audio_path = extract_audio(job["video_path"], os.path.join("audio", f"audio_job{job['id']}_{job['attempts']}.mp3"))
+        if not audio_path:
+            raise Exception("音频提取失败")
+        artifacts["audio_path"] = audio_path
+        artifacts["extract_time"] = time.time() - extract_start_time
+        stage = "transcribe"
+        _check_lease(lost, job["id"])
+        record_stage(conn, job["id"], worker_id, stage, artifacts)
+
+    if stage == "transcribe":
+        _check_lease(lost, job["id"])
+        # 文件名带上尝试次数，租约被接管后旧进程仍在写入的文件不会覆盖新进程的产物
+        txt_name = f"output_job{job['id']}_{job['attempts']}.txt"
+        with profile_stage("transcribe", profile_dir, torch_ops=True):
+            result = process_audio(
+                artifacts["audio_path"],
+                num_workers=options.get("num_workers", 1),
+                profile=options.get("profile"),
+                language=options.get("language"),
+                output_filename=txt_name,
+                source=job["video_path"],
+                timestamps=options.get("timestamps", False)
+            )
+        if not result or "text" not in result:
+            raise Exception("语音识别失败")
+        artifacts["transcription_path"] = os.path.join("txt", txt_name)
+        # 随产物保存，重试时内容分析阶段仍能记录完整的运行历史
+        artifacts["run_info"] = result["run_info"]
+        artifacts["run_info"]["file"] = os.path.basename(job["video_path"])
+        if "extract_time" in artifacts:
+            artifacts["run_info"]["stages"]["extract"] = artifacts["extract_time"]
+        stage = "analysis"
+        _check_lease(lost, job["id"])
+        record_stage(conn, job["id"], worker_id, stage, artifacts)
+
+    # 检查点按模型和文本内容命名，总是从检查点继续：重试（包括 retry 命令重置尝试次数后）只重发失败的请求
+    _check_lease(lost, job["id"])
+    with profile_stage("analysis", profile_dir):
+        analysis_path = process_transcription(
+            artifacts["transcription_path"],
+            options.get("model_name", "deepseek-r1-250120"),
+            resume=True,
+            run_info=artifacts.get("run_info")
+        )
+    if not analysis_path:
+        raise Exception("内容分析失败")
+    artifacts["analysis_path"] = analysis_path
+    _check_lease(lost, job["id"])
+    return artifacts
+
+def run_worker(db_path=DB_PATH, api_key=None, base_url=None, max_jobs=None, profiling=False, endpoints=None):
+    """工作进程主循环：领取任务、心跳续约、执行并记录结果；endpoints 为端点池配置文件"""
+    from getConclusion import initialize_client, initialize_pool
+
+    worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:6]}"
+    if endpoints:
+        if not initialize_pool(endpoints):
+            print("AI模型初始化失败，工作进程退出")
+            return
+    else:
+        api_key = api_key or os.getenv("ARK_API_KEY")
+        base_url = base_url or "https://ark.cn-beijing.volces.com/api/v3/"
+        if not api_key:
+            print("未提供API密钥，且环境变量ARK_API_KEY未设置")
+            return
+        if not initialize_client(api_key, base_url):
+            print("AI模型初始化失败，工作进程退出")
+            return
+
+    for dir_name in ("audio", "txt", "notes", "stats", "conversations"):
+        os.makedirs(dir_name, exist_ok=True)
+
+    conn = connect(db_path)
+    processed = 0
+    print(f"工作进程 {worker_id} 已启动")
+    try:
+        while max_jobs is None or processed < max_jobs:
+            job = claim(conn, worker_id)
+            if job is None:
+                time.sleep(POLL_INTERVAL_S)
+                continue
+
+            print(f"\n[{worker_id}] 开始任务 {job['id']}（阶段 {job['stage']}，第 {job['attempts']} 次尝试）: {job['video_path']}")
+            stop = threading.Event()
+            lost = threading.Event()
+            keeper = threading.Thread(target=_keep_alive, args=(db_path, job["id"], worker_id, stop, lost), daemon=True)
+            keeper.start()
+            try:
+                artifacts = run_job(conn, job, worker_id, lost, profiling)
+                complete(conn, job["id"], worker_id, artifacts)
+                print(f"[{worker_id}] 任务 {job['id']} 完成: {artifacts['analysis_path']}")
+            except LeaseLost as e:
+                print(f"[{worker_id}] {e}，已放弃本次执行，结果以接管的工作进程为准")
+            except Exception as e:
+                # 重新读取以获得最新阶段
+                fail(conn, conn.execute("SELECT * FROM jobs WHERE id = ?", (job["id"],)).fetchone(), worker_id, str(e))
+            finally:
+                stop.set()
+                keeper.join()
+            processed += 1
+    except KeyboardInterrupt:
+        print(f"\n工作进程 {worker_id} 已停止")
+    finally:
+        conn.close()
+
+def start_workers(num_workers, db_path=DB_PATH, api_key=None, base_url=None, profiling=False, endpoints=None):
+    """启动多个工作进程并等待其结束"""
+    workers = [
+        Process(target=run_worker, args=(db_path, api_key, base_url, None, profiling, endpoints), name=f"worker-{i}")
+        for i in range(num_workers)
+    ]
+    for worker in workers:
+        worker.start()
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        for worker in workers:
+            worker.join()
+
+def _format_time(timestamp):
+    return datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S") if timestamp else "-"
+
+def main(argv=None):
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="视频分析任务队列")
+    parser.add_argument("--db", default=DB_PATH, help="队列数据库路径")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    add = commands.add_parser("enqueue", help="添加任务")
+    add.add_argument("videos", nargs="+", help="视频文件路径")
+    add.add_argument("--priority", type=int, default=0, help="优先级，数值越大越先处理")
+    add.add_argument("--max-attempts", type=int, default=3, help="最大尝试次数")
+    add.add_argument("--profile", help="Whisper 解码配置 (fast/balanced/accurate)")
+    add.add_argument("--language", help="强制指定转录语言")
+    add.add_argument("--model-name", help="大模型名称")
+    add.add_argument("--timestamps", action="store_true", help="转录时输出句级时间戳，检索结果可定位到视频中的时间")
+
+    listing = commands.add_parser("list", help="列出任务")
+    listing.add_argument("--status", help="按状态过滤 (queued/running/done/failed)")
+
+    show = commands.add_parser("show", help="查看任务详情")
+    show.add_argument("job_id", type=int)
+
+    retry = commands.add_parser("retry", help="将失败的任务重新排队")
+    retry.add_argument("job_id", type=int)
+
+    work = commands.add_parser("work", help="启动工作进程")
+    work.add_argument("--workers", type=int, default=1, help="工作进程数")
+    work.add_argument("--base-url", help="火山大模型Base URL")
+    work.add_argument("--profiling", action="store_true", help="对各阶段做性能分析，结果保存到 profiles/job<id>/")
+    work.add_argument("--endpoints", help="大模型端点池配置文件（JSON，多个 Base URL / API 密钥）")
+
+    args = parser.parse_args(argv)
+    conn = connect(args.db)
+
+    if args.command == "enqueue":
+        options = {k: v for k, v in {
+            "profile": args.profile, "language": args.language, "model_name": args.model_name,
+            "timestamps": args.timestamps
+        }.items() if v}
+        for video in args.videos:
+            if not os.path.exists(video):
+                print(f"文件不存在，已跳过: {video}")
+                continue
+            job_id = enqueue(conn, video, args.priority, args.max_attempts, **options)
+            print(f"已添加任务 {job_id}: {video}")
+
+    elif args.command == "list":
+        query = "SELECT * FROM jobs"
+        params = ()
+        if args.status:
+            query += " WHERE status = ?"
+            params = (args.status,)
+        rows = conn.execute(query + " ORDER BY priority DESC, id", params).fetchall()
+        print(f"{'ID':>5}  {'状态':<8} {'阶段':<10} {'优先级':>4} {'尝试':>5}  {'更新时间':<19}  视频")
+        for row in rows:
+            print(f"{row['id']:>5}  {row['status']:<8} {row['stage']:<10} {row['priority']:>4} "
+                  f"{row['attempts']:>2}/{row['max_attempts']:<2}  {_format_time(row['updated_at'])}  {row['video_path']}")
+        counts = conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        print("\n" + ", ".join(f"{status}: {count}" for status, count in counts))
+
+    elif args.command == "show":
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?", (args.job_id,)).fetchone()
+        if row is None:
+            print(f"任务不存在: {args.job_id}")
+            return
+        for key in row.keys():
+            value = row[key]
+            if key in ("created_at", "updated_at", "next_run_at", "lease_expires"):
+                value = _format_time(value)
+            print(f"{key}: {value}")
+
+    elif args.command == "retry":
+        cursor = conn.execute(
+            "UPDATE jobs SET status = 'queued', attempts = 0, next_run_at = 0, updated_at = ? WHERE id = ? AND status = 'failed'",
+            (time.time(), args.job_id)
+        )
+        print("已重新排队" if cursor.rowcount else "只有失败的任务可以重新排队")
+
+    elif args.command == "work":
+        conn.close()
+        if args.workers > 1:
+            start_workers(args.workers, args.db, base_url=args.base_url, profiling=args.profiling, endpoints=args.endpoints)
+        else:
+            run_worker(args.db, base_url=args.base_url, profiling=args.profiling, endpoints=args.endpoints)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,168 @@
+import os
+import json
+import time
+import threading
+from collections import deque
+from openai import OpenAI, AsyncOpenAI
+
+
+## 大模型端点池
+## 多个端点（不同 Base URL 或 API 密钥）共同分担请求，总吞吐随密钥数量增加。
+## 路由：在健康、未超过配额和并发上限的端点中，选择 (进行中 + 最近一分钟的请求数) / 权重 最小的端点，
+## 顺序发送的请求也会按权重分散到各端点；
+## 连续失败 FAILURE_THRESHOLD 次后暂停使用（时间按次数翻倍），被限流时按 Retry-After 暂停。
+## 配置文件（JSON 列表）示例:
+## [
+##   {"name": "ark-1", "base_url": "https://ark.cn-beijing.volces.com/api/v3/", "api_key_env": "ARK_API_KEY", "weight": 2, "rpm": 60, "tpm": 200000},
+##   {"name": "ark-2", "base_url": "https://ark.cn-beijing.volces.com/api/v3/", "api_key": "...", "max_concurrency": 4}
+## ]
+
+FAILURE_THRESHOLD = 3       # 连续失败多少次后暂停使用端点
+COOLDOWN_S = 30             # 首次暂停时长（秒），之后每次失败翻倍
+COOLDOWN_MAX_S = 600        # 暂停时长上限（秒）
+RATE_LIMIT_COOLDOWN_S = 10  # 被限流且没有 Retry-After 时的暂停时长（秒）
+QUOTA_WINDOW_S = 60         # rpm/tpm 配额的统计窗口（秒）
+
+def load_endpoints(config):
+    """读取端点配置，config 为 JSON 文件路径或端点字典列表"""
+    if isinstance(config, str):
+        with open(config, "r", encoding="utf-8") as f:
+            config = json.load(f)
+    endpoints = []
+    for i, item in enumerate(config):
+        api_key = item.get("api_key") or os.getenv(item.get("api_key_env", ""), "")
+        if not api_key:
+            raise ValueError(f"端点 {item.get('name', i)} 未配置 API 密钥")
+        endpoints.append({
+            "name": item.get("name") or f"endpoint-{i}",
+            "base_url": item["base_url"],
+            "api_key": api_key,
+            "weight": item.get("weight", 1),
+            "rpm": item.get("rpm"),                        # 每分钟请求数上限
+            "tpm": item.get("tpm"),                        # 每分钟 token 数上限（输入 + 最大输出）
+            "max_concurrency": item.get("max_concurrency"),
+        })
+    return endpoints
+
+def create_pool(endpoints):
+    """根据端点配置创建端点池"""
+    pool = {"endpoints": [], "lock": threading.Lock()}
+    for endpoint in load_endpoints(endpoints):
+        endpoint.update(
+            client=None,
+            async_client=None,
+            in_flight=0,
+            failures=0,
+            cooldown_until=0.0,
+            window=deque(),      # 配额窗口内的 (时间, 预计 token 数)
+            requests=0,
+            errors=0,
+            tokens=0
+        )
+        pool["endpoints"].append(endpoint)
+    if not pool["endpoints"]:
+        raise ValueError("端点配置为空，至少需要一个端点")
+    return pool
+
+def get_client(endpoint, use_async=False):
+    """获取端点的同步/异步客户端（首次使用时创建）
+
+    重试由端点池负责（换端点、按 Retry-After 暂停），客户端关闭 SDK 自带的重试：
+    否则 429/5xx 会先在同一端点上重试两次，首字节超时也要等 3 倍时长才交给卡顿处理
+    """
+    key = "async_client" if use_async else "client"
+    if endpoint[key] is None:
+        client_class = AsyncOpenAI if use_async else OpenAI
+        endpoint[key] = client_class(base_url=endpoint["base_url"], api_key=endpoint["api_key"], max_retries=0)
+    return endpoint[key]
+
+def _wait_time(endpoint, tokens, now):
+    """端点还需等待多久才能接受该请求，0 表示可以立即发送"""
+    window = endpoint["window"]
+    while window and window[0][0] <= now - QUOTA_WINDOW_S:
+        window.popleft()
+
+    wait = max(endpoint["cooldown_until"] - now, 0)
+    if endpoint["rpm"] and len(window) >= endpoint["rpm"]:
+        wait = max(wait, window[0][0] + QUOTA_WINDOW_S - now)
+    if endpoint["tpm"]:
+        # 从最早的记录开始释放，直到剩余额度足够
+        used = sum(item[1] for item in window)
+        for timestamp, item_tokens in window:
+            if used + tokens <= endpoint["tpm"]:
+                break
+            used -= item_tokens
+            wait = max(wait, timestamp + QUOTA_WINDOW_S - now)
+    return wait
+
+def acquire(pool, tokens, exclude=()):
+    """
+    选择一个端点并占用一个并发名额，返回 (端点, 0)
+
+    暂时没有可用端点时返回 (None, 需要等待的秒数)；除 exclude 外没有任何端点时返回 (None, None)
+    """
+    now = time.time()
+    with pool["lock"]:
+        best = None
+        best_score = None
+        min_wait = None
+        for endpoint in pool["endpoints"]:
+            if endpoint["name"] in exclude:
+                continue
+            wait = _wait_time(endpoint, tokens, now)
+            if endpoint["max_concurrency"] and endpoint["in_flight"] >= endpoint["max_concurrency"]:
+                wait = max(wait, 0.1)  # 等待其他请求完成
+            if wait > 0:
+                min_wait = wait if min_wait is None else min(min_wait, wait)
+                continue
+            score = (endpoint["in_flight"] + len(endpoint["window"]) + 1) / endpoint["weight"]
+            if best is None or score < best_score:
+                best, best_score = endpoint, score
+        if best is None:
+            return None, min_wait
+        best["in_flight"] += 1
+        best["requests"] += 1
+        best["window"].append((now, tokens))
+        return best, 0
+
+def release(pool, endpoint, tokens=0, error=None):
+    """释放并发名额并更新健康状态；error 为 None 表示请求成功"""
+    now = time.time()
+    with pool["lock"]:
+        endpoint["in_flight"] -= 1
+        if error is None:
+            endpoint["failures"] = 0
+            endpoint["tokens"] += tokens
+            return
+        endpoint["errors"] += 1
+        if getattr(error, "status_code", None) == 429:
+            retry_after = None
+            response = getattr(error, "response", None)
+            if response is not None:
+                try:
+                    retry_after = float(response.headers.get("retry-after"))
+                except (TypeError, ValueError):
+                    pass
+            endpoint["cooldown_until"] = now + (retry_after or RATE_LIMIT_COOLDOWN_S)
+            print(f"端点 {endpoint['name']} 被限流，暂停 {endpoint['cooldown_until'] - now:.0f} 秒")
+            return
+        endpoint["failures"] += 1
+        if endpoint["failures"] >= FAILURE_THRESHOLD:
+            cooldown = min(COOLDOWN_S * 2 ** (endpoint["failures"] - FAILURE_THRESHOLD), COOLDOWN_MAX_S)
+            endpoint["cooldown_until"] = now + cooldown
+            print(f"端点 {endpoint['name']} 连续失败 {endpoint['failures']} 次，暂停 {cooldown:.0f} 秒")
+
+def mark_unhealthy(pool, endpoint):
+    """连接测试失败的端点直接暂停使用"""
+    with pool["lock"]:
+        endpoint["failures"] = FAILURE_THRESHOLD
+        endpoint["cooldown_until"] = time.time() + COOLDOWN_S
+
+def print_pool_status(pool):
+    """打印各端点的请求数、失败数和 token 数"""
+    now = time.time()
+    print("\n端点统计:")
+    for endpoint in pool["endpoints"]:
+        state = "暂停" if endpoint["cooldown_until"] > now else "正常"
+        print(f"- {endpoint['name']} ({state}, 权重 {endpoint['weight']}): 请求 {endpoint['requests']} 次, "
+              f"失败 {endpoint['errors']} 次, tokens {endpoint['tokens']}")
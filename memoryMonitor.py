@@ -0,0 +1,81 @@
+import os
+import sys
+import threading
+from contextlib import contextmanager
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+## 内存统计
+## 用法:
+## memory_stats = {}
+## with track_memory("transcribe", memory_stats):
+##     process_audio(...)
+## print(memory_stats["transcribe"]["peak_mb"])
+def get_rss_mb():
+    """获取当前进程常驻内存 (MB)，无法获取时返回 None"""
+    if psutil is not None:
+        return psutil.Process(os.getpid()).memory_info().rss / (1024 * 1024)
+    if sys.platform.startswith("linux"):
+        # 无 psutil 时读取 /proc
+        with open("/proc/self/statm", "r") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    return None
+
+def get_available_mb():
+    """获取系统当前可用内存 (MB)，无法获取时返回 None"""
+    if psutil is not None:
+        return psutil.virtual_memory().available / (1024 * 1024)
+    if sys.platform.startswith("linux"):
+        with open("/proc/meminfo", "r") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) / 1024
+    return None
+
+@contextmanager
+def track_memory(stage, stats, interval=0.1):
+    """
+    统计一个处理阶段的内存占用，结果写入 stats[stage]
+
+    后台线程按 interval 秒采样常驻内存，记录阶段开始、结束时的值和阶段内峰值
+    """
+    start_mb = get_rss_mb()
+    record = {"start_mb": start_mb, "end_mb": None, "peak_mb": start_mb}
+    stats[stage] = record
+
+    if start_mb is None:
+        yield record
+        return
+
+    stop = threading.Event()
+
+    def sample():
+        while not stop.wait(interval):
+            current = get_rss_mb()
+            if current > record["peak_mb"]:
+                record["peak_mb"] = current
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    try:
+        yield record
+    finally:
+        stop.set()
+        sampler.join()
+        record["end_mb"] = get_rss_mb()
+        record["peak_mb"] = max(record["peak_mb"], record["end_mb"])
+
+def print_memory_stats(stats):
+    """打印各阶段内存统计"""
+    print("\n内存统计:")
+    for stage, record in stats.items():
+        if record["start_mb"] is None:
+            print(f"- {stage}: 无法获取")
+            continue
+        print(f"- {stage}: 峰值 {record['peak_mb']:.0f} MB "
+              f"(开始 {record['start_mb']:.0f} MB, 结束 {record['end_mb']:.0f} MB)")
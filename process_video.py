@@ -1,235 +1,423 @@
-import os
-import time
-from datetime import datetime
-from getAudio import extract_audio
-from hugWhisper import process_audio
-from getConclusion import process_transcription, initialize_client
-import subprocess
-
-def create_output_dirs():
-    """创建所需的输出目录"""
-    dirs = ['video', 'audio', 'txt', 'notes', 'stats', 'conversations']
-    for dir_name in dirs:
-        os.makedirs(dir_name, exist_ok=True)
-        print(f"已创建或确认目录存在: {dir_name}")
-
-def process_video(video_path, api_key=None, base_url=None, model_name="deepseek-r1-250120"):
-    """
-    处理视频的主流程函数
-    
-    主要步骤：
-    1. 从视频中提取音频 (getAudio.py)
-    2. 将音频转换为文本 (hugWhisper.py)
-    3. 使用AI分析文本内容 (getConclusion.py)
-    
-    参数:
-        video_path (str): 输入视频文件的路径
-        api_key (str): 火山大模型API密钥
-        base_url (str): 火山大模型Base URL
-        model_name (str): 使用的模型名称
-    
-    返回:
-        dict: 包含处理结果的字典
-    """
-    try:
-        # 验证视频文件路径
-        if not os.path.exists(video_path):
-            raise Exception(f"视频文件不存在: {video_path}")
-        
-        print(f"\n开始处理视频文件: {video_path}")
-        print(f"文件大小: {os.path.getsize(video_path) / (1024*1024):.2f} MB")
-        
-        # 记录开始时间
-        total_start_time = time.time()
-        
-        # 创建输出目录
-        create_output_dirs()
-        
-        # 步骤1：提取音频 (getAudio.py -> extract_audio)
-        print("\n=== 步骤1：提取音频 ===")
-        audio_path = os.path.join("audio", f"audio_{int(time.time())}.mp3")
-        print(f"正在从视频中提取音频...")
-        print(f"输出路径: {audio_path}")
-        
-        audio_result = extract_audio(video_path, audio_path)
-        if not audio_result:
-            raise Exception("音频提取失败，请检查视频文件是否完整或是否已安装FFmpeg")
-        print(f"音频提取完成: {audio_result}")
-        
-        # 步骤2：语音识别 (hugWhisper.py -> process_audio)
-        print("\n=== 步骤2：语音识别 ===")
-        print(f"正在使用Whisper模型转录音频...")
-        transcription_result = process_audio(audio_result)
-        
-        if not transcription_result:
-            raise Exception("语音识别失败，请检查音频文件是否正常")
-        if "text" not in transcription_result:
-            raise Exception("语音识别结果格式错误")
-            
-        txt_file = os.path.join("txt", "output.txt")
-        if not os.path.exists(txt_file):
-            raise Exception("转录文本文件未生成")
-        print(f"语音识别完成，文本已保存到: {txt_file}")
-        
-        # 步骤3：内容分析 (getConclusion.py -> process_transcription)
-        print("\n=== 步骤3：内容分析 ===")
-        print("正在初始化AI模型...")
-        
-        # 设置API配置
-        if not api_key:
-            api_key = os.getenv("ARK_API_KEY")
-            if not api_key:
-                raise Exception("未提供API密钥，且环境变量ARK_API_KEY未设置")
-        
-        if not base_url:
-            base_url = "https://ark.cn-beijing.volces.com/api/v3/"
-            
-        # 初始化大模型客户端
-        client = initialize_client(api_key, base_url)
-        if not client:
-            raise Exception("AI模型初始化失败，请检查API密钥和Base URL是否正确")
-            
-        print("AI模型初始化完成")
-        
-        print("开始分析文本内容...")
-        analysis_result = process_transcription(txt_file, model_name)
-        if not analysis_result:
-            raise Exception("内容分析失败，请检查API配置和文本内容")
-        print(f"内容分析完成，报告已保存到: {analysis_result}")
-        
-        # 计算总处理时间
-        total_time = time.time() - total_start_time
-        
-        # 准备处理结果
-        result = {
-            "status": "success",
-            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "video_path": video_path,
-            "audio_path": audio_result,
-            "transcription_path": txt_file,
-            "analysis_path": analysis_result,
-            "total_time": total_time
-        }
-        
-        print("\n=== 处理完成 ===")
-        print(f"总耗时: {total_time:.2f} 秒")
-        print(f"处理结果:")
-        print(f"- 视频文件: {os.path.basename(video_path)}")
-        print(f"- 音频文件: {os.path.basename(audio_result)}")
-        print(f"- 转录文本: {os.path.basename(txt_file)}")
-        print(f"- 分析报告: {os.path.basename(analysis_result)}")
-        
-        return result
-        
-    except Exception as e:
-        print(f"\n处理过程中出错: {str(e)}")
-        return {
-            "status": "error",
-            "error_message": str(e),
-            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        }
-
-def main():
-    """主函数"""
-    try:
-        print("\n=== AI视频分析系统 ===")
-        print("本系统将自动完成以下步骤：")
-        print("1. 从视频中提取音频 (需要安装FFmpeg)")
-        print("2. 使用Whisper模型进行语音识别")
-        print("3. 使用大模型进行内容分析和总结")
-        
-        # 检查FFmpeg是否已安装
-        try:
-            subprocess.run(
-                ["ffmpeg", "-version"],
-                check=True,
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.DEVNULL
-            )
-        except (FileNotFoundError, subprocess.CalledProcessError):
-            print("\n错误：未检测到FFmpeg！")
-            print("请先安装FFmpeg并将其添加到系统环境变量中")
-            print("下载地址：https://ffmpeg.org/download.html")
-            return
-            
-        print("\n=== 环境检查 ===")
-        print("√ FFmpeg 已安装")
-        
-        print("\n请按照提示输入必要信息：")
-        
-        # 1. 获取视频文件路径
-        while True:
-            video_path = input("\n请输入视频文件路径（输入q退出）: ").strip()
-            if video_path.lower() == 'q':
-                print("程序已退出")
-                return
-            
-            if not os.path.exists(video_path):
-                print("错误：文件不存在，请重新输入")
-                continue
-                
-            if not video_path.lower().endswith(('.mp4', '.avi', '.mov', '.mkv', '.flv')):
-                print("警告：不支持的视频格式，支持的格式：mp4, avi, mov, mkv, flv")
-                if input("是否继续？(y/n): ").lower() != 'y':
-                    continue
-            break
-        
-        # 2. 获取API配置
-        print("\n=== API配置 ===")
-        api_key = os.getenv("ARK_API_KEY")
-        if api_key:
-            print("检测到环境变量ARK_API_KEY")
-            use_env = input("是否使用环境变量中的API密钥？(y/n): ").lower() == 'y'
-            if not use_env:
-                api_key = input("请输入火山大模型API密钥: ").strip()
-        else:
-            print("未检测到环境变量ARK_API_KEY")
-            api_key = input("请输入火山大模型API密钥: ").strip()
-            if not api_key:
-                print("错误：未提供API密钥")
-                return
-        
-        base_url = input("\n请输入火山大模型Base URL（直接回车使用默认值）: ").strip() or None
-        
-        # 3. 确认信息
-        print("\n=== 处理信息确认 ===")
-        print(f"视频文件: {video_path}")
-        print(f"文件大小: {os.path.getsize(video_path) / (1024*1024):.2f} MB")
-        print(f"API密钥: {'环境变量' if use_env else '手动输入'}")
-        print(f"Base URL: {base_url or '默认值'}")
-        
-        if input("\n确认开始处理？(y/n): ").lower() != 'y':
-            print("已取消处理")
-            return
-        
-        # 4. 处理视频
-        result = process_video(video_path, api_key, base_url)
-        
-        # 5. 输出处理状态
-        if result["status"] == "success":
-            print("\n=== 视频处理成功完成！===")
-            print(f"总耗时: {result['total_time']:.2f} 秒")
-            print("\n生成的文件：")
-            print(f"- 音频文件: {os.path.basename(result['audio_path'])}")
-            print(f"- 转录文本: {os.path.basename(result['transcription_path'])}")
-            print(f"- 分析报告: {os.path.basename(result['analysis_path'])}")
-            
-            # 询问是否打开生成的文件
-            print("\n是否打开生成的文件？")
-            if input("1. 打开分析报告 (y/n): ").lower() == 'y':
-                os.system(f"start {result['analysis_path']}")
-            if input("2. 打开转录文本 (y/n): ").lower() == 'y':
-                os.system(f"start {result['transcription_path']}")
-        else:
-            print(f"\n处理失败: {result['error_message']}")
-            print("请检查错误信息并重试")
-            
-    except KeyboardInterrupt:
-        print("\n\n程序已被用户中断")
-    except Exception as e:
-        print(f"\n程序运行出错: {str(e)}")
-    finally:
-        print("\n程序结束")
-
-if __name__ == "__main__":
-    main() 
\ No newline at end of file
+import os
+import sys
+import time
+import argparse
+import uuid
+import asyncio
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from getAudio import extract_audio, check_ffmpeg, extract_pcm, release_pcm, iter_audio_blocks, extract_audio_async
+from hugWhisper import process_audio, get_engine, transcript_filename
+from memoryMonitor import track_memory, print_memory_stats
+from stageProfiler import profile_stage
+from getConclusion import process_transcription, initialize_client, process_transcription_async, initialize_async_client, initialize_pool
+
+# 异步流水线：Whisper 在独立线程中运行（同一模型不并发调用）
+_whisper_executor = None
+
+def create_output_dirs():
+    """创建所需的输出目录"""
+    dirs = ['video', 'audio', 'txt', 'notes', 'stats', 'conversations']
+    for dir_name in dirs:
+        os.makedirs(dir_name, exist_ok=True)
+        print(f"已创建或确认目录存在: {dir_name}")
+
+def process_video(video_path, api_key=None, base_url=None, model_name="deepseek-r1-250120", num_workers=1, pcm_handoff=False, resume=False, profile=None, language=None, unload_before_llm=True, stream_audio=False, profile_dir=None, endpoints=None, timestamps=False):
+    """
+    处理视频的主流程函数
+    
+    主要步骤：
+    1. 从视频中提取音频 (getAudio.py)
+    2. 将音频转换为文本 (hugWhisper.py)
+    3. 使用AI分析文本内容 (getConclusion.py)
+    
+    参数:
+        video_path (str): 输入视频文件的路径
+        api_key (str): 火山大模型API密钥
+        base_url (str): 火山大模型Base URL
+        model_name (str): 使用的模型名称
+        num_workers (int): 语音识别进程数，大于1时启用分片并行转录
+        pcm_handoff (bool): 为 True 时直接解码为内存映射的 float32 PCM 交给语音识别，
+            不再生成并重新解码 MP3 文件
+        resume (bool): 为 True 时内容分析从上次中断的大模型请求处继续
+        profile (str): Whisper 解码配置（fast/balanced/accurate），None 使用模型默认设置
+        language (str): 强制指定转录语言（如 "zh"），跳过逐窗口语言检测
+        unload_before_llm (bool): 进入内容分析前卸载 Whisper 模型，释放内存
+        stream_audio (bool): 为 True 时不落盘，由 FFmpeg 管道逐块解码并流式转录，
+            内存占用与视频时长无关
+        profile_dir (str): 指定时对每个阶段做性能分析，调用栈和热点函数摘要写入该目录，
+            转录阶段另外记录 PyTorch 算子耗时
+        endpoints (str|list): 大模型端点池配置（JSON 文件路径或端点列表，见 llmPool.py），
+            指定时请求分散到多个 Base URL / API 密钥，忽略 api_key 和 base_url
+        timestamps (bool): 为 True 时语音识别输出时间戳，检索结果可以定位到句（会改变解码过程，默认关闭）
+    
+    返回:
+        dict: 包含处理结果的字典
+    """
+    try:
+        # 验证视频文件路径
+        if not os.path.exists(video_path):
+            raise Exception(f"视频文件不存在: {video_path}")
+        
+        print(f"\n开始处理视频文件: {video_path}")
+        print(f"文件大小: {os.path.getsize(video_path) / (1024*1024):.2f} MB")
+        
+        # 记录开始时间
+        total_start_time = time.time()
+        
+        # 创建输出目录
+        create_output_dirs()
+        memory_stats = {}
+        
+        # 步骤1：提取音频 (getAudio.py -> extract_audio)
+        print("\n=== 步骤1：提取音频 ===")
+        extract_start_time = time.time()
+        with track_memory("extract", memory_stats), profile_stage("extract", profile_dir):
+            audio_path = os.path.join("audio", f"audio_{int(time.time())}.mp3")
+            print(f"正在从视频中提取音频...")
+        
+            if stream_audio:
+                print("流式解码，不生成音频文件")
+                audio_input = iter_audio_blocks(video_path)
+                audio_result = video_path
+            elif pcm_handoff:
+                audio_path = os.path.splitext(audio_path)[0] + ".f32"
+                print(f"输出路径: {audio_path}")
+                audio_input = extract_pcm(video_path, audio_path)
+                audio_result = audio_input["path"]
+            else:
+                print(f"输出路径: {audio_path}")
+                audio_result = extract_audio(video_path, audio_path)
+                audio_input = audio_result
+            if not audio_result:
+                raise Exception("音频提取失败，请检查视频文件是否完整或是否已安装FFmpeg")
+        extract_time = time.time() - extract_start_time
+        print(f"音频提取完成: {audio_result}")
+        
+        # 步骤2：语音识别 (hugWhisper.py -> process_audio)
+        print("\n=== 步骤2：语音识别 ===")
+        print(f"正在使用Whisper模型转录音频...")
+        # 每个视频使用独立的转录文件名，检索索引中各视频的记录互不覆盖
+        txt_name = transcript_filename(video_path)
+        with track_memory("transcribe", memory_stats), profile_stage("transcribe", profile_dir, torch_ops=True):
+            try:
+                transcription_result = process_audio(
+                    audio_input, num_workers=num_workers, profile=profile, language=language,
+                    output_filename=txt_name, source=video_path, timestamps=timestamps
+                )
+            finally:
+                if pcm_handoff:
+                    release_pcm(audio_input)
+        
+        if not transcription_result:
+            raise Exception("语音识别失败，请检查音频文件是否正常")
+        if "text" not in transcription_result:
+            raise Exception("语音识别结果格式错误")
+        
+        # 语音识别阶段的信息与内容分析统计一起记录到运行历史
+        run_info = transcription_result["run_info"]
+        run_info.update(file=os.path.basename(video_path), start_time=total_start_time)
+        if not stream_audio:
+            # 流式模式下解码与转录同时进行，耗时计入 transcribe
+            run_info["stages"]["extract"] = extract_time
+            
+        txt_file = os.path.join("txt", txt_name)
+        if not os.path.exists(txt_file):
+            raise Exception("转录文本文件未生成")
+        print(f"语音识别完成，文本已保存到: {txt_file}")
+        
+        # 步骤3：内容分析 (getConclusion.py -> process_transcription)
+        print("\n=== 步骤3：内容分析 ===")
+        if unload_before_llm:
+            get_engine().unload()
+        print("正在初始化AI模型...")
+        
+        if endpoints:
+            # 多端点：请求分散到端点池
+            if not initialize_pool(endpoints):
+                raise Exception("AI模型初始化失败，请检查端点配置")
+        else:
+            # 设置API配置
+            if not api_key:
+                api_key = os.getenv("ARK_API_KEY")
+                if not api_key:
+                    raise Exception("未提供API密钥，且环境变量ARK_API_KEY未设置")
+            
+            if not base_url:
+                base_url = "https://ark.cn-beijing.volces.com/api/v3/"
+                
+            # 初始化大模型客户端
+            client = initialize_client(api_key, base_url)
+            if not client:
+                raise Exception("AI模型初始化失败，请检查API密钥和Base URL是否正确")
+            
+        print("AI模型初始化完成")
+        
+        print("开始分析文本内容...")
+        with track_memory("analysis", memory_stats), profile_stage("analysis", profile_dir):
+            analysis_result = process_transcription(txt_file, model_name, resume=resume, run_info=run_info)
+        if not analysis_result:
+            raise Exception("内容分析失败，请检查API配置和文本内容")
+        print(f"内容分析完成，报告已保存到: {analysis_result}")
+        
+        # 计算总处理时间
+        total_time = time.time() - total_start_time
+        
+        # 准备处理结果
+        result = {
+            "status": "success",
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "video_path": video_path,
+            "audio_path": audio_result,
+            "transcription_path": txt_file,
+            "analysis_path": analysis_result,
+            "total_time": total_time,
+            "memory": memory_stats,
+            "profile_dir": profile_dir
+        }
+        
+        print("\n=== 处理完成 ===")
+        print(f"总耗时: {total_time:.2f} 秒")
+        print(f"处理结果:")
+        print(f"- 视频文件: {os.path.basename(video_path)}")
+        print(f"- 音频文件: {os.path.basename(audio_result)}")
+        print(f"- 转录文本: {os.path.basename(txt_file)}")
+        print(f"- 分析报告: {os.path.basename(analysis_result)}")
+        print_memory_stats(memory_stats)
+        
+        return result
+        
+    except Exception as e:
+        print(f"\n处理过程中出错: {str(e)}")
+        return {
+            "status": "error",
+            "error_message": str(e),
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }
+
+def create_limits(ffmpeg=4, whisper=1, llm=8):
+    """创建异步流水线各阶段的并发上限（需在事件循环中调用）"""
+    return {
+        "ffmpeg": asyncio.Semaphore(ffmpeg),
+        "whisper": asyncio.Semaphore(whisper),
+        "llm": asyncio.Semaphore(llm),
+    }
+
+async def process_video_async(video_path, api_key=None, base_url=None, model_name="deepseek-r1-250120", limits=None, progress=None, profile=None, language=None, resume=False, endpoints=None, timestamps=False):
+    """
+    process_video 的异步版本，便于在一个服务进程中并发处理多个视频
+    
+    - FFmpeg 通过 asyncio 子进程运行
+    - Whisper 转录放到单独的线程执行器中，不阻塞事件循环
+    - 内容分析使用 AsyncOpenAI 流式请求，思维导图和文本分析并发生成
+    
+    参数:
+        limits (dict): create_limits() 返回的各阶段信号量，多个任务共享同一组即可全局限流
+        progress (callable): 进度回调 progress(stage, info)，stage 为
+            extract / transcribe / mindmap / analysis / done
+        其余参数同 process_video
+    
+    取消：对运行本协程的任务调用 task.cancel() 即可。FFmpeg 进程会被终止、
+    大模型流式连接会被关闭；已开始的 Whisper 转录无法中断，会在后台跑完后丢弃结果
+    
+    返回:
+        dict: 与 process_video 相同格式的处理结果
+    """
+    global _whisper_executor
+    
+    if limits is None:
+        limits = create_limits()
+    if progress is None:
+        progress = lambda stage, info: None
+    
+    # 每个任务使用独立的文件名，避免并发任务互相覆盖
+    job_id = uuid.uuid4().hex[:12]
+    
+    try:
+        if not os.path.exists(video_path):
+            raise Exception(f"视频文件不存在: {video_path}")
+        
+        total_start_time = time.time()
+        create_output_dirs()
+        
+        # 步骤1：提取音频
+        progress("extract", {"video": video_path})
+        async with limits["ffmpeg"]:
+            extract_start_time = time.time()
+            audio_result = await extract_audio_async(video_path, os.path.join("audio", f"audio_{job_id}.mp3"))
+            extract_time = time.time() - extract_start_time
+        if not audio_result:
+            raise Exception("音频提取失败，请检查视频文件是否完整或是否已安装FFmpeg")
+        
+        # 步骤2：语音识别
+        progress("transcribe", {"video": video_path, "audio": audio_result})
+        txt_name = f"output_{job_id}.txt"
+        if _whisper_executor is None:
+            _whisper_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="whisper")
+        async with limits["whisper"]:
+            transcription_result = await asyncio.get_running_loop().run_in_executor(
+                _whisper_executor,
+                partial(process_audio, audio_result, profile=profile, language=language, output_filename=txt_name,
+                        source=video_path, timestamps=timestamps)
+            )
+        if not transcription_result or "text" not in transcription_result:
+            raise Exception("语音识别失败，请检查音频文件是否正常")
+        txt_file = os.path.join("txt", txt_name)
+        run_info = transcription_result["run_info"]
+        run_info.update(file=os.path.basename(video_path), start_time=total_start_time)
+        run_info["stages"]["extract"] = extract_time
+        
+        # 步骤3：内容分析
+        if endpoints:
+            if not await asyncio.to_thread(initialize_pool, endpoints):
+                raise Exception("AI模型初始化失败，请检查端点配置")
+        else:
+            if not api_key:
+                api_key = os.getenv("ARK_API_KEY")
+                if not api_key:
+                    raise Exception("未提供API密钥，且环境变量ARK_API_KEY未设置")
+            if not base_url:
+                base_url = "https://ark.cn-beijing.volces.com/api/v3/"
+            if not await initialize_async_client(api_key, base_url):
+                raise Exception("AI模型初始化失败，请检查API密钥和Base URL是否正确")
+        
+        analysis_result = await process_transcription_async(
+            txt_file, model_name, resume=resume, semaphore=limits["llm"],
+            progress=lambda stage, info: progress(stage, dict(info, video=video_path)),
+            run_info=run_info
+        )
+        if not analysis_result:
+            raise Exception("内容分析失败，请检查API配置和文本内容")
+        
+        result = {
+            "status": "success",
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "video_path": video_path,
+            "audio_path": audio_result,
+            "transcription_path": txt_file,
+            "analysis_path": analysis_result,
+            "total_time": time.time() - total_start_time
+        }
+        progress("done", result)
+        return result
+        
+    except asyncio.CancelledError:
+        print(f"\n任务已取消: {video_path}")
+        raise
+    except Exception as e:
+        print(f"\n处理过程中出错: {str(e)}")
+        return {
+            "status": "error",
+            "error_message": str(e),
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }
+
+def main(profiling=False, resume=False, timestamps=False):
+    """主函数，profiling 为 True 时对各阶段做性能分析，结果保存到 profiles/<时间戳>/；
+    resume 为 True 时内容分析从上次中断的大模型请求处继续；timestamps 为 True 时转录输出句级时间戳"""
+    try:
+        print("\n=== AI视频分析系统 ===")
+        print("本系统将自动完成以下步骤：")
+        print("1. 从视频中提取音频 (需要安装FFmpeg)")
+        print("2. 使用Whisper模型进行语音识别")
+        print("3. 使用大模型进行内容分析和总结")
+        
+        # 检查FFmpeg是否已安装（结果缓存，extract_audio 不会重复检测）
+        if not check_ffmpeg():
+            print("\n错误：未检测到FFmpeg！")
+            print("请先安装FFmpeg并将其添加到系统环境变量中")
+            print("下载地址：https://ffmpeg.org/download.html")
+            return
+            
+        print("\n=== 环境检查 ===")
+        print("√ FFmpeg 已安装")
+        
+        print("\n请按照提示输入必要信息：")
+        
+        # 1. 获取视频文件路径
+        while True:
+            video_path = input("\n请输入视频文件路径（输入q退出）: ").strip()
+            if video_path.lower() == 'q':
+                print("程序已退出")
+                return
+            
+            if not os.path.exists(video_path):
+                print("错误：文件不存在，请重新输入")
+                continue
+                
+            if not video_path.lower().endswith(('.mp4', '.avi', '.mov', '.mkv', '.flv')):
+                print("警告：不支持的视频格式，支持的格式：mp4, avi, mov, mkv, flv")
+                if input("是否继续？(y/n): ").lower() != 'y':
+                    continue
+            break
+        
+        # 2. 获取API配置
+        print("\n=== API配置 ===")
+        api_key = os.getenv("ARK_API_KEY")
+        if api_key:
+            print("检测到环境变量ARK_API_KEY")
+            use_env = input("是否使用环境变量中的API密钥？(y/n): ").lower() == 'y'
+            if not use_env:
+                api_key = input("请输入火山大模型API密钥: ").strip()
+        else:
+            print("未检测到环境变量ARK_API_KEY")
+            api_key = input("请输入火山大模型API密钥: ").strip()
+            if not api_key:
+                print("错误：未提供API密钥")
+                return
+        
+        base_url = input("\n请输入火山大模型Base URL（直接回车使用默认值）: ").strip() or None
+        
+        # 3. 确认信息
+        print("\n=== 处理信息确认 ===")
+        print(f"视频文件: {video_path}")
+        print(f"文件大小: {os.path.getsize(video_path) / (1024*1024):.2f} MB")
+        print(f"API密钥: {'环境变量' if use_env else '手动输入'}")
+        print(f"Base URL: {base_url or '默认值'}")
+        print(f"断点续传: {'是' if resume else '否'}")
+        print(f"句级时间戳: {'是' if timestamps else '否'}")
+        
+        if input("\n确认开始处理？(y/n): ").lower() != 'y':
+            print("已取消处理")
+            return
+        
+        # 4. 处理视频
+        profile_dir = os.path.join("profiles", datetime.now().strftime("%Y%m%d_%H%M%S")) if profiling else None
+        result = process_video(video_path, api_key, base_url, resume=resume, profile_dir=profile_dir, timestamps=timestamps)
+        
+        # 5. 输出处理状态
+        if result["status"] == "success":
+            print("\n=== 视频处理成功完成！===")
+            print(f"总耗时: {result['total_time']:.2f} 秒")
+            print("\n生成的文件：")
+            print(f"- 音频文件: {os.path.basename(result['audio_path'])}")
+            print(f"- 转录文本: {os.path.basename(result['transcription_path'])}")
+            print(f"- 分析报告: {os.path.basename(result['analysis_path'])}")
+            if profile_dir:
+                print(f"- 性能分析: {profile_dir}")
+            
+            # 询问是否打开生成的文件
+            print("\n是否打开生成的文件？")
+            if input("1. 打开分析报告 (y/n): ").lower() == 'y':
+                os.system(f"start {result['analysis_path']}")
+            if input("2. 打开转录文本 (y/n): ").lower() == 'y':
+                os.system(f"start {result['transcription_path']}")
+        else:
+            print(f"\n处理失败: {result['error_message']}")
+            print("请检查错误信息并重试")
+            
+    except KeyboardInterrupt:
+        print("\n\n程序已被用户中断")
+    except Exception as e:
+        print(f"\n程序运行出错: {str(e)}")
+    finally:
+        print("\n程序结束")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="AI视频分析系统")
+    parser.add_argument("--profiling", action="store_true", help="对各阶段做性能分析并输出火焰图数据")
+    parser.add_argument("--resume", action="store_true", help="从上次中断的大模型请求处继续（使用已保存的检查点）")
+    parser.add_argument("--timestamps", action="store_true", help="转录时输出句级时间戳，检索结果可定位到视频中的时间")
+    args = parser.parse_args(sys.argv[1:])
+    main(args.profiling, args.resume, args.timestamps) 
\ No newline at end of file
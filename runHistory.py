@@ -0,0 +1,292 @@
+import os
+import sys
+import time
+import sqlite3
+import argparse
+from datetime import datetime
+
+
+## 运行历史（SQLite）
+## 每次处理完成后记录一行：各阶段耗时、token 数、音频时长、RTF、模型和检查点命中数，
+## 用于容量规划和发现配置变更后的性能退化。
+## 用法:
+## python runHistory.py list
+## python runHistory.py stages --days 30
+## python runHistory.py cost --days 30
+## python runHistory.py regressions --threshold 0.2
+## python runHistory.py latency
+
+DB_PATH = os.path.join("stats", "history.db")
+PERCENTILES = (50, 90, 95, 99)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at REAL NOT NULL,
+    file TEXT,
+    llm_model TEXT,
+    asr_engine TEXT,
+    asr_model TEXT,
+    assistant_model TEXT,
+    decoding_profile TEXT,
+    audio_duration REAL,
+    rtf REAL,
+    text_chars INTEGER,
+    chunks INTEGER,
+    input_tokens INTEGER,
+    output_tokens INTEGER,
+    llm_requests INTEGER,
+    cache_hits INTEGER,
+    total_time REAL
+);
+CREATE TABLE IF NOT EXISTS stages (
+    run_id INTEGER NOT NULL REFERENCES runs (id),
+    stage TEXT NOT NULL,
+    seconds REAL NOT NULL,
+    input_tokens INTEGER,
+    output_tokens INTEGER,
+    PRIMARY KEY (run_id, stage)
+);
+CREATE TABLE IF NOT EXISTS call_latency (
+    run_id INTEGER NOT NULL REFERENCES runs (id),
+    call_type TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    p50 REAL,
+    p95 REAL,
+    p99 REAL,
+    PRIMARY KEY (run_id, call_type)
+);
+CREATE INDEX IF NOT EXISTS idx_runs_created ON runs (created_at);
+"""
+
+def connect(db_path=DB_PATH):
+    """打开历史数据库（不存在时创建）"""
+    db_dir = os.path.dirname(db_path)
+    if db_dir:
+        os.makedirs(db_dir, exist_ok=True)
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+def record_run(stats, db_path=DB_PATH):
+    """
+    记录一次运行，返回记录编号
+
+    stats 为 getConclusion.finish_transcription 生成的统计信息；
+    stats["run"] 为语音识别阶段的信息（音频时长、引擎、模型、extract/transcribe 耗时等），可省略；
+    stats["latency"] 为运行结束时各类大模型请求的耗时百分位，可省略
+    """
+    run = stats.get("run") or {}
+    tokens = stats["tokens"]
+    stage_seconds = dict(run.get("stages") or {})
+    for stage in ("read", "split", "mindmap", "analysis"):
+        stage_seconds[stage] = stats["timing"][stage]
+
+    audio_duration = run.get("audio_duration")
+    transcribe_time = stage_seconds.get("transcribe")
+    rtf = transcribe_time / audio_duration if audio_duration and transcribe_time else None
+    # 从视频处理开始计时，未提供时只统计内容分析阶段
+    total_time = time.time() - run["start_time"] if run.get("start_time") else stats["timing"]["total"]
+
+    conn = connect(db_path)
+    try:
+        with conn:
+            cursor = conn.execute(
+                """
+                INSERT INTO runs (created_at, file, llm_model, asr_engine, asr_model, assistant_model, decoding_profile,
+                                  audio_duration, rtf, text_chars, chunks, input_tokens, output_tokens,
+                                  llm_requests, cache_hits, total_time)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    time.time(), run.get("file", stats["file_info"]["name"]), stats.get("model"),
+                    run.get("asr_engine"), run.get("asr_model"), run.get("assistant_model"), run.get("decoding_profile"),
+                    audio_duration, rtf, stats["file_info"]["size"], stats["file_info"]["chunks"],
+                    tokens["total"]["input"], tokens["total"]["output"],
+                    stats.get("requests"), stats.get("cache_hits"), total_time
+                )
+            )
+            run_id = cursor.lastrowid
+            conn.executemany(
+                "INSERT INTO stages (run_id, stage, seconds, input_tokens, output_tokens) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (run_id, stage, seconds,
+                     tokens.get(stage, {}).get("input"), tokens.get(stage, {}).get("output"))
+                    for stage, seconds in stage_seconds.items() if seconds is not None
+                ]
+            )
+            conn.executemany(
+                "INSERT INTO call_latency (run_id, call_type, count, p50, p95, p99) VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (run_id, call_type, values["count"], values["p50"], values["p95"], values["p99"])
+                    for call_type, values in (stats.get("latency") or {}).items()
+                ]
+            )
+        return run_id
+    finally:
+        conn.close()
+
+def percentile(values, q):
+    """线性插值百分位数，values 需已排序"""
+    if not values:
+        return None
+    position = (len(values) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+def stage_percentiles(conn, since, until=None):
+    """统计时间范围内各阶段耗时分布，返回 {stage: {"count", "p50", ..., "max"}}"""
+    rows = conn.execute(
+        """
+        SELECT s.stage, s.seconds FROM stages s JOIN runs r ON r.id = s.run_id
+        WHERE r.created_at >= ? AND r.created_at < ?
+        ORDER BY s.stage, s.seconds
+        """,
+        (since, until or time.time() + 1)
+    ).fetchall()
+    values = {}
+    for row in rows:
+        values.setdefault(row["stage"], []).append(row["seconds"])
+    report = {}
+    for stage, seconds in values.items():
+        report[stage] = {"count": len(seconds), "max": seconds[-1]}
+        for q in PERCENTILES:
+            report[stage][f"p{q}"] = percentile(seconds, q)
+    return report
+
+def cost_summary(conn, since, until=None):
+    """按模型组合统计每分钟音频的 token 数和平均 RTF"""
+    return conn.execute(
+        """
+        SELECT llm_model, asr_engine, asr_model, COUNT(*) AS runs,
+               SUM(audio_duration) / 60.0 AS audio_minutes,
+               SUM(input_tokens) AS input_tokens, SUM(output_tokens) AS output_tokens,
+               SUM(input_tokens) / (SUM(audio_duration) / 60.0) AS input_per_minute,
+               SUM(output_tokens) / (SUM(audio_duration) / 60.0) AS output_per_minute,
+               AVG(rtf) AS rtf,
+               SUM(cache_hits) * 1.0 / NULLIF(SUM(llm_requests), 0) AS cache_hit_rate
+        FROM runs
+        WHERE created_at >= ? AND created_at < ?
+        GROUP BY llm_model, asr_engine, asr_model
+        ORDER BY runs DESC
+        """,
+        (since, until or time.time() + 1)
+    ).fetchall()
+
+def find_regressions(conn, threshold=0.2, now=None):
+    """
+    对比最近 7 天与之前 7 天的各阶段中位耗时和单位成本，返回上升超过 threshold 的指标
+
+    返回 [(指标, 上周值, 本周值, 变化比例)]
+    """
+    now = now or time.time()
+    week = 7 * 24 * 3600
+    current = stage_percentiles(conn, now - week, now + 1)
+    previous = stage_percentiles(conn, now - 2 * week, now - week)
+    metrics = []
+    for stage in sorted(set(current) & set(previous)):
+        metrics.append((f"{stage} p50 (秒)", previous[stage]["p50"], current[stage]["p50"]))
+        metrics.append((f"{stage} p95 (秒)", previous[stage]["p95"], current[stage]["p95"]))
+
+    def unit_costs(since, until):
+        return conn.execute(
+            """
+            SELECT AVG(rtf) AS rtf,
+                   SUM(input_tokens + output_tokens) / (SUM(audio_duration) / 60.0) AS tokens_per_minute
+            FROM runs WHERE created_at >= ? AND created_at < ?
+            """,
+            (since, until)
+        ).fetchone()
+
+    current_costs = unit_costs(now - week, now + 1)
+    previous_costs = unit_costs(now - 2 * week, now - week)
+    metrics.append(("RTF", previous_costs["rtf"], current_costs["rtf"]))
+    metrics.append(("tokens/音频分钟", previous_costs["tokens_per_minute"], current_costs["tokens_per_minute"]))
+
+    return [
+        (name, before, after, after / before - 1)
+        for name, before, after in metrics
+        if before and after is not None and after / before - 1 > threshold
+    ]
+
+def _format_value(value, digits=2):
+    return "-" if value is None else f"{value:.{digits}f}"
+
+def main(argv=None):
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="运行历史统计")
+    parser.add_argument("--db", default=DB_PATH, help="历史数据库路径")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    listing = commands.add_parser("list", help="列出最近的运行")
+    listing.add_argument("--limit", type=int, default=20)
+
+    stages = commands.add_parser("stages", help="各阶段耗时百分位")
+    stages.add_argument("--days", type=float, default=30, help="统计最近多少天")
+
+    cost = commands.add_parser("cost", help="每分钟音频的 token 数和 RTF")
+    cost.add_argument("--days", type=float, default=30, help="统计最近多少天")
+
+    regressions = commands.add_parser("regressions", help="与上周相比的性能退化")
+    regressions.add_argument("--threshold", type=float, default=0.2, help="上升比例阈值")
+
+    latency = commands.add_parser("latency", help="各次运行结束时的大模型请求耗时百分位")
+    latency.add_argument("--limit", type=int, default=20)
+
+    args = parser.parse_args(argv)
+    conn = connect(args.db)
+    since = time.time() - getattr(args, "days", 0) * 24 * 3600
+
+    if args.command == "list":
+        rows = conn.execute("SELECT * FROM runs ORDER BY id DESC LIMIT ?", (args.limit,)).fetchall()
+        print(f"{'ID':>5}  {'时间':<19}  {'音频(秒)':>8} {'RTF':>6} {'总耗时':>8} {'输入':>8} {'输出':>7} {'命中':>5}  模型 / 文件")
+        for row in rows:
+            print(f"{row['id']:>5}  {datetime.fromtimestamp(row['created_at']).strftime('%Y-%m-%d %H:%M:%S')}  "
+                  f"{_format_value(row['audio_duration'], 0):>8} {_format_value(row['rtf']):>6} {_format_value(row['total_time'], 1):>8} "
+                  f"{row['input_tokens']:>8} {row['output_tokens']:>7} {row['cache_hits'] or 0:>2}/{row['llm_requests'] or 0:<2}  "
+                  f"{row['llm_model']} / {row['asr_engine'] or '-'}:{row['asr_model'] or '-'} / {row['file']}")
+
+    elif args.command == "stages":
+        report = stage_percentiles(conn, since)
+        header = "".join(f"{f'p{q}':>9}" for q in PERCENTILES)
+        print(f"{'阶段':<12}{'次数':>6}{header}{'max':>9}")
+        for stage, values in sorted(report.items()):
+            cells = "".join(f"{_format_value(values[f'p{q}']):>9}" for q in PERCENTILES)
+            print(f"{stage:<12}{values['count']:>6}{cells}{_format_value(values['max']):>9}")
+
+    elif args.command == "cost":
+        for row in cost_summary(conn, since):
+            print(f"\n{row['llm_model']} + {row['asr_engine'] or '-'}:{row['asr_model'] or '-'}（{row['runs']} 次运行）")
+            print(f"- 音频总时长: {_format_value(row['audio_minutes'], 1)} 分钟")
+            print(f"- 每分钟音频 tokens: 输入 {_format_value(row['input_per_minute'], 0)} / 输出 {_format_value(row['output_per_minute'], 0)}")
+            print(f"- 平均 RTF: {_format_value(row['rtf'], 3)}")
+            print(f"- 检查点命中率: {_format_value((row['cache_hit_rate'] or 0) * 100, 1)}%")
+
+    elif args.command == "regressions":
+        found = find_regressions(conn, args.threshold)
+        if not found:
+            print(f"与上周相比没有上升超过 {args.threshold:.0%} 的指标")
+        for name, before, after, change in found:
+            print(f"- {name}: {_format_value(before)} -> {_format_value(after)} (+{change:.0%})")
+
+    elif args.command == "latency":
+        rows = conn.execute(
+            """
+            SELECT l.*, r.created_at, r.llm_model FROM call_latency l JOIN runs r ON r.id = l.run_id
+            WHERE l.run_id IN (SELECT id FROM runs ORDER BY id DESC LIMIT ?)
+            ORDER BY l.run_id DESC, l.call_type
+            """,
+            (args.limit,)
+        ).fetchall()
+        print(f"{'运行':>5}  {'类型':<10}{'次数':>6}{'p50':>9}{'p95':>9}{'p99':>9}  模型")
+        for row in rows:
+            print(f"{row['run_id']:>5}  {row['call_type']:<10}{row['count']:>6}{_format_value(row['p50']):>9}"
+                  f"{_format_value(row['p95']):>9}{_format_value(row['p99']):>9}  {row['llm_model']}")
+
+    conn.close()
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,271 @@
+import os
+import re
+import sys
+import time
+import sqlite3
+import argparse
+
+
+## 转录文本和分析报告的全文检索（SQLite FTS5）
+## save_transcription / save_to_markdown 写入文件后立即索引该文件；
+## update 命令增量扫描 txt/ 和 notes/，只重新索引新增或修改过的文件，并移除已删除的文件。
+## 中日韩文字逐字切分后写入 FTS5，查询词按短语匹配，任意长度的中文词都能命中。
+## 用法:
+## python searchIndex.py search 人工智能 大模型 --kind txt
+## python searchIndex.py update
+
+DB_PATH = os.path.join("index", "search.db")
+SOURCE_DIRS = {"txt": ("txt", ".txt"), "notes": ("notes", ".md")}
+SEGMENT_CHARS = 200   # 纯文本分段的目标长度（字符）
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    path TEXT NOT NULL UNIQUE,
+    kind TEXT NOT NULL,
+    source TEXT,
+    mtime REAL NOT NULL,
+    indexed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS segments (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    document_id INTEGER NOT NULL REFERENCES documents (id),
+    position INTEGER NOT NULL,
+    start REAL,
+    end REAL,
+    heading TEXT,
+    text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_segments_document ON segments (document_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS segments_fts USING fts5(tokens, tokenize = 'unicode61');
+"""
+
+# 中日韩文字（逐字切分）
+CJK_RE = re.compile(r"([぀-ヿ㐀-䶿一-鿿가-힯豈-﫿])")
+SENTENCE_RE = re.compile(r"(?<=[。！？!?\n])")
+
+def tokenize(text):
+    """在中日韩文字两侧加空格，使 unicode61 分词器按字切分"""
+    return CJK_RE.sub(r" \1 ", text)
+
+def connect(db_path=DB_PATH):
+    """打开索引数据库（不存在时创建）"""
+    db_dir = os.path.dirname(db_path)
+    if db_dir:
+        os.makedirs(db_dir, exist_ok=True)
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    # 旧版本创建的索引没有 source 列
+    columns = {row["name"] for row in conn.execute("PRAGMA table_info(documents)")}
+    if "source" not in columns:
+        conn.execute("ALTER TABLE documents ADD COLUMN source TEXT")
+        conn.commit()
+    return conn
+
+def split_text_segments(text, segment_chars=SEGMENT_CHARS):
+    """将纯文本按句子拼成约 segment_chars 字的分段"""
+    segments = []
+    current = ""
+    for sentence in SENTENCE_RE.split(text):
+        if current and len(current) + len(sentence) > segment_chars:
+            segments.append({"text": current.strip()})
+            current = ""
+        current += sentence
+    if current.strip():
+        segments.append({"text": current.strip()})
+    return [segment for segment in segments if segment["text"]]
+
+def split_markdown_segments(text, segment_chars=SEGMENT_CHARS):
+    """按标题和段落切分 Markdown，每段记录所属标题"""
+    segments = []
+    heading = None
+    for block in re.split(r"\n\s*\n", text):
+        block = block.strip()
+        if not block:
+            continue
+        lines = block.splitlines()
+        if lines[0].startswith("#"):
+            heading = lines[0].lstrip("#").strip()
+            block = "\n".join(lines[1:]).strip()
+            if not block:
+                continue
+        for segment in split_text_segments(block, segment_chars):
+            segment["heading"] = heading
+            segments.append(segment)
+    return segments
+
+def _guess_kind(path):
+    return "notes" if path.endswith(".md") else "txt"
+
+def index_file(path, kind=None, segments=None, source=None, db_path=DB_PATH):
+    """
+    索引（或重新索引）一个文件，返回分段数；出错时只打印提示，不影响调用方
+
+    参数:
+        kind (str): "txt" 或 "notes"，默认按扩展名判断
+        segments (list): 带时间区间的分段 [{"start", "end", "text"}]，不提供时按文本自动分段
+        source (str): 来源视频/音频路径，不提供时保留该文件之前记录的来源
+    """
+    try:
+        path = os.path.abspath(path)
+        kind = kind or _guess_kind(path)
+        if not segments:
+            with open(path, "r", encoding="utf-8") as f:
+                text = f.read()
+            segments = split_markdown_segments(text) if kind == "notes" else split_text_segments(text)
+
+        conn = connect(db_path)
+        try:
+            with conn:
+                if source is None:
+                    row = conn.execute("SELECT source FROM documents WHERE path = ?", (path,)).fetchone()
+                    source = row["source"] if row else None
+                else:
+                    source = os.path.abspath(source)
+                _remove_document(conn, path)
+                document_id = conn.execute(
+                    "INSERT INTO documents (path, kind, source, mtime, indexed_at) VALUES (?, ?, ?, ?, ?)",
+                    (path, kind, source, os.path.getmtime(path), time.time())
+                ).lastrowid
+                for position, segment in enumerate(segments):
+                    if not segment["text"]:
+                        continue
+                    segment_id = conn.execute(
+                        "INSERT INTO segments (document_id, position, start, end, heading, text) VALUES (?, ?, ?, ?, ?, ?)",
+                        (document_id, position, segment.get("start"), segment.get("end"), segment.get("heading"), segment["text"])
+                    ).lastrowid
+                    conn.execute("INSERT INTO segments_fts (rowid, tokens) VALUES (?, ?)", (segment_id, tokenize(segment["text"])))
+        finally:
+            conn.close()
+        return len(segments)
+    except Exception as e:
+        print(f"更新检索索引失败: {e}")
+        return 0
+
+def _remove_document(conn, path):
+    """删除文件的全部分段"""
+    row = conn.execute("SELECT id FROM documents WHERE path = ?", (path,)).fetchone()
+    if row is None:
+        return
+    conn.execute("DELETE FROM segments_fts WHERE rowid IN (SELECT id FROM segments WHERE document_id = ?)", (row["id"],))
+    conn.execute("DELETE FROM segments WHERE document_id = ?", (row["id"],))
+    conn.execute("DELETE FROM documents WHERE id = ?", (row["id"],))
+
+def update_index(db_path=DB_PATH, source_dirs=SOURCE_DIRS):
+    """增量更新：索引新增或修改过的文件，移除已删除的文件，返回 (更新数, 删除数)"""
+    conn = connect(db_path)
+    try:
+        indexed = {row["path"]: row["mtime"] for row in conn.execute("SELECT path, mtime FROM documents")}
+    finally:
+        conn.close()
+
+    seen = set()
+    updated = 0
+    for kind, (directory, extension) in source_dirs.items():
+        if not os.path.isdir(directory):
+            continue
+        for name in os.listdir(directory):
+            if not name.endswith(extension):
+                continue
+            path = os.path.abspath(os.path.join(directory, name))
+            seen.add(path)
+            if indexed.get(path) != os.path.getmtime(path):
+                index_file(path, kind, db_path=db_path)
+                updated += 1
+
+    removed = [path for path in indexed if path not in seen and not os.path.exists(path)]
+    if removed:
+        conn = connect(db_path)
+        try:
+            with conn:
+                for path in removed:
+                    _remove_document(conn, path)
+        finally:
+            conn.close()
+    return updated, len(removed)
+
+def build_query(query):
+    """将查询词转换为 FTS5 表达式：每个词作为短语匹配，多个词同时出现"""
+    phrases = []
+    for term in query.split():
+        tokens = tokenize(term).split()
+        if tokens:
+            phrases.append('"' + " ".join(tokens).replace('"', '""') + '"')
+    return " AND ".join(phrases)
+
+def search(query, kind=None, limit=20, db_path=DB_PATH):
+    """检索分段，按相关度排序，返回 [{"path", "kind", "source", "start", "end", "heading", "text"}]"""
+    expression = build_query(query)
+    if not expression:
+        return []
+    sql = """
+        SELECT d.path, d.kind, d.source, s.start, s.end, s.heading, s.text
+        FROM segments_fts f
+        JOIN segments s ON s.id = f.rowid
+        JOIN documents d ON d.id = s.document_id
+        WHERE segments_fts MATCH ?
+    """
+    params = [expression]
+    if kind:
+        sql += " AND d.kind = ?"
+        params.append(kind)
+    sql += " ORDER BY bm25(segments_fts) LIMIT ?"
+    params.append(limit)
+
+    conn = connect(db_path)
+    try:
+        return [dict(row) for row in conn.execute(sql, params)]
+    finally:
+        conn.close()
+
+def _format_time(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600:d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+def highlight(text, query):
+    """用【】标出查询词"""
+    for term in query.split():
+        text = re.sub(re.escape(term), lambda match: f"【{match.group(0)}】", text, flags=re.IGNORECASE)
+    return text
+
+def main(argv=None):
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="检索转录文本和分析报告")
+    parser.add_argument("--db", default=DB_PATH, help="索引数据库路径")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    find = commands.add_parser("search", help="检索")
+    find.add_argument("query", nargs="+", help="查询词，多个词需同时出现")
+    find.add_argument("--kind", choices=list(SOURCE_DIRS), help="只检索转录文本或分析报告")
+    find.add_argument("--limit", type=int, default=20)
+
+    commands.add_parser("update", help="增量更新索引（txt/ 和 notes/）")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "search":
+        query = " ".join(args.query)
+        start_time = time.perf_counter()
+        results = search(query, args.kind, args.limit, args.db)
+        elapsed_ms = (time.perf_counter() - start_time) * 1000
+        for result in results:
+            location = os.path.relpath(result["path"])
+            if result["start"] is not None:
+                location += f" [{_format_time(result['start'])} - {_format_time(result['end'])}]"
+            if result["heading"]:
+                location += f" # {result['heading']}"
+            print(f"\n{location}")
+            if result["source"]:
+                print(f"  来源: {result['source']}")
+            print(f"  {highlight(result['text'], query)}")
+        print(f"\n共 {len(results)} 条结果，耗时 {elapsed_ms:.1f} 毫秒")
+
+    elif args.command == "update":
+        start_time = time.time()
+        updated, removed = update_index(args.db)
+        print(f"已索引 {updated} 个文件，移除 {removed} 个文件，耗时 {time.time() - start_time:.2f} 秒")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,151 @@
+import os
+import sys
+import time
+import threading
+from contextlib import contextmanager, nullcontext
+
+
+## 分阶段性能分析
+## 用法:
+## with profile_stage("transcribe", "profiles/job1", torch_ops=True):
+##     process_audio(...)
+## 输出（均在 output_dir 下）:
+## - <stage>.collapsed: 采样得到的调用栈（collapsed stack 格式，可用 flamegraph.pl 或 speedscope 打开）
+## - <stage>_summary.txt: 最热点函数（自身/累计占比）
+## - <stage>_torch.collapsed / <stage>_torch.json: torch_ops 为 True 时的 PyTorch 算子调用栈和 chrome://tracing 时间线
+##   （只记录 TORCH_ACTIVE_STEPS 个批次，见 profiler_step，长音频的算子记录和追踪文件不会无限增长）
+## 只采样进入阶段的线程；FFmpeg、分片子进程等外部进程的耗时体现为等待子进程的调用栈
+
+SAMPLE_INTERVAL_S = 0.005   # 采样间隔（秒）
+TOP_N = 15                  # 摘要中列出的热点函数数
+
+# PyTorch 算子分析的记录窗口（每个批次开始时调用 profiler_step 进入下一步）：
+# 跳过阶段开始到第一个批次之间（含模型加载），第一个批次用于预热，只记录之后的 TORCH_ACTIVE_STEPS 个批次
+TORCH_WAIT_STEPS = 1
+TORCH_WARMUP_STEPS = 1
+TORCH_ACTIVE_STEPS = 2
+
+# 当前阶段正在运行的 PyTorch 分析器
+_torch_profiler_active = None
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+def _collapse(frame):
+    """将调用栈转换为 collapsed stack 格式（从根到叶，分号分隔）"""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+def write_summary(stage, stacks, elapsed, path, top_n=TOP_N):
+    """根据采样栈统计热点函数，写入摘要文件并返回摘要文本"""
+    total = sum(stacks.values())
+    self_counts = {}
+    inclusive_counts = {}
+    for stack, count in stacks.items():
+        frames = stack.split(";")
+        self_counts[frames[-1]] = self_counts.get(frames[-1], 0) + count
+        for label in set(frames):  # 递归调用只计一次
+            inclusive_counts[label] = inclusive_counts.get(label, 0) + count
+
+    lines = [f"=== {stage} ===", f"耗时: {elapsed:.2f} 秒，采样: {total} 次", ""]
+    if total:
+        lines.append("自身耗时最多的函数:")
+        for label, count in sorted(self_counts.items(), key=lambda item: -item[1])[:top_n]:
+            lines.append(f"  {count / total:6.1%}  {elapsed * count / total:8.2f}s  {label}")
+        lines.append("")
+        lines.append("累计耗时最多的函数:")
+        for label, count in sorted(inclusive_counts.items(), key=lambda item: -item[1])[:top_n]:
+            lines.append(f"  {count / total:6.1%}  {elapsed * count / total:8.2f}s  {label}")
+    summary = "\n".join(lines) + "\n"
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(summary)
+    return summary
+
+def profiler_step():
+    """标记一个批次开始（由语音识别模型的前向钩子调用），推进 PyTorch 分析器的记录窗口；未在分析时不做任何事"""
+    if _torch_profiler_active is not None:
+        _torch_profiler_active.step()
+
+def _torch_profiler(traces):
+    """创建 PyTorch 算子级分析器（只在记录窗口内记录），记录完成时向 traces 追加分析器；未安装 torch 时返回 None"""
+    try:
+        import torch
+        from torch.profiler import profile, schedule, ProfilerActivity
+    except ImportError:
+        print("未安装 torch，跳过 PyTorch 算子分析")
+        return None
+    activities = [ProfilerActivity.CPU]
+    if torch.cuda.is_available():
+        activities.append(ProfilerActivity.CUDA)
+    return profile(
+        activities=activities,
+        schedule=schedule(wait=TORCH_WAIT_STEPS, warmup=TORCH_WARMUP_STEPS, active=TORCH_ACTIVE_STEPS, repeat=1),
+        on_trace_ready=traces.append,
+        with_stack=True
+    )
+
+@contextmanager
+def profile_stage(stage, output_dir, torch_ops=False, interval=SAMPLE_INTERVAL_S):
+    """
+    对一个处理阶段做采样分析，output_dir 为 None 时不做任何事
+
+    参数:
+        torch_ops (bool): 同时使用 PyTorch profiler 记录算子耗时（用于转录阶段）
+    """
+    if output_dir is None:
+        yield
+        return
+    os.makedirs(output_dir, exist_ok=True)
+
+    target = threading.get_ident()
+    stacks = {}
+    stop = threading.Event()
+
+    def sample():
+        while not stop.wait(interval):
+            frame = sys._current_frames().get(target)
+            if frame is not None:
+                stack = _collapse(frame)
+                stacks[stack] = stacks.get(stack, 0) + 1
+
+    global _torch_profiler_active
+    torch_traces = []
+    torch_profiler = _torch_profiler(torch_traces) if torch_ops else None
+    sampler = threading.Thread(target=sample, daemon=True)
+    start_time = time.time()
+    sampler.start()
+    try:
+        with torch_profiler or nullcontext():
+            _torch_profiler_active = torch_profiler
+            try:
+                yield
+            finally:
+                _torch_profiler_active = None
+    finally:
+        stop.set()
+        sampler.join()
+        elapsed = time.time() - start_time
+
+        with open(os.path.join(output_dir, f"{stage}.collapsed"), "w", encoding="utf-8") as f:
+            for stack, count in stacks.items():
+                f.write(f"{stack} {count}\n")
+        summary = write_summary(stage, stacks, elapsed, os.path.join(output_dir, f"{stage}_summary.txt"))
+
+        if torch_profiler is not None and not torch_traces:
+            print("阶段在 PyTorch 记录窗口开始前就结束了（批次太少），未记录算子")
+        elif torch_profiler is not None:
+            try:
+                torch_profiler.export_stacks(os.path.join(output_dir, f"{stage}_torch.collapsed"), "self_cpu_time_total")
+                torch_profiler.export_chrome_trace(os.path.join(output_dir, f"{stage}_torch.json"))
+                table = torch_profiler.key_averages().table(sort_by="self_cpu_time_total", row_limit=TOP_N)
+                with open(os.path.join(output_dir, f"{stage}_summary.txt"), "a", encoding="utf-8") as f:
+                    f.write("\nPyTorch 算子（按自身 CPU 耗时）:\n" + table + "\n")
+            except Exception as e:
+                print(f"导出 PyTorch 分析结果失败: {e}")
+
+        print(f"\n性能分析 ({stage}) 已保存到: {output_dir}")
+        print(summary)
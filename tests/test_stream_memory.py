@@ -0,0 +1,67 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+for module_name in ("torch", "transformers", "librosa", "huggingface_hub"):
+    pytest.importorskip(module_name)
+
+import hugWhisper
+from memoryMonitor import get_rss_mb, track_memory
+
+SAMPLE_RATE = hugWhisper.SHARD_SAMPLE_RATE
+BLOCK_S = 10
+TOLERANCE_MB = 20
+
+
+class NullEngine(hugWhisper.ASREngine):
+    """只消费窗口、不加载模型的引擎，测量的是流式路径本身的内存占用"""
+    name = "null"
+
+    def load(self):
+        return True
+
+    def transcribe(self, inputs, generate_kwargs=None, batch_size=None, return_timestamps=False):
+        return ({"text": "", "chunks": []} for _ in inputs)
+
+    def unload(self):
+        pass
+
+
+def synthetic_blocks(duration_s):
+    """产出 duration_s 秒的合成噪声音频块"""
+    rng = np.random.default_rng(0)
+    block = BLOCK_S * SAMPLE_RATE
+    for _ in range(duration_s // BLOCK_S):
+        yield (rng.standard_normal(block) * 0.01).astype(np.float32)
+
+
+@pytest.fixture
+def null_engine(monkeypatch):
+    monkeypatch.setattr(hugWhisper, "engine", NullEngine())
+
+
+def _stream_peak_growth(duration_s):
+    """流式转录 duration_s 秒合成音频，返回 (峰值内存增长 MB, 转录结果)"""
+    stats = {}
+    with track_memory("stream", stats, interval=0.01):
+        result = hugWhisper.transcribe_stream(synthetic_blocks(duration_s), SAMPLE_RATE)
+    record = stats["stream"]
+    return record["peak_mb"] - record["start_mb"], result
+
+
+@pytest.mark.skipif(get_rss_mb() is None, reason="无法获取进程内存")
+def test_stream_peak_memory_independent_of_duration(null_engine):
+    durations_s = (600, 3600)
+    growth = {}
+    for duration_s in durations_s:
+        growth[duration_s], result = _stream_peak_growth(duration_s)
+        assert result["duration"] == pytest.approx(duration_s)
+
+    # 两种时长的峰值增长基本相同，且远小于最长音频整段解码后的大小
+    full_pcm_mb = max(durations_s) * SAMPLE_RATE * 4 / (1024 * 1024)
+    assert max(growth.values()) - min(growth.values()) <= TOLERANCE_MB
+    assert max(growth.values()) < full_pcm_mb / 4